@@ -0,0 +1,60 @@
+"""
+Microbenchmark: parsing the DEPS column with deps_codec.parse_deps vs. ast.literal_eval.
+
+Usage (from data-scripts):
+    python benchmarks/deps_codec_benchmark.py [conllu_file] [--repeat N]
+Defaults to the English parser training data.
+"""
+
+import argparse
+import ast
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from deps_codec import parse_deps  # noqa: E402
+
+
+def read_deps_cells(conllu_file):
+    cells = []
+    with open(conllu_file, encoding="utf-8") as f:
+        for line in f:
+            columns = line.rstrip("\r\n").split("\t")
+            if len(columns) > 8:
+                cells.append(columns[8])
+    return cells
+
+
+def parse_with_literal_eval(cells):
+    return [ast.literal_eval(cell) if cell != "_" else [] for cell in cells]
+
+
+def parse_with_codec(cells):
+    return [parse_deps(cell) for cell in cells]
+
+
+if __name__ == "__main__":
+    default_file = os.path.normpath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "English", "Parser", "train.conllu"
+    ))
+    arg_parser = argparse.ArgumentParser(description="""Times DEPS parsing with ast.literal_eval and deps_codec.""")
+    arg_parser.add_argument("conllu_file", nargs="?", default=default_file, help="""CoNLL-U file.""")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="""Number of timed runs (best is reported).""")
+    args = arg_parser.parse_args()
+
+    cells = read_deps_cells(args.conllu_file)
+    assert parse_with_codec(cells) == [
+        [(int(head), label) for head, label in edges] for edges in parse_with_literal_eval(cells)
+    ]
+    filled = [cell for cell in cells if cell != "_"]
+    print(f"{args.conllu_file}: {len(cells)} DEPS cells, {len(filled)} with additional edges")
+    for subset, subset_cells in (("all cells", cells), ("filled cells", filled)):
+        results = {}
+        for name, parse in (("ast.literal_eval", parse_with_literal_eval), ("deps_codec", parse_with_codec)):
+            results[name] = min(timeit.repeat(lambda: parse(subset_cells), number=1, repeat=args.repeat))
+        print(
+            f"{subset:<13} ast.literal_eval {results['ast.literal_eval'] * 1000:7.2f} ms   "
+            f"deps_codec {results['deps_codec'] * 1000:7.2f} ms   "
+            f"speedup {results['ast.literal_eval'] / results['deps_codec']:5.1f}x"
+        )
@@ -0,0 +1,79 @@
+"""
+Benchmark: graph store (graph_store.py) vs. pickling a list of RecipeGraphs: file size, writing,
+opening the file and loading single graphs.
+
+Usage (from data-scripts):
+    python benchmarks/graph_store_benchmark.py [conllu_file] [--copies N] [--repeat N]
+Defaults to the English parser training data; --copies writes every recipe N times to simulate larger stores.
+"""
+
+import argparse
+import os
+import pickle
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_store import GraphStore, write_graph_store  # noqa: E402
+from recipe_graph import iter_graphs_from_conllu  # noqa: E402
+
+
+def write_pickle(path, graphs):
+    with open(path, "wb") as o:
+        pickle.dump(graphs, o, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+if __name__ == "__main__":
+    default_file = os.path.normpath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "English", "Parser", "train.conllu"
+    ))
+    arg_parser = argparse.ArgumentParser(description="""Compares the graph store with pickle.""")
+    arg_parser.add_argument("conllu_file", nargs="?", default=default_file,
+                            help="""CoNLL-U file with recipe graphs.""")
+    arg_parser.add_argument("--copies", type=int, default=10, help="""Copies of every recipe in the files.""")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="""Number of timed runs (best is reported).""")
+    args = arg_parser.parse_args()
+
+    # distinct objects: pickle would store repeated objects only once
+    graphs = [G for _ in range(args.copies) for G in iter_graphs_from_conllu(args.conllu_file)]
+    names = [f"recipe_{i}" for i in range(len(graphs))]
+    out_dir = tempfile.mkdtemp()
+    store_file, pickle_file = os.path.join(out_dir, "graphs.store"), os.path.join(out_dir, "graphs.pickle")
+    sample = random.Random(0).sample(range(len(graphs)), min(100, len(graphs)))
+
+    def best(run):
+        return min(timeit.repeat(run, number=1, repeat=args.repeat))
+
+    def open_store():
+        with GraphStore(store_file) as store:
+            return len(store)
+
+    def load_from_pickle():
+        # pickle has to load all graphs to get any of them
+        all_graphs = load_pickle(pickle_file)
+        return [all_graphs[i] for i in sample]
+
+    def load_from_store():
+        with GraphStore(store_file) as store:
+            return [store.graph(i) for i in sample]
+
+    results = [
+        ("write", best(lambda: write_pickle(pickle_file, graphs)),
+         best(lambda: write_graph_store(store_file, graphs, names))),
+        ("open", best(lambda: load_pickle(pickle_file)), best(open_store)),
+        (f"load {len(sample)} graphs", best(load_from_pickle), best(load_from_store)),
+    ]
+    print(f"{args.conllu_file} x {args.copies}: {len(graphs)} graphs")
+    print(f"{'size':<16} pickle {os.path.getsize(pickle_file) / 1e6:9.2f} MB   store {os.path.getsize(store_file) / 1e6:9.2f} MB")
+    for name, pickle_seconds, store_seconds in results:
+        print(f"{name:<16} pickle {pickle_seconds * 1000:9.2f} ms   store {store_seconds * 1000:9.2f} ms")
+    os.remove(store_file)
+    os.remove(pickle_file)
+    os.rmdir(out_dir)
@@ -0,0 +1,95 @@
+"""
+Benchmark: next_step() and the frontier from a StepIndex vs. walking the networkx action graph on every
+query (all steps that are not completed and whose predecessors are, in token order).
+
+Usage (from data-scripts):
+    python benchmarks/next_step_benchmark.py [conllu_file] [--repeat N]
+Defaults to the English parser training data. Every recipe is "cooked" by completing the next step until
+all steps are done, with one query per step.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from recipe_graph import action_labels, generate_reduced_graph, iter_graphs_from_conllu  # noqa: E402
+from step_index import StepIndex  # noqa: E402
+
+
+def frontier_from_graph(A, completed_steps):
+    return [
+        node for node in sorted(A.nodes)
+        if node not in completed_steps and all(p in completed_steps for p in A.predecessors(node))
+    ]
+
+
+def cook_with_graph(A):
+    completed_steps = set()
+    while True:
+        frontier = frontier_from_graph(A, completed_steps)
+        if not frontier:
+            # remaining steps are blocked by cycles
+            remaining = sorted(set(A.nodes) - completed_steps)
+            if not remaining:
+                return completed_steps
+            frontier = remaining
+        completed_steps.add(frontier[0])
+
+
+def cook_with_index(index):
+    completed = 0
+    while (step := index.next_step(completed)) is not None:
+        completed |= 1 << index.rank(step)
+    return completed
+
+
+def frontiers_with_index(index):
+    completed = 0
+    for rank in range(len(index)):
+        index.frontier(completed)
+        completed |= 1 << rank
+
+
+def frontiers_with_graph(A, index):
+    completed_steps = set()
+    for step in index.steps:
+        frontier_from_graph(A, completed_steps)
+        completed_steps.add(step)
+
+
+if __name__ == "__main__":
+    default_file = os.path.normpath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "English", "Parser", "train.conllu"
+    ))
+    arg_parser = argparse.ArgumentParser(description="""Times next_step() queries with and without a StepIndex.""")
+    arg_parser.add_argument("conllu_file", nargs="?", default=default_file,
+                            help="""CoNLL-U file with recipe graphs.""")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="""Number of timed runs (best is reported).""")
+    args = arg_parser.parse_args()
+
+    graphs = list(iter_graphs_from_conllu(args.conllu_file))
+    action_graphs = []
+    for G in graphs:
+        A = nx.DiGraph(generate_reduced_graph(G, action_labels))
+        A.remove_nodes_from(["end"])
+        action_graphs.append(A)
+    indices = [StepIndex.from_graph(G) for G in graphs]
+    blobs = [index.to_bytes() for index in indices]
+    n_steps = sum(len(index) for index in indices)
+    print(f"{args.conllu_file}: {len(graphs)} recipes, {n_steps} steps, "
+          f"{sum(map(len, blobs)) / len(blobs):.0f} bytes per serialized index")
+
+    timings = [
+        ("next_step, graph walk", lambda: [cook_with_graph(A) for A in action_graphs]),
+        ("next_step, index", lambda: [cook_with_index(index) for index in indices]),
+        ("frontier, graph walk", lambda: [frontiers_with_graph(A, index) for A, index in zip(action_graphs, indices)]),
+        ("frontier, index", lambda: [frontiers_with_index(index) for index in indices]),
+        ("load index", lambda: [StepIndex.from_bytes(blob) for blob in blobs]),
+    ]
+    for name, run in timings:
+        seconds = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"{name:<22} {seconds * 1e6 / n_steps:8.2f} us per step")
@@ -0,0 +1,99 @@
+"""
+Benchmark: RecipeGraph.write_to_conll vs. the previous implementation, which expanded multi-token
+nodes into a temporary nx.DiGraph with deep-copied attribute dicts before writing line by line.
+
+Usage (from data-scripts):
+    python benchmarks/write_to_conll_benchmark.py [recipe_dir] [--repeat N]
+Defaults to the individual English parser recipes (full recipe graphs).
+"""
+
+import argparse
+import copy
+import glob
+import os
+import sys
+import tempfile
+import timeit
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from recipe_graph import read_graph_from_conllu  # noqa: E402
+
+
+def write_with_temporary_graph(G, outfile):
+    # previous implementation of RecipeGraph.write_to_conll (IOB2 only), without the final print
+    c_graph = nx.DiGraph()
+    for node in G.nodes:
+        if node != "end":
+            tokens = G.nodes[node]["label"].split("_")
+            tokens = tokens[1].split(" ") if len(tokens) == 2 else tokens[0].split(" ")
+            new_nodes = list()
+            first_token = tokens.pop(0)
+            attributes = G.nodes[node]
+            first_attributes = copy.deepcopy(attributes)
+            first_attributes["label"] = first_token
+            first_attributes["node-type"] = "B-" + attributes["node-type"]
+            new_nodes.append((node, first_attributes))
+            for n, t in enumerate(tokens):
+                n += 1
+                node_attributes = copy.deepcopy(G.nodes[node])
+                node_attributes["label"] = t
+                node_attributes["node-type"] = "I-" + attributes["node-type"]
+                new_nodes.append((node + n, node_attributes))
+            c_graph.add_nodes_from(new_nodes)
+
+    with open(outfile, "w", encoding="utf-8") as o:
+        for id, token in enumerate(G.recipe_text):
+            id += 1
+            columns = [str(id), token, "_", G.upos[id - 1]]
+            if id in c_graph:
+                columns.append(c_graph.nodes[id]['node-type'])
+                columns.append("_")
+                if c_graph.nodes[id]["node-type"].startswith("B"):
+                    columns.extend(G.heads_to_columns(id))
+                else:
+                    columns.extend(["0", "root", "_"])
+                columns.append(G.misc[id - 1])
+            else:
+                columns.extend(["O", "_", "0", "root", "_"])
+                columns.append(G.misc[id - 1])
+            o.write("\t".join(columns))
+            o.write("\n")
+
+
+def write_streaming(G, outfile, tag_format="iob2"):
+    with open(outfile, "w", encoding="utf-8") as o:
+        G.write_to_conll(o, tag_format)
+
+
+if __name__ == "__main__":
+    default_dir = os.path.normpath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "English", "Parser", "individual-recipes"
+    ))
+    arg_parser = argparse.ArgumentParser(description="""Times writing recipe graphs with write_to_conll.""")
+    arg_parser.add_argument("recipe_dir", nargs="?", default=default_dir,
+                            help="""Directory tree with recipe graphs (.conllu).""")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="""Number of timed runs (best is reported).""")
+    args = arg_parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.recipe_dir, "**", "*.conllu"), recursive=True))
+    graphs = [read_graph_from_conllu(f) for f in files]
+    out_dir = tempfile.mkdtemp()
+    old_file, new_file = os.path.join(out_dir, "old.conllu"), os.path.join(out_dir, "new.conllu")
+    for G in graphs:
+        write_with_temporary_graph(G, old_file)
+        write_streaming(G, new_file)
+        with open(old_file, encoding="utf-8") as a, open(new_file, encoding="utf-8") as b:
+            assert a.read() == b.read()
+    print(f"{args.recipe_dir}: {len(graphs)} recipes, {sum(len(G.recipe_text) for G in graphs)} tokens")
+
+    results = {}
+    for name, write in (("temporary graph", write_with_temporary_graph), ("streaming", write_streaming),
+                        ("streaming BIOUL", lambda G, f: write_streaming(G, f, "bioul"))):
+        results[name] = min(timeit.repeat(lambda: [write(G, new_file) for G in graphs], number=1, repeat=args.repeat))
+    for name, seconds in results.items():
+        print(f"{name:<16} {seconds * 1000:7.2f} ms   speedup {results['temporary graph'] / seconds:5.1f}x")
+    os.remove(old_file)
+    os.remove(new_file)
+    os.rmdir(out_dir)
@@ -0,0 +1,258 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Columnar binary format for CoNLL-U corpora.
+
+A CoNLL-U file is converted once into a directory of .npy arrays that are memory-mapped
+when read, s.t. opening a corpus costs almost nothing and recipe i can be sliced
+out in O(1) without copying:
+    - <column>.npy: codes of the string columns FORM, LEMMA, UPOS, XPOS, FEATS, DEPREL
+      and MISC, one per token; every column is interned into its own vocabulary (vocab.json)
+    - head.npy: HEAD of every token
+    - deps_indptr.npy, deps_head.npy, deps_label.npy: the additional edges of the DEPS column
+      in CSR style: the edges of token t are at positions deps_indptr[t]:deps_indptr[t+1];
+      labels are codes of the DEPREL vocabulary
+    - recipe_offsets.npy: int64 token offsets, recipe i consists of the tokens
+      recipe_offsets[i]:recipe_offsets[i+1]
+    - meta.json: format version, source file and sizes
+Token IDs are not stored; they are 1..n within each recipe. Integer arrays use the smallest
+unsigned dtype that fits their values (e.g. uint8 for LEMMA if it is always "_").
+
+Read corpora with BinaryCorpus (see also binary_ud_reader.py for AllenNLP).
+Run this script to convert CoNLL-U files.
+
+Tested with Python 3.11
+"""
+
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from deps_codec import format_deps, parse_deps
+
+
+FORMAT_VERSION = 1
+
+# CoNLL-U columns (0-based index) stored as interned codes
+STRING_COLUMNS = {"form": 1, "lemma": 2, "upos": 3, "xpos": 4, "feats": 5, "deprel": 7, "misc": 9}
+
+
+def _compact(values):
+    """
+    Returns: values as an array of the smallest unsigned integer dtype that fits them
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) and values.min() < 0:
+        raise ValueError("Negative values cannot be stored in the binary corpus format.")
+    top = int(values.max()) if len(values) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if top <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+
+def convert_conllu(conllu_file, out_dir):
+    """
+    Converts a CoNLL-U file (recipes separated by empty lines) into the binary format.
+
+    Returns: the number of recipes converted
+    """
+    vocabs = {name: dict() for name in STRING_COLUMNS}
+    codes = {name: [] for name in STRING_COLUMNS}
+    heads = []
+    deps_counts = []
+    deps_heads = []
+    deps_labels = []
+    recipe_offsets = [0]
+    deprel_vocab = vocabs["deprel"]
+
+    with open(conllu_file, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            if line.strip() == "":
+                if len(heads) != recipe_offsets[-1]:
+                    recipe_offsets.append(len(heads))
+                continue
+            columns = line.rstrip("\r\n").split("\t")
+            if len(columns) != 10:
+                raise IOError(f"{conllu_file} probably isn't written in CoNLL-U format: {line!r}")
+            for name, j in STRING_COLUMNS.items():
+                codes[name].append(vocabs[name].setdefault(columns[j], len(vocabs[name])))
+            heads.append(int(columns[6]))
+            edges = parse_deps(columns[8])
+            deps_counts.append(len(edges))
+            for head, label in edges:
+                deps_heads.append(head)
+                deps_labels.append(deprel_vocab.setdefault(label, len(deprel_vocab)))
+    if len(heads) != recipe_offsets[-1]:
+        recipe_offsets.append(len(heads))
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {name: _compact(values) for name, values in codes.items()}
+    arrays["head"] = _compact(heads)
+    arrays["deps_indptr"] = _compact(np.concatenate([[0], np.cumsum(deps_counts, dtype=np.int64)]))
+    arrays["deps_head"] = _compact(deps_heads)
+    arrays["deps_label"] = _compact(deps_labels)
+    arrays["recipe_offsets"] = np.asarray(recipe_offsets, dtype=np.int64)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, name + ".npy"), array)
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as o:
+        json.dump({name: list(vocab) for name, vocab in vocabs.items()}, o, ensure_ascii=False)
+    meta = {
+        "version": FORMAT_VERSION,
+        "source": os.path.abspath(conllu_file),
+        "tokens": len(heads),
+        "recipes": len(recipe_offsets) - 1,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as o:
+        json.dump(meta, o, indent=2)
+    return meta["recipes"]
+
+
+class BinaryCorpus:
+    """
+    Memory-mapped corpus in the binary format (see module docstring).
+
+    Column arrays (e.g. corpus.arrays["xpos"]) are read-only memmaps; slicing a recipe out of
+    them does not copy. Strings are only decoded on request (see recipe()).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise IOError(f"Unsupported binary corpus version {self.meta['version']} in {path}.")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocabs = json.load(f)
+        self.arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+            for name in list(STRING_COLUMNS) + ["head", "deps_indptr", "deps_head", "deps_label", "recipe_offsets"]
+        }
+        self.recipe_offsets = self.arrays["recipe_offsets"]
+
+    def __len__(self):
+        return len(self.recipe_offsets) - 1
+
+    @property
+    def n_tokens(self):
+        return int(self.recipe_offsets[-1])
+
+    def span(self, i):
+        """
+        Returns: (start, end) token offsets of recipe i
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Recipe index {i} out of range.")
+        return int(self.recipe_offsets[i]), int(self.recipe_offsets[i + 1])
+
+    def column(self, name, i):
+        """
+        Returns: the codes (or heads) of column name for recipe i, as a zero-copy memmap slice
+        """
+        start, end = self.span(i)
+        return self.arrays[name][start:end]
+
+    def decode(self, name, codes):
+        """
+        Returns: a String list with the values of the codes in the vocabulary of column name
+        """
+        vocab = self.vocabs[name]
+        return [vocab[c] for c in np.asarray(codes).tolist()]
+
+    def deps(self, i):
+        """
+        Returns: a list with the additional (head, label) edges of every token of recipe i
+        """
+        start, end = self.span(i)
+        indptr = self.arrays["deps_indptr"][start : end + 1].tolist()
+        lo, hi = indptr[0], indptr[-1]
+        heads = self.arrays["deps_head"][lo:hi].tolist()
+        labels = self.decode("deprel", self.arrays["deps_label"][lo:hi])
+        return [
+            list(zip(heads[a - lo : b - lo], labels[a - lo : b - lo])) for a, b in zip(indptr[:-1], indptr[1:])
+        ]
+
+    def recipe(self, i):
+        """
+        Decodes recipe i.
+
+        Returns: a dictionary with the String lists words, lemmas, upos, xpos, feats, deprels, misc,
+            the int list heads and the list deps of additional (head, label) edges per token
+        """
+        decoded = {
+            key: self.decode(name, self.column(name, i))
+            for key, name in (("words", "form"), ("lemmas", "lemma"), ("upos", "upos"), ("xpos", "xpos"),
+                              ("feats", "feats"), ("deprels", "deprel"), ("misc", "misc"))
+        }
+        decoded["heads"] = self.column("head", i).tolist()
+        decoded["deps"] = self.deps(i)
+        return decoded
+
+    def __getitem__(self, i):
+        return self.recipe(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.recipe(i)
+
+    def write_conllu(self, outfile):
+        """
+        Writes the corpus back into CoNLL-U format (DEPS in list notation).
+        """
+        with open(outfile, "w", encoding="utf-8", buffering=1 << 20) as o:
+            for recipe in self:
+                for t, columns in enumerate(zip(
+                    recipe["words"], recipe["lemmas"], recipe["upos"], recipe["xpos"], recipe["feats"],
+                    recipe["heads"], recipe["deprels"], recipe["deps"], recipe["misc"],
+                )):
+                    form, lemma, upos, xpos, feats, head, deprel, deps, misc = columns
+                    o.write("\t".join(
+                        [str(t + 1), form, lemma, upos, xpos, feats, str(head), deprel, format_deps(deps), misc]
+                    ))
+                    o.write("\n")
+                o.write("\n")
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Converts CoNLL-U files into the memory-mapped columnar binary format
+        (or, with --to-conllu, a binary corpus back into CoNLL-U).""")
+    arg_parser.add_argument("input", metavar="INPUT",
+                            help="""CoNLL-U file (or binary corpus directory with --to-conllu).""")
+    arg_parser.add_argument("-o", "--output", dest="out", metavar="OUTPUT",
+                            help="""Output directory (or CoNLL-U file with --to-conllu). Default is <input>.bin if not specified""")
+    arg_parser.add_argument("--to-conllu", dest="to_conllu", action="store_true",
+                            help="""Convert a binary corpus back into CoNLL-U.""")
+    args = arg_parser.parse_args()
+
+    if args.to_conllu:
+        if args.out is None:
+            arg_parser.error("the following arguments are required with --to-conllu: -o/--output")
+        logging.info(f"Writing {args.input} into {args.out}")
+        BinaryCorpus(args.input).write_conllu(args.out)
+    else:
+        # default output directory name
+        if args.out is None:
+            args.out = str(args.input) + ".bin"
+        n_recipes = convert_conllu(args.input, args.out)
+        print(f"{args.input}: {n_recipes} recipes written to {args.out}")
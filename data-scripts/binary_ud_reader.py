@@ -0,0 +1,71 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+AllenNLP dataset reader for corpora in the binary format of binary_corpus.py, as a drop-in
+replacement of the `universal_dependencies` reader used by parser/parser.jsonnet.
+
+Usage (from the repository root): convert the data once with
+    python data-scripts/binary_corpus.py data/English/Parser/train.conllu
+set `type: "universal_dependencies_binary"` in the config's dataset_reader, point
+train_data_path / validation_data_path to the .bin directories, and run
+    PYTHONPATH=data-scripts allennlp train [config] --include-package binary_ud_reader ...
+"""
+
+from typing import Dict, Optional
+
+from allennlp.common.file_utils import cached_path
+from allennlp.data import DatasetReader
+from allennlp.data.token_indexers import TokenIndexer
+from allennlp.data.tokenizers import Tokenizer
+from allennlp_models.structured_prediction.dataset_readers.universal_dependencies import (
+    UniversalDependenciesDatasetReader,
+)
+
+from binary_corpus import BinaryCorpus
+
+
+@DatasetReader.register("universal_dependencies_binary")
+class BinaryUniversalDependenciesDatasetReader(UniversalDependenciesDatasetReader):
+    """
+    Reads the same instances as the `universal_dependencies` reader (words, UPOS or XPOS tags and
+    HEAD/DEPREL dependencies; DEPS are ignored there as well), but from a memory-mapped binary corpus.
+    Recipes are distributed over workers and distributed processes by index, without reading the
+    recipes of other workers.
+    """
+
+    def __init__(
+        self,
+        token_indexers: Dict[str, TokenIndexer] = None,
+        use_language_specific_pos: bool = False,
+        tokenizer: Optional[Tokenizer] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(
+            token_indexers,
+            use_language_specific_pos,
+            tokenizer,
+            manual_distributed_sharding=True,
+            manual_multiprocess_sharding=True,
+            **kwargs,
+        )
+
+    def _read(self, file_path: str):
+        corpus = BinaryCorpus(cached_path(file_path))
+        pos_column = "xpos" if self.use_language_specific_pos else "upos"
+        for i in self.shard_iterable(range(len(corpus))):
+            words = corpus.decode("form", corpus.column("form", i))
+            pos_tags = corpus.decode(pos_column, corpus.column(pos_column, i))
+            tags = corpus.decode("deprel", corpus.column("deprel", i))
+            heads = corpus.column("head", i).tolist()
+            yield self.text_to_instance(words, pos_tags, list(zip(tags, heads)))
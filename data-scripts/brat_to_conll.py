@@ -31,6 +31,8 @@ import pandas as pd
 import argparse
 import logging
 
+from deps_codec import format_deps
+
 
 def flatten_data(data):
     """
@@ -333,7 +335,7 @@ def write_conllu(conll, out_file):
                                 + "\t"
                                 + deprel
                                 + "\t"
-                                + str(list(set(line[5:])))
+                                + format_deps(set(line[5:]))
                                 + "\t_\n"
                             )  # id,form,lemma,(u)pos,xpos(label),feats,head,deprel,deps,misc
                         else:
@@ -0,0 +1,230 @@
+"""
+Checks the structure of all recipe graphs in gold or predicted corpora: strongly connected components
+and cycles, weakly connected components, roots and sinks per recipe.
+
+Nodes and edges are the ones read_graph_from_conllu() (recipe_graph.py) builds: every B- or U- tagged
+token is a node, its HEAD and DEPS give the edges, and heads that are not tagged as nodes become nodes
+as well (counted as edges to non-nodes); the artificial "end" node is not added. Edges point from a
+token to its head, i.e. forward in the cooking process, so roots (no incoming edges) are typically
+ingredients and tools, and sinks (no outgoing edges) are final actions. With --all-tokens, every token
+is a node and all edges of all tokens are used (the raw dependency structure, e.g. of parser output).
+
+All recipes of all input files are put into one sparse block-diagonal adjacency matrix, and the components
+are computed at once with scipy.sparse.csgraph, so whole machine-parsed corpora are screened in seconds.
+
+Input: CoNLL-U files (one or more recipes each, read through the gold cache, see gold_cache.py),
+directories with CoNLL-U files, or parser output (.json, original or lean format).
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sys
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gold_cache import load_gold_table  # noqa: E402
+from json_to_conll import iter_prediction_records  # noqa: E402
+
+HEADER = ("file", "recipe", "nodes", "edges", "weak_components", "roots", "sinks", "isolated",
+          "cyclic_components", "largest_cyclic_component", "nodes_in_cycles", "self_loops",
+          "edges_to_non_nodes", "dangling_edges")
+
+
+def read_conllu_edges(conllu_file, use_cache=True):
+    """
+    Returns: tags (String list), recipe offsets, and the source tokens and head IDs of all edges
+        (HEAD and DEPS; heads 0 included), as int64 arrays
+    """
+    table = load_gold_table(conllu_file, "conllu", use_cache=use_cache)
+    if len(table) == 0:
+        # empty file: no columns to read
+        return [], table.recipe_offsets, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    sources = np.repeat(np.arange(len(table), dtype=np.int64), np.diff(table.edge_indptr))
+    return table.column(4), table.recipe_offsets, sources, table.edge_heads
+
+
+def read_prediction_edges(pred_file):
+    """
+    Returns: the same as read_conllu_edges, for the output of our parser (or tagger, without edges)
+    """
+    tags = []
+    heads = []
+    recipe_offsets = [0]
+    for record in iter_prediction_records(pred_file):
+        tags.extend(record["tags"])
+        heads.extend(int(h) for h in record["heads"] or ["0"] * len(record["tags"]))
+        recipe_offsets.append(len(tags))
+    return tags, np.asarray(recipe_offsets, dtype=np.int64), np.arange(len(tags), dtype=np.int64), \
+        np.asarray(heads, dtype=np.int64)
+
+
+def diagnose(tags, recipe_offsets, sources, heads, all_tokens=False):
+    """
+    Computes the structure statistics of every recipe (see HEADER) at once.
+
+    Arguments:
+        - tags: String list with the tag of every token
+        - recipe_offsets: int64 array, recipe i consists of the tokens recipe_offsets[i]:recipe_offsets[i+1]
+        - sources, heads: int64 arrays with the source token (0-based, global) and the head ID (1-based
+          within the recipe, 0 for root) of every edge
+        - all_tokens: use all tokens and edges instead of the graph nodes (see module docstring)
+    Returns: a dictionary from statistic name to an int64 array with one value per recipe
+    """
+    n_tokens = len(tags)
+    n_recipes = len(recipe_offsets) - 1
+    token_recipe = np.repeat(np.arange(n_recipes), np.diff(recipe_offsets))
+    lengths = np.diff(recipe_offsets)
+
+    if all_tokens:
+        is_node = np.ones(n_tokens, dtype=bool)
+    else:
+        uniq, inverse = np.unique(np.asarray(tags, dtype=str), return_inverse=True)
+        is_node = np.array([tag[:1] in ("B", "U") for tag in uniq.tolist()], dtype=bool)[inverse.reshape(-1)]
+
+    # edges of the graph: from nodes to their heads; heads outside the recipe are dangling
+    recipe = token_recipe[sources]
+    keep = is_node[sources] & (heads != 0)
+    dangling = keep & ((heads < 0) | (heads > lengths[recipe]))
+    keep &= ~dangling
+    src = sources[keep]
+    dst = recipe_offsets[recipe[keep]] + heads[keep] - 1
+    # duplicate edges (e.g. in HEAD and DEPS) count once
+    keys = np.unique(src * n_tokens + dst)
+    src, dst = keys // n_tokens, keys % n_tokens
+    edge_recipe = token_recipe[src]
+
+    is_vertex = is_node.copy()
+    is_vertex[dst] = True
+    to_non_node = ~is_node[dst]
+
+    adjacency = csr_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n_tokens, n_tokens))
+    vertices = np.flatnonzero(is_vertex)
+    vertex_recipe = token_recipe[vertices]
+    out_degree = np.bincount(src, minlength=n_tokens)
+    in_degree = np.bincount(dst, minlength=n_tokens)
+
+    def per_recipe(recipe_ids, weights=None):
+        return np.bincount(recipe_ids, weights=weights, minlength=n_recipes).astype(np.int64)
+
+    # weakly connected components (components never cross recipes)
+    n_weak, weak = connected_components(adjacency, directed=True, connection="weak")
+    weak_recipe = np.zeros(n_weak, dtype=np.int64)
+    weak_recipe[weak[vertices]] = vertex_recipe
+    # strongly connected components; cyclic: more than one node or a self-loop
+    n_strong, strong = connected_components(adjacency, directed=True, connection="strong")
+    strong_size = np.bincount(strong[vertices], minlength=n_strong)
+    self_loop = src == dst
+    cyclic = strong_size > 1
+    cyclic[strong[src[self_loop]]] = True
+    cyclic_ids = np.flatnonzero(cyclic)
+    component_recipe = np.zeros(n_strong, dtype=np.int64)
+    component_recipe[strong[vertices]] = vertex_recipe
+    largest = np.zeros(n_recipes, dtype=np.int64)
+    np.maximum.at(largest, component_recipe[cyclic_ids], strong_size[cyclic_ids])
+
+    roots = in_degree[vertices] == 0
+    sinks = out_degree[vertices] == 0
+    return {
+        "nodes": per_recipe(vertex_recipe),
+        "edges": per_recipe(edge_recipe),
+        "weak_components": per_recipe(weak_recipe[np.unique(weak[vertices])]),
+        "roots": per_recipe(vertex_recipe[roots]),
+        "sinks": per_recipe(vertex_recipe[sinks]),
+        "isolated": per_recipe(vertex_recipe[roots & sinks]),
+        "cyclic_components": per_recipe(component_recipe[cyclic_ids]),
+        "largest_cyclic_component": largest,
+        "nodes_in_cycles": per_recipe(vertex_recipe[cyclic[strong[vertices]]]),
+        "self_loops": per_recipe(edge_recipe[self_loop]),
+        "edges_to_non_nodes": per_recipe(edge_recipe[to_non_node]),
+        "dangling_edges": per_recipe(recipe[dangling]),
+    }
+
+
+def find_files(paths):
+    """
+    Returns: the input files, with directories replaced by all CoNLL-U files in them (sorted, recursively)
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, name) for name in names if name.endswith(".conllu"))
+            files.extend(sorted(found))
+        else:
+            files.append(path)
+    return files
+
+
+def check_files(files, all_tokens=False, use_cache=True):
+    """
+    Reads all files into one corpus and diagnoses it.
+
+    Returns: a list of (file, recipe index within the file) pairs and the statistics (see diagnose)
+    """
+    all_tags = []
+    offsets = [np.zeros(1, dtype=np.int64)]
+    all_sources = []
+    all_heads = []
+    recipes = []
+    for file in files:
+        if file.endswith(".json") or file.endswith(".jsonl"):
+            tags, recipe_offsets, sources, heads = read_prediction_edges(file)
+        else:
+            try:
+                tags, recipe_offsets, sources, heads = read_conllu_edges(file, use_cache)
+            except IndexError as e:
+                # e.g. a file with comment lines only: skip it instead of aborting the whole corpus
+                logging.warning(f"Skipping {file}: {e}")
+                continue
+        start = len(all_tags)
+        all_tags.extend(tags)
+        offsets.append(recipe_offsets[1:] + start)
+        all_sources.append(sources + start)
+        all_heads.append(heads)
+        recipes.extend((file, i) for i in range(len(recipe_offsets) - 1))
+    stats = diagnose(all_tags, np.concatenate(offsets), np.concatenate(all_sources or [np.zeros(0, dtype=np.int64)]),
+                     np.concatenate(all_heads or [np.zeros(0, dtype=np.int64)]), all_tokens)
+    return recipes, stats
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="""Checks cycles, connectivity, roots and sinks of all recipe graphs in the given files."""
+    )
+    arg_parser.add_argument("inputs", metavar="INPUT", nargs="+",
+                            help="""CoNLL-U files, directories containing CoNLL-U files, or parser output (.json).""")
+    arg_parser.add_argument("-o", "--output", dest="output_file", metavar="OUTPUT_FILE",
+                            help="""Optional: write the statistics of every recipe as TSV.""")
+    arg_parser.add_argument("--all-tokens", dest="all_tokens", action="store_true",
+                            help="""Use all tokens and edges instead of the graph nodes (B-/U- tags) and their edges.""")
+    arg_parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                            help="""Parse CoNLL-U files from scratch instead of using the gold cache.""")
+    args = arg_parser.parse_args()
+
+    recipes, stats = check_files(find_files(args.inputs), args.all_tokens, args.use_cache)
+
+    cyclic = stats["cyclic_components"] > 0
+    disconnected = stats["weak_components"] > 1
+    print(f"Recipes: {len(recipes)}, nodes: {stats['nodes'].sum()}, edges: {stats['edges'].sum()}")
+    print(f"Recipes with cycles: {cyclic.sum()} ({stats['cyclic_components'].sum()} cyclic components, "
+          f"{stats['nodes_in_cycles'].sum()} nodes in cycles, {stats['self_loops'].sum()} self-loops)")
+    print(f"Recipes with more than one weakly connected component: {disconnected.sum()} "
+          f"({stats['isolated'].sum()} isolated nodes)")
+    print(f"Roots: {stats['roots'].sum()}, sinks: {stats['sinks'].sum()}, "
+          f"edges to non-nodes: {stats['edges_to_non_nodes'].sum()}, dangling edges: {stats['dangling_edges'].sum()}")
+    for (file, i) in (recipes[r] for r in np.flatnonzero(cyclic)):
+        print(f"  cycle: {file} recipe {i}")
+
+    if args.output_file:
+        with open(args.output_file, "w", encoding="utf-8") as o:
+            tsv_writer = csv.writer(o, delimiter="\t")
+            tsv_writer.writerow(HEADER)
+            for r, (file, i) in enumerate(recipes):
+                tsv_writer.writerow([file, i] + [int(stats[name][r]) for name in HEADER[2:]])
@@ -0,0 +1,265 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Consolidates the graphs of many recipes (e.g. all recipes of one dish) into one graph.
+
+Nodes with the same node type and the same normalized label (lower-cased, whitespace collapsed,
+surrounding punctuation removed, see normalize_label()) are merged, as well as the "end" nodes of all
+recipes. Instead of comparing the nodes of the recipes pairwise, every node is hashed by its
+(node type, normalized label) key: the first node with a key becomes its representative, and every
+further node with that key is merged into it in a union-find structure. Further merges, e.g. from an
+alignment of the recipes, can be added with GraphConsolidator.align(); nodes merged this way may
+have different labels. Heads that are not tagged as nodes (no node type) are never merged by label.
+Building the consolidated graph takes time linear in the total number of nodes and edges.
+
+The consolidated graph has the node IDs 1..n (in the order in which the merged nodes first occur) plus
+"end". Every node keeps the label (prefixed with its new ID) and node type of its first member and gets
+the attribute "origins", the (origin, node ID) pairs of all merged nodes as a tuple, e.g.
+(("G_recipe_1", 1), ("G_recipe_3", 4)). Edges between merged nodes are combined into one edge with the
+label of the first one and the attribute "count", the number of merged edges; edges within a merged
+node are dropped.
+
+Run this script to consolidate the recipes of CoNLL-U files into one graph in the simplified CoNLL-U format.
+
+Tested with Python 3.11
+"""
+
+import argparse
+import re
+import string
+
+from recipe_graph import CompactRecipeGraph, action_labels, fat_labels, generate_reduced_graph, \
+    iter_graphs_from_conllu, write_graph_to_simple_conllu
+
+GRAPH_TYPES = {"full": None, "fat": fat_labels, "action": action_labels}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_label(text):
+    """
+    Returns: the text lower-cased, with whitespace collapsed and without surrounding punctuation
+    """
+    return _WHITESPACE.sub(" ", text.lower()).strip(string.punctuation + " ")
+
+
+class UnionFind:
+    """
+    Disjoint sets over the integers 0..n-1, with union by size and path halving.
+    """
+
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self):
+        """
+        Returns: the number of a new singleton set
+        """
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        """
+        Merges the sets of x and y.
+
+        Returns: the representative of the merged set
+        """
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return x
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
+        return x
+
+
+class GraphConsolidator:
+    """
+    Collects recipe graphs and merges their nodes (see module docstring).
+    """
+
+    def __init__(self, normalize=normalize_label):
+        self.normalize = normalize
+        self.sets = UnionFind()
+        self.members = []  # (origin, node ID) of every node number
+        self.attributes = []  # attribute dict of every node number
+        self.numbers = dict()  # (origin, node ID) -> node number
+        self.keys = dict()  # (node type, normalized label) -> node number of the first node
+        self.edges = []  # (node number, node number, edge label)
+        self.origins = set()
+        self.end = None
+
+    def __len__(self):
+        return len(self.members)
+
+    def _add_node(self, origin, node, attributes):
+        number = self.sets.add()
+        self.members.append((origin, node))
+        self.attributes.append(attributes)
+        self.numbers[(origin, node)] = number
+        return number
+
+    def add_graph(self, G, origin=None):
+        """
+        Adds the nodes and edges of a recipe graph and merges its nodes with the matching nodes of the
+        graphs added before.
+
+        Arguments:
+            - G: a RecipeGraph or CompactRecipeGraph (read with token IDs)
+            - origin: name of the recipe; default: the origin of the nodes of G
+        Returns: the origin under which the graph was added
+        """
+        nodes = list(G.nodes.data())
+        if origin is None:
+            origin = next((attributes.get("origin") for node, attributes in nodes if node != "end"), None)
+        if origin is None or origin in self.origins:
+            raise ValueError(f"Recipe {origin} has no origin or was added before.")
+        self.origins.add(origin)
+
+        text = getattr(G, "recipe_text", None)
+        for node, attributes in nodes:
+            if node == "end":
+                number = self._add_node(origin, node, {})
+                if self.end is None:
+                    self.end = number
+                else:
+                    self.sets.union(self.end, number)
+                continue
+            node_type = attributes.get("node-type")
+            if isinstance(attributes.get("label"), str):
+                label = attributes["label"].partition("_")[2]
+            else:
+                # heads that are not tagged as nodes have no label
+                label = text[node - 1] if text else ""
+            number = self._add_node(origin, node, {"label": label, "node-type": node_type})
+            if node_type is None:
+                continue
+            key = (node_type, self.normalize(label))
+            first = self.keys.setdefault(key, number)
+            if first != number:
+                self.sets.union(first, number)
+        for u, v, attributes in G.edges.data():
+            self.edges.append((self.numbers[(origin, u)], self.numbers[(origin, v)], attributes.get("label")))
+        return origin
+
+    def align(self, origin_a, node_a, origin_b, node_b):
+        """
+        Merges node node_a of recipe origin_a with node node_b of recipe origin_b (and with all nodes
+        merged with them before).
+        """
+        self.sets.union(self.numbers[(origin_a, node_a)], self.numbers[(origin_b, node_b)])
+
+    def groups(self):
+        """
+        Returns: a list with the node numbers of every merged node, in the order of their first members
+        """
+        groups = dict()  # representative -> node numbers
+        for number in range(len(self.members)):
+            groups.setdefault(self.sets.find(number), []).append(number)
+        return list(groups.values())
+
+    def consolidated_graph(self, compact=False):
+        """
+        Returns: the consolidated graph (see module docstring) as RecipeGraph or CompactRecipeGraph
+        """
+        node_ids = [None] * len(self.members)
+        nodes = dict()
+        new_id = 0
+        for group in self.groups():
+            first = group[0]
+            if self.members[first][1] == "end":
+                node = "end"
+                attributes = {}
+            else:
+                new_id += 1
+                node = new_id
+                attributes = {"label": f"{node}_{self.attributes[first]['label']}"}
+                if self.attributes[first]["node-type"] is not None:
+                    attributes["node-type"] = self.attributes[first]["node-type"]
+            attributes["origins"] = tuple(self.members[number] for number in group)
+            nodes[node] = attributes
+            for number in group:
+                node_ids[number] = node
+
+        adjacency = dict()
+        for u, v, label in self.edges:
+            u, v = node_ids[u], node_ids[v]
+            if u == v:
+                continue
+            edge = adjacency.setdefault(u, dict()).get(v)
+            if edge is None:
+                adjacency[u][v] = {"label": label, "count": 1}
+            else:
+                edge["count"] += 1
+
+        C = CompactRecipeGraph.from_dicts(nodes, adjacency)
+        return C if compact else C.to_recipe_graph()
+
+
+def consolidate_graphs(graphs, compact=False):
+    """
+    Consolidates recipe graphs (see module docstring).
+
+    Arguments:
+        - graphs: iterable of RecipeGraphs or CompactRecipeGraphs (read with token IDs), with distinct origins
+        - compact: return a CompactRecipeGraph instead of a RecipeGraph
+    """
+    consolidator = GraphConsolidator()
+    for G in graphs:
+        consolidator.add_graph(G)
+    return consolidator.consolidated_graph(compact)
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Consolidates the recipe graphs of CoNLL-U files into one graph (simplified CoNLL-U format).""")
+    arg_parser.add_argument("inputs", metavar="CONLLU_FILE", nargs="+",
+                            help="""CoNLL-U files with one or more recipe graphs.""")
+    arg_parser.add_argument("-o", "--output", dest="out", metavar="OUTPUT_FILE", required=True,
+                            help="""Output file for the consolidated graph.""")
+    arg_parser.add_argument("-t", "--type", dest="graph_type", choices=list(GRAPH_TYPES), default="full",
+                            help="""Reduce the recipes to FAT graphs or action graphs first. Default: full""")
+    arg_parser.add_argument("--origins", dest="origins_file", metavar="ORIGINS_FILE",
+                            help="""Optional: write the origins of every consolidated node as TSV.""")
+    args = arg_parser.parse_args()
+
+    consolidator = GraphConsolidator()
+    for conllu_file in args.inputs:
+        for G in iter_graphs_from_conllu(conllu_file, compact=True):
+            if GRAPH_TYPES[args.graph_type] is not None:
+                G = generate_reduced_graph(G, GRAPH_TYPES[args.graph_type])
+            consolidator.add_graph(G)
+    C = consolidator.consolidated_graph(compact=True)
+    write_graph_to_simple_conllu(C, args.out)
+    print(f"{len(consolidator)} nodes consolidated into {C.number_of_nodes()} nodes and {C.number_of_edges()} edges")
+
+    if args.origins_file:
+        with open(args.origins_file, "w", encoding="utf-8") as o:
+            for node, attributes in C.nodes.data():
+                o.write("\t".join([str(node)] + [f"{origin}:{n}" for origin, n in attributes["origins"]]) + "\n")
@@ -0,0 +1,83 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Parses and serializes the DEPS column (additional edges) of our CoNLL-U files.
+
+Two notations are in use:
+    - list notation, i.e. a Python list of (head, label) pairs as written by our conversion
+      scripts, e.g. "[(29, 't'), (34, 'd')]" or "[(29,'t'),(34,'d')]"; some files (e.g. the
+      German corpus) quote the heads: "[('42', 'Nullanapher')]"
+    - Sandro's notation, as output by Sandro's parsers, e.g. "29:t|34:d"
+"_" means no additional edges in both notations.
+
+Cells are parsed with a regular expression instead of ast.literal_eval, which compiles
+every cell into an AST and used to dominate the reading time of large corpora
+(see benchmarks/deps_codec_benchmark.py).
+
+Used by recipe_graph.py, gold_cache.py, flowgraph_to_conll.py and brat_to_conll.py.
+"""
+
+import re
+
+
+# one (head, label) pair in list notation, e.g. (65, 't-eq') or ('42', 'Nullanapher')
+_LIST_EDGE = re.compile(r"""\(\s*(['"]?)(\d+)\1\s*,\s*(?:'([^']*)'|"([^"]*)")\s*\)""")
+
+
+def parse_deps(cell):
+    """
+    Parses one DEPS cell in list notation or Sandro's notation.
+
+    Returns: a list of (int, string) pairs with head ID and label of every additional edge
+    """
+    if cell == "_":
+        return []
+    cell = cell.strip()
+    if cell == "_" or cell == "[]" or cell == "":
+        return []
+    if cell.startswith("["):
+        edges = [(int(head), label or dq_label) for _, head, label, dq_label in _LIST_EDGE.findall(cell)]
+        if len(edges) != cell.count("("):
+            raise ValueError(f"Malformed DEPS cell in list notation: {cell}")
+        return edges
+    # Sandro's notation
+    edges = []
+    for edge in cell.split("|"):
+        head, sep, label = edge.partition(":")
+        if not sep:
+            raise ValueError(f"Malformed DEPS cell in Sandro's notation: {cell}")
+        edges.append((int(head), label))
+    return edges
+
+
+def format_deps(edges, notation="list", compact=False):
+    """
+    Serializes additional edges, i.e. (head, label) pairs, into one DEPS cell.
+    In list notation, the output equals str(list(edges)) (without spaces if compact),
+    i.e. heads are quoted iff they are strings.
+
+    Arguments:
+        - edges: iterable of (head, label) pairs
+        - notation: "list" or "sandro"
+    Returns: the cell value; "_" if there are no edges
+    """
+    edges = list(edges)
+    if not edges:
+        return "_"
+    if notation == "sandro":
+        return "|".join(f"{head}:{label}" for head, label in edges)
+    if notation != "list":
+        raise ValueError(f"Unexpected DEPS notation {notation}. Valid options are {{list, sandro}}.")
+    sep = "," if compact else ", "
+    return "[" + sep.join(f"({head!r}{sep}{label!r})" for head, label in edges) + "]"
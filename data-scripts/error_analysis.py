@@ -33,22 +33,21 @@ References:
 """
 
 import argparse
-import json
-from ast import literal_eval
 import logging
 
+from gold_cache import load_gold_table
+from json_to_conll import iter_prediction_records
+
 
 def read_prediction_tokens(pred_file):
     """
-    Reads in the tokens from the tagger's output file.
+    Reads in the tokens from the tagger's output file (original or lean format).
 
     Returns: a String list
     """
     tokens = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            tokens.extend(j["words"])
+    for record in iter_prediction_records(pred_file):
+        tokens.extend(record["words"])
     return tokens
 
 
@@ -63,32 +62,23 @@ def read_prediction_tags(pred_file):
     """
     model_type = None
     tags = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            try:
-                tags.extend(j["tags"])
-                model_type = "tagger"
-            except KeyError:
-                tags.extend(j["pos"])
-                model_type = "parser"
+    for record in iter_prediction_records(pred_file):
+        tags.extend(record["tags"])
+        model_type = record["model_type"]
     return tags, model_type
 
 
 def read_prediction_dependencies(pred_file):
     """
-    Reads in the predictions from the parser's output file.
+    Reads in the predictions from the parser's output file (original or lean format).
 
     Returns: two String list with the predicted heads and dependency names, respectively.
     """
     heads = []
     deps = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            heads.extend(j["predicted_heads"])
-            deps.extend(j["predicted_dependencies"])
-    heads = list(map(str, heads))
+    for record in iter_prediction_records(pred_file):
+        heads.extend(record["heads"])
+        deps.extend(record["deps"])
     return heads, deps
 
 
@@ -107,9 +97,10 @@ def write_with_misjudgements(gold, prediction, goldlines, out_file):
             f.write(s + "\n")
 
 
-def _read_gold_conllu_simplified(gold_file):
+def _read_gold_conllu_simplified(gold_file, use_cache=True):
     """
-    Reads in the gold annotation from a file in CoNLL-U format.
+    Reads in the gold annotation from a file in CoNLL-U format
+    (from the gold cache, see gold_cache.py, unless use_cache is False).
     WARNING: Does not read in extra edges in 9th column!
 
     Returns:
@@ -122,45 +113,25 @@ def _read_gold_conllu_simplified(gold_file):
                 ID of 'head'.
         - lines: a list list containing the original line split at "\t"
     """
-    tags = []
-    heads = []
-    deps = []
-    lines = []
-    with open(gold_file, encoding="utf-8") as f:
-        for line in f:
-            if line == "\n":
-                continue
-            line = line.split("\t")
-            try:
-                tags.append(line[4])
-                heads.append(line[6])
-                deps.append(line[7])
-            except IndexError:
-                raise IndexError(
-                    f"Gold file {gold_file} probably isn't written in CoNLL-U format."
-                )
-            lines.append(line[:-1])
+    table = load_gold_table(gold_file, "conllu", use_cache=use_cache)
+    tags = table.column(4)
+    heads = table.column(6)
+    deps = table.column(7)
+    lines = [line[:-1] for line in table.lines()]
     return tags, heads, deps, lines
 
-def read_gold_conll2003(gold_file):
+def read_gold_conll2003(gold_file, use_cache=True):
     """
-    Reads in the gold annotation from a file in CoNLL 2003 format.
+    Reads in the gold annotation from a file in CoNLL 2003 format
+    (from the gold cache, see gold_cache.py, unless use_cache is False).
 
     Returns:
         - gold: a String list containing one sequence tag per token.
                 E.g. [B-Kochschritt, L-Kochschritt, U-Zutat, O]
         - lines: a list list containing the original line split at "\t"
     """
-    gold = []
-    lines = []
-    with open(gold_file, encoding="utf-8") as f:
-        for line in f:
-            if line == "\n":
-                continue
-            line = line.strip().split("\t")
-            gold.append(line[3])
-            lines.append(line)
-    return gold, lines
+    table = load_gold_table(gold_file, "conll03", use_cache=use_cache)
+    return table.column(3), table.lines()
 
 def execute_analysis(args):
     """
@@ -187,7 +158,7 @@ def execute_analysis(args):
 
         # Read in gold_file
         gold_tags, gold_heads, gold_deps, goldlines = _read_gold_conllu_simplified(
-            args.gold_file
+            args.gold_file, args.use_cache
         )
         # Read in prediction for the parsing task
         pred_heads, pred_deps = read_prediction_dependencies(args.pred_file)
@@ -212,12 +183,12 @@ def execute_analysis(args):
         if args.format == "conllu":
             # Read in gold_file in CoNLL-U format
             gold_tags, gold_heads, gold_deps, goldlines = _read_gold_conllu_simplified(
-                args.gold_file
+                args.gold_file, args.use_cache
             )
         elif args.format == "conll03":
             # Read in gold file in CoNLL-2003 format (doesn't double-check whether args.gold_file actually
             # is written in CoNLL-2003 format
-            gold_tags, goldlines = read_gold_conll2003(args.gold_file)
+            gold_tags, goldlines = read_gold_conll2003(args.gold_file, args.use_cache)
         # Combine prediction and expectation into a tsv file
         write_with_misjudgements(gold_tags, pred_tags, goldlines, args.out)
 
@@ -267,6 +238,12 @@ if __name__ == "__main__":
         metavar="OUTPUT_FILE",
         help="""Name of the output file. (optional, default: <prediction_file>.tsv)""",
     )
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="""Parse the gold file from scratch instead of using the gold cache (see gold_cache.py).""",
+    )
     args = arg_parser.parse_args()
 
     args.debug = False
@@ -33,6 +33,8 @@ import argparse
 from collections import defaultdict
 import logging
 
+from deps_codec import format_deps
+
 
 def read_list(filename):
     """
@@ -151,7 +153,7 @@ def write_conllu(lines, flow_dict, outfile):
                     # Write head,deprel,deps,misc
                     f.write(str(deps[0][0]) + "\t" + deps[0][1] + "\t")
                     if len(deps) > 1:
-                        f.write(str(deps[1:]) + "\t_\n")
+                        f.write(format_deps(deps[1:]) + "\t_\n")
                     else:
                         f.write("_\t_\n")
 
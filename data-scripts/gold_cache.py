@@ -0,0 +1,282 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Persistent cache for parsed gold annotation files (CoNLL-U or CoNLL-2003).
+
+A gold file is parsed once into compact arrays:
+    - all column values are interned into one string vocabulary and stored as an
+      int32 matrix with one row per token (missing columns are -1)
+    - recipe boundaries (empty lines) are stored as token offsets
+    - for CoNLL-U, all gold edges (HEAD/DEPREL plus the additional edges in DEPS) are
+      stored CSR-style: the edges of token i are at positions edge_indptr[i]:edge_indptr[i+1]
+The arrays are saved as an uncompressed .npz file in the cache directory (default:
+~/.cache/tagger-parser/gold, or $TAGGER_PARSER_CACHE). The cache entry is keyed by the
+absolute path of the gold file and records its size, modification time and content hash;
+it is rebuilt automatically when the file changes.
+
+Used by parser_evaluation.py, tagger_evaluation.py and error_analysis.py; run this script to prebuild or clear the cache.
+
+Tested with Python 3.11
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from deps_codec import parse_deps
+
+
+CACHE_VERSION = 2
+
+
+def default_cache_dir():
+    return os.environ.get(
+        "TAGGER_PARSER_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "tagger-parser", "gold"),
+    )
+
+
+class GoldTable:
+    """
+    Parsed gold annotation file (see module docstring for the layout of the arrays).
+    """
+
+    def __init__(self, vocab, codes, recipe_offsets, edge_indptr=None, edge_heads=None, edge_labels=None):
+        self.vocab = vocab
+        self.codes = codes
+        self.recipe_offsets = recipe_offsets
+        self.edge_indptr = edge_indptr
+        self.edge_heads = edge_heads
+        self.edge_labels = edge_labels
+
+    def __len__(self):
+        return len(self.codes)
+
+    def column(self, j):
+        """
+        Returns: a String list with the values of column j (0-based) for all tokens
+        """
+        return self.vocab[self.codes[:, j]].tolist()
+
+    def lines(self, n_columns=None):
+        """
+        Returns: a list list containing every token line split at "\\t" (optionally only the first n_columns)
+        """
+        rows = self.codes if n_columns is None else self.codes[:, :n_columns]
+        vocab = self.vocab.tolist()
+        return [[vocab[c] for c in row if c >= 0] for row in rows.tolist()]
+
+
+def _parse_gold_file(gold_file, fmt):
+    """
+    Parses a gold file in CoNLL-U or CoNLL-2003 format into a GoldTable.
+    """
+    vocab = dict()
+    rows = []
+    recipe_offsets = [0]
+    edge_counts = []
+    edge_heads = []
+    edge_labels = []
+    with open(gold_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() == "":
+                if len(rows) != recipe_offsets[-1]:
+                    recipe_offsets.append(len(rows))
+                continue
+            columns = line.rstrip("\r\n").split("\t")
+            rows.append([vocab.setdefault(c, len(vocab)) for c in columns])
+            if fmt == "conllu":
+                try:
+                    edges = {int(columns[6]): columns[7]}
+                except IndexError:
+                    raise IndexError(
+                        f"Gold file {gold_file} probably isn't written in CoNLL-U format."
+                    )
+                if len(columns) > 8:
+                    edges.update(parse_deps(columns[8]))
+                edge_counts.append(len(edges))
+                edge_heads.extend(edges.keys())
+                edge_labels.extend(vocab.setdefault(d, len(vocab)) for d in edges.values())
+    if len(rows) != recipe_offsets[-1]:
+        recipe_offsets.append(len(rows))
+
+    width = max((len(r) for r in rows), default=0)
+    codes = np.full((len(rows), width), -1, dtype=np.int32)
+    for i, row in enumerate(rows):
+        codes[i, : len(row)] = row
+    table = GoldTable(
+        vocab=np.array(list(vocab), dtype=str),
+        codes=codes,
+        recipe_offsets=np.asarray(recipe_offsets, dtype=np.int64),
+    )
+    if fmt == "conllu":
+        table.edge_indptr = np.zeros(len(edge_counts) + 1, dtype=np.int64)
+        np.cumsum(edge_counts, out=table.edge_indptr[1:])
+        table.edge_heads = np.asarray(edge_heads, dtype=np.int64)
+        table.edge_labels = np.asarray(edge_labels, dtype=np.int32)
+    return table
+
+
+def _content_hash(gold_file):
+    h = hashlib.sha1()
+    with open(gold_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_file(gold_file, fmt, cache_dir):
+    key = hashlib.sha1(os.path.abspath(gold_file).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.{fmt}.npz")
+
+
+def _save(table, meta, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    arrays = dict(
+        meta=np.array(json.dumps(meta)),
+        vocab=table.vocab,
+        codes=table.codes,
+        recipe_offsets=table.recipe_offsets,
+    )
+    if table.edge_indptr is not None:
+        arrays.update(edge_indptr=table.edge_indptr, edge_heads=table.edge_heads, edge_labels=table.edge_labels)
+    # write to a temporary file first s.t. concurrent evaluations never see a half-written cache
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, cache_file)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def load_gold_table(gold_file, fmt, cache_dir=None, use_cache=True):
+    """
+    Loads a gold file in CoNLL-U (fmt="conllu") or CoNLL-2003 (fmt="conll03") format,
+    from the cache if the cached entry is still valid.
+
+    Returns: a GoldTable
+    """
+    if fmt not in {"conllu", "conll03"}:
+        raise ValueError(f"Unexpected gold file format {fmt}. Valid options are {{conllu, conll03}}.")
+    if not use_cache:
+        return _parse_gold_file(gold_file, fmt)
+
+    cache_dir = cache_dir or default_cache_dir()
+    cache_file = _cache_file(gold_file, fmt, cache_dir)
+    stat = os.stat(gold_file)
+    meta = {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(gold_file),
+        "format": fmt,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as cached:
+                cached_meta = json.loads(str(cached["meta"]))
+                if cached_meta["version"] == CACHE_VERSION and cached_meta["format"] == fmt:
+                    if (cached_meta["size"], cached_meta["mtime_ns"]) == (meta["size"], meta["mtime_ns"]):
+                        return _table_from_npz(cached)
+                    # file was touched: only re-parse if its content actually changed
+                    meta["sha1"] = _content_hash(gold_file)
+                    if cached_meta["sha1"] == meta["sha1"]:
+                        table = _table_from_npz(cached)
+                        _save(table, meta, cache_file)
+                        return table
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            # e.g. a truncated cache file: parse the gold file again and overwrite it
+            logging.warning(f"Ignoring unreadable cache file {cache_file}: {e}")
+
+    logging.info(f"Parsing {gold_file} into the gold cache {cache_file}")
+    if "sha1" not in meta:
+        meta["sha1"] = _content_hash(gold_file)
+    table = _parse_gold_file(gold_file, fmt)
+    try:
+        _save(table, meta, cache_file)
+    except OSError as e:
+        logging.warning(f"Could not write gold cache {cache_file}: {e}")
+    return table
+
+
+def _table_from_npz(cached):
+    table = GoldTable(
+        vocab=cached["vocab"],
+        codes=cached["codes"],
+        recipe_offsets=cached["recipe_offsets"],
+    )
+    if "edge_indptr" in cached:
+        table.edge_indptr = cached["edge_indptr"]
+        table.edge_heads = cached["edge_heads"]
+        table.edge_labels = cached["edge_labels"]
+    return table
+
+
+def infer_format(gold_file):
+    """
+    Returns: the gold file format ("conllu" or "conll03") according to the file extension
+    """
+    if str(gold_file).endswith(".conll03"):
+        return "conll03"
+    elif str(gold_file).endswith(".conllu"):
+        return "conllu"
+    raise RuntimeError(
+        "Gold file format is neither specified nor can be detected. Please specify file format or check your file extensions."
+    )
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Prebuilds (or clears) the cache of parsed gold files used by
+        parser_evaluation.py and error_analysis.py."""
+    )
+    arg_parser.add_argument(
+        "gold_files",
+        metavar="GOLD_FILE",
+        nargs="*",
+        help="""Annotated (gold) files in CoNLL2003 or CoNLL-U format.""",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        metavar="CACHE_DIR",
+        help="""Cache directory. Default: $TAGGER_PARSER_CACHE or ~/.cache/tagger-parser/gold""",
+    )
+    arg_parser.add_argument(
+        "--clear",
+        dest="clear",
+        action="store_true",
+        help="""Delete all cached gold files.""",
+    )
+    args = arg_parser.parse_args()
+
+    cache_dir = args.cache_dir or default_cache_dir()
+    if args.clear:
+        if os.path.isdir(cache_dir):
+            for name in os.listdir(cache_dir):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(cache_dir, name))
+    for gold_file in args.gold_files:
+        table = load_gold_table(gold_file, infer_format(gold_file), cache_dir)
+        print(f"{gold_file}: {len(table)} tokens, {len(table.recipe_offsets) - 1} recipes")
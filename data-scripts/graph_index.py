@@ -0,0 +1,297 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Inverted index over the nodes of the recipe graphs of a CoNLL-U corpus, for queries like
+"all recipes with a T node 'oven' that has a t edge to an Ac node" without reading the graphs.
+
+The corpus is read once (with the node and edge definition of read_graph_from_conllu() in recipe_graph.py).
+Every node is identified by a global ID, the position of its (first) token in the corpus, and gets the terms
+    - label: its text, lower-cased (e.g. "olive oil")
+    - lemma: the lemmas of its tokens, lower-cased, if the corpus has lemmas
+    - type: its node type (e.g. "T"; "O" for heads that are not tagged as nodes)
+    - out: (edge label, type of the head) for every edge from the node to a head
+    - in: (edge label, type of the dependent) for every edge into the node
+Together with the type of the node itself, in and out are the (dependent type, edge label, head type) triples
+of its edges. Edges point from a token to its head, i.e. for "Preheat oven" the edge labelled t goes from
+the T node "oven" to the Ac node "Preheat" (out: t, Ac for "oven"; in: t, T for "Preheat"). Edges into "end"
+are not indexed.
+
+The index is a directory with the sorted term list (terms.json), the postings of all terms as one int64 array
+of sorted global node IDs (postings.npy, term i at term_offsets[i]:term_offsets[i+1]), the token offsets of
+the recipes (recipe_offsets.npy), the recipe names and source files (recipes.json) and meta.json.
+The arrays are memory-mapped, so opening an index only reads the term list, and a conjunctive query intersects
+the postings of its terms, starting with the shortest.
+
+Query with GraphIndex or with find_nodes() / find_recipes() in recipe_graph.py.
+Run this script to build an index (subcommand build) or to query it (subcommand query).
+
+Tested with Python 3.11
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from recipe_graph import _graph_from_rows, _iter_recipe_lines, _recipe_name, _split_lines
+
+FORMAT_VERSION = 1
+
+
+def _term(*parts):
+    return "\t".join(parts)
+
+
+def _node_type(G, node):
+    return G.nodes[node].get("node-type", "O")
+
+
+def _recipe_terms(G, lemmas, offset):
+    """
+    Collects the terms of the nodes of one recipe graph (see module docstring).
+
+    Arguments:
+        - G: graph of the recipe (RecipeGraph or CompactRecipeGraph, read with token IDs)
+        - lemmas: String list with the LEMMA column of the recipe
+        - offset: global ID of the first token of the recipe
+    Returns: generator of (term, global node ID) pairs
+    """
+    for node in G.nodes:
+        if node == "end":
+            continue
+        attributes = G.nodes[node]
+        global_id = offset + node - 1
+        yield _term("type", attributes.get("node-type", "O")), global_id
+        if "label" in attributes:
+            text = attributes["label"].partition("_")[2]
+            yield _term("label", text.lower()), global_id
+            n_tokens = len(text.split(" "))
+            node_lemmas = lemmas[node - 1 : node - 1 + n_tokens]
+            if any(lemma != "_" for lemma in node_lemmas):
+                yield _term("lemma", " ".join(node_lemmas).lower()), global_id
+    for u, v in G.edges:
+        if v == "end":
+            continue
+        label = G.edges[u, v]["label"]
+        yield _term("out", label, _node_type(G, v)), offset + u - 1
+        yield _term("in", label, _node_type(G, u)), offset + v - 1
+
+
+def build_graph_index(conllu_files, out_dir):
+    """
+    Builds the index of the recipes in the given CoNLL-U files (one or more recipes each) in out_dir.
+
+    Returns: the number of indexed recipes
+    """
+    postings = dict()  # term -> list of global node IDs
+    recipes = []
+    recipe_offsets = [0]
+    for file_number, conllu_file in enumerate(conllu_files):
+        stem = os.path.splitext(os.path.basename(conllu_file))[0]
+        with open(conllu_file, "r", encoding="utf-8") as f:
+            for i, (comments, lines) in enumerate(_iter_recipe_lines(f)):
+                name = _recipe_name(comments, f"{stem}_{i}")
+                rows = list(_split_lines(lines))
+                G = _graph_from_rows(rows, True, True, "G_" + name)
+                for term, global_id in _recipe_terms(G, [columns[2] for columns in rows], recipe_offsets[-1]):
+                    postings.setdefault(term, []).append(global_id)
+                recipes.append((file_number, name))
+                recipe_offsets.append(recipe_offsets[-1] + len(rows))
+
+    terms = sorted(postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    arrays = [np.unique(np.asarray(postings[term], dtype=np.int64)) for term in terms]
+    np.cumsum([len(a) for a in arrays], out=term_offsets[1:])
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "postings.npy"), np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64))
+    np.save(os.path.join(out_dir, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(out_dir, "recipe_offsets.npy"), np.asarray(recipe_offsets, dtype=np.int64))
+    with open(os.path.join(out_dir, "terms.json"), "w", encoding="utf-8") as o:
+        json.dump(terms, o, ensure_ascii=False)
+    with open(os.path.join(out_dir, "recipes.json"), "w", encoding="utf-8") as o:
+        json.dump(recipes, o, ensure_ascii=False)
+    meta = {
+        "version": FORMAT_VERSION,
+        "sources": [os.path.abspath(f) for f in conllu_files],
+        "recipes": len(recipes),
+        "terms": len(terms),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as o:
+        json.dump(meta, o, indent=2)
+    return len(recipes)
+
+
+def _pairs(constraint):
+    # a single (edge label, node type) pair or a list of them
+    if constraint is None:
+        return []
+    if len(constraint) == 2 and all(isinstance(part, str) for part in constraint):
+        return [tuple(constraint)]
+    return [tuple(pair) for pair in constraint]
+
+
+class GraphIndex:
+    """
+    Memory-mapped inverted index over the graph nodes of a corpus (see module docstring).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise IOError(f"Unsupported graph index version {self.meta['version']} in {path}.")
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "recipes.json"), encoding="utf-8") as f:
+            self.recipes = [(self.meta["sources"][file_number], name) for file_number, name in json.load(f)]
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"), mmap_mode="r")
+        self.recipe_offsets = np.load(os.path.join(path, "recipe_offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def posting(self, term):
+        """
+        Returns: the sorted global node IDs of a term (a memmap slice; empty for unknown terms)
+        """
+        i = self.terms.get(term)
+        if i is None:
+            return self.postings[:0]
+        return self.postings[self.term_offsets[i] : self.term_offsets[i + 1]]
+
+    def query_terms(self, label=None, lemma=None, node_type=None, incoming=None, outgoing=None):
+        """
+        Returns: the list of terms of a node pattern (see nodes())
+        """
+        terms = []
+        if label is not None:
+            terms.append(_term("label", label.lower()))
+        if lemma is not None:
+            terms.append(_term("lemma", lemma.lower()))
+        if node_type is not None:
+            terms.append(_term("type", node_type))
+        terms.extend(_term("in", *pair) for pair in _pairs(incoming))
+        terms.extend(_term("out", *pair) for pair in _pairs(outgoing))
+        if not terms:
+            raise ValueError("A node pattern needs at least one condition.")
+        return terms
+
+    def nodes(self, label=None, lemma=None, node_type=None, incoming=None, outgoing=None):
+        """
+        Finds the nodes that fulfill all given conditions.
+
+        Arguments:
+            - label, lemma: the text or the lemmas of the node (case-insensitive)
+            - node_type: the node type, e.g. "T"
+            - incoming: an (edge label, node type) pair, or a list of them, for edges from nodes of that type
+              into the node, e.g. ("t", "T") for an Ac node with a tool
+            - outgoing: the same for edges from the node to its heads, e.g. ("t", "Ac") for a tool used by an action
+        Returns: a sorted int64 array with the global IDs of the nodes (see locate())
+        """
+        postings = sorted(
+            (self.posting(term) for term in self.query_terms(label, lemma, node_type, incoming, outgoing)), key=len
+        )
+        result = np.asarray(postings[0])
+        for posting in postings[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def recipe_numbers(self, global_ids):
+        """
+        Returns: the (sorted, unique) numbers of the recipes that contain the given nodes
+        """
+        return np.unique(np.searchsorted(self.recipe_offsets, global_ids, side="right") - 1)
+
+    def locate(self, global_ids):
+        """
+        Returns: a list of (conllu file, recipe name, node ID) triples for the given global node IDs
+        """
+        global_ids = np.asarray(global_ids, dtype=np.int64)
+        numbers = np.searchsorted(self.recipe_offsets, global_ids, side="right") - 1
+        node_ids = global_ids - np.asarray(self.recipe_offsets)[numbers] + 1
+        return [self.recipes[r] + (node,) for r, node in zip(numbers.tolist(), node_ids.tolist())]
+
+    def find_recipes(self, *patterns):
+        """
+        Finds the recipes that have a node for every pattern (not necessarily different nodes).
+
+        Arguments:
+            - patterns: dictionaries with the keyword arguments of nodes(), e.g.
+              {"label": "oven", "node_type": "T", "outgoing": ("t", "Ac")}
+        Returns: a list of (conllu file, recipe name) pairs, in corpus order
+        """
+        if not patterns:
+            raise ValueError("Give at least one node pattern.")
+        numbers = None
+        for pattern in patterns:
+            recipe_numbers = self.recipe_numbers(self.nodes(**pattern))
+            numbers = recipe_numbers if numbers is None else np.intersect1d(numbers, recipe_numbers, assume_unique=True)
+        return [self.recipes[r] for r in numbers.tolist()]
+
+
+def _edge_pair(value):
+    # "t:Ac" -> ("t", "Ac")
+    label, sep, node_type = value.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected EDGE_LABEL:NODE_TYPE, got {value}")
+    return label, node_type
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Builds or queries an inverted index over the graph nodes of CoNLL-U corpora.""")
+    subcommands = arg_parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subcommands.add_parser("build", help="""Index CoNLL-U files.""")
+    build_parser.add_argument("inputs", metavar="CONLLU_FILE", nargs="+",
+                              help="""CoNLL-U files with one or more recipe graphs, e.g. train.conllu.""")
+    build_parser.add_argument("-o", "--output", dest="index_dir", metavar="INDEX_DIR", required=True,
+                              help="""Output directory of the index.""")
+
+    query_parser = subcommands.add_parser(
+        "query", help="""Print the nodes (and recipes) matching all given conditions.""")
+    query_parser.add_argument("index_dir", metavar="INDEX_DIR", help="""Directory of the index.""")
+    query_parser.add_argument("--label", help="""Text of the node (case-insensitive).""")
+    query_parser.add_argument("--lemma", help="""Lemmas of the node (case-insensitive).""")
+    query_parser.add_argument("--type", dest="node_type", help="""Node type, e.g. T.""")
+    query_parser.add_argument("--in", dest="incoming", metavar="EDGE_LABEL:NODE_TYPE", action="append",
+                              type=_edge_pair, help="""Edge from a node of the given type into the node, e.g. t:T. Repeatable.""")
+    query_parser.add_argument("--out", dest="outgoing", metavar="EDGE_LABEL:NODE_TYPE", action="append",
+                              type=_edge_pair, help="""Edge from the node to a head of the given type, e.g. t:Ac. Repeatable.""")
+    query_parser.add_argument("--recipes", dest="recipes_only", action="store_true",
+                              help="""Only print the matching recipes.""")
+
+    args = arg_parser.parse_args()
+
+    if args.command == "build":
+        n_recipes = build_graph_index(args.inputs, args.index_dir)
+        print(f"{n_recipes} recipes indexed in {args.index_dir}")
+    else:
+        index = GraphIndex(args.index_dir)
+        pattern = dict(label=args.label, lemma=args.lemma, node_type=args.node_type,
+                       incoming=args.incoming, outgoing=args.outgoing)
+        if args.recipes_only:
+            for conllu_file, name in index.find_recipes(pattern):
+                print(f"{conllu_file}\t{name}")
+        else:
+            for conllu_file, name, node in index.locate(index.nodes(**pattern)):
+                print(f"{conllu_file}\t{name}\t{node}")
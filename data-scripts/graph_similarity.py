@@ -0,0 +1,291 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Structural similarity index: finds the recipes whose action graphs (or FAT graphs) are most similar
+to a query graph, without comparing the query to every recipe of the corpus.
+
+1. Features: every graph is reduced with generate_reduced_graph() (recipe_graph.py) and described by the
+   multiset of its Weisfeiler-Lehman subtree labels. A node starts with its node type (e.g. Ac, At, F);
+   in each iteration, its new label is the hash of its label and the sorted (direction, edge label,
+   label) triples of its neighbours. The labels of all iterations are the features of the graph;
+   repeated labels are numbered, s.t. the Jaccard similarity of two feature sets takes counts into account.
+   Labels are hashed with blake2b (32 bit), so features do not depend on the Python hash seed.
+2. MinHash: the feature set is compressed into a signature of num_perm minima of random multiply-shift
+   hash functions; the share of equal minima of two signatures estimates the Jaccard similarity of their sets.
+3. LSH: the signatures are cut into bands of rows; recipes with an identical band share a bucket. A query
+   only looks at the recipes in its buckets (pairs with Jaccard similarity s become candidates with
+   probability 1 - (1 - s^rows)^bands) and ranks them by their estimated similarity.
+
+The index is a directory with the signatures (signatures.npy), the recipe names and source files
+(recipes.json) and its parameters (meta.json); the buckets are rebuilt when it is loaded.
+Run this script to build an index (subcommand build) or to query it (subcommand query).
+
+Tested with Python 3.11
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from recipe_graph import action_labels, fat_labels, generate_reduced_graph, iter_graphs_from_conllu
+
+FORMAT_VERSION = 1
+GRAPH_TYPES = {"action": action_labels, "fat": fat_labels}
+# signature value of empty feature sets (larger than every hash value)
+_EMPTY = np.uint64(1 << 32)
+
+
+def _hash32(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def wl_features(G, iterations=2):
+    """
+    Computes the Weisfeiler-Lehman features of a (reduced) graph (see module docstring); the node "end" is ignored.
+
+    Arguments:
+        - G: a RecipeGraph or CompactRecipeGraph
+        - iterations: number of WL iterations (0: node types only)
+    Returns: a sorted uint32 array with the distinct features
+    """
+    nodes = [node for node in G.nodes if node != "end"]
+    positions = {node: i for i, node in enumerate(nodes)}
+    neighbours = [[] for _ in nodes]  # (direction, edge label, neighbour position)
+    for u, v in G.edges:
+        if u in positions and v in positions:
+            label = G.edges[u, v].get("label", "")
+            neighbours[positions[u]].append((">", label, positions[v]))
+            neighbours[positions[v]].append(("<", label, positions[u]))
+
+    labels = [str(G.nodes[node].get("node-type", "O")) for node in nodes]
+    features = []
+    for iteration in range(iterations + 1):
+        if iteration > 0:
+            labels = [
+                str(_hash32(labels[i] + "|" + ";".join(
+                    sorted(f"{direction}{edge_label}:{labels[j]}" for direction, edge_label, j in neighbours[i])
+                )))
+                for i in range(len(nodes))
+            ]
+        counts = dict()
+        for label in labels:
+            counts[label] = counts.get(label, 0) + 1
+            features.append(_hash32(f"{iteration}|{label}|{counts[label]}"))
+    return np.unique(np.asarray(features, dtype=np.uint32))
+
+
+def _graph_name(G):
+    # recipe name from the origin ("G_" + name) of the first node
+    for node in G.nodes:
+        return G.nodes[node].get("origin", "G_")[2:]
+    return ""
+
+
+class MinHasher:
+    """
+    num_perm random multiply-shift hash functions h(x) = ((a * x + b) mod 2^64) >> 32 over 32-bit features,
+    with random odd a and random b. (Linear hash functions modulo a prime much larger than a * x, e.g.
+    2^61 - 1, are not random enough for 32-bit a and x: their minimum mostly falls on the smallest x.)
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        generator = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.seed = seed
+        self.a = generator.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = generator.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, features):
+        """
+        Returns: the MinHash signature of a feature array (uint64, num_perm values; all 2^32 if it is empty)
+        """
+        if len(features) == 0:
+            return np.full(self.num_perm, _EMPTY, dtype=np.uint64)
+        x = np.asarray(features, dtype=np.uint64)
+        # uint64 arithmetic wraps around, i.e. computes mod 2^64
+        return ((np.outer(x, self.a) + self.b) >> np.uint64(32)).min(axis=0)
+
+
+class SimilarityIndex:
+    """
+    MinHash/LSH index over the structure of recipe graphs (see module docstring).
+    """
+
+    def __init__(self, graph_type="action", iterations=2, num_perm=128, bands=32, seed=1):
+        if graph_type not in GRAPH_TYPES:
+            raise ValueError(f"Unexpected graph type {graph_type}. Valid options are {{{', '.join(GRAPH_TYPES)}}}.")
+        if num_perm % bands != 0:
+            raise ValueError(f"The number of permutations ({num_perm}) must be a multiple of the number of bands ({bands}).")
+        self.graph_type = graph_type
+        self.iterations = iterations
+        self.bands = bands
+        self.hasher = MinHasher(num_perm, seed)
+        self.recipes = []  # (conllu file, recipe name) pairs
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint64)
+        self.buckets = [dict() for _ in range(bands)]  # band key (bytes) -> list of recipe numbers
+        self._pending = []
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def graph_signature(self, G, reduce=True):
+        """
+        Returns: the MinHash signature of a recipe graph (reduced to the index's graph type first, unless reduce=False)
+        """
+        if reduce:
+            G = generate_reduced_graph(G, GRAPH_TYPES[self.graph_type])
+        return self.hasher.signature(wl_features(G, self.iterations))
+
+    def _band_keys(self, signature):
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def add(self, signature, conllu_file, name):
+        """
+        Adds the signature of a recipe to the index.
+        """
+        number = len(self.recipes)
+        self.recipes.append((conllu_file, name))
+        self._pending.append(signature)
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            buckets.setdefault(key, []).append(number)
+
+    def add_conllu(self, conllu_file):
+        """
+        Adds all recipes of a CoNLL-U file (one or more recipes).
+
+        Returns: the number of recipes added
+        """
+        n_recipes = 0
+        for G in iter_graphs_from_conllu(conllu_file, compact=True):
+            self.add(self.graph_signature(G), os.path.abspath(conllu_file), _graph_name(G))
+            n_recipes += 1
+        return n_recipes
+
+    def _all_signatures(self):
+        if self._pending:
+            self.signatures = np.vstack([self.signatures] + self._pending)
+            self._pending = []
+        return self.signatures
+
+    def candidates(self, signature):
+        """
+        Returns: the sorted numbers of all recipes that share at least one bucket with the signature
+        """
+        found = set()
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            found.update(buckets.get(key, ()))
+        return sorted(found)
+
+    def query_signature(self, signature, k=10):
+        """
+        Returns: a list of up to k (conllu file, recipe name, estimated Jaccard similarity) triples, most similar first;
+            only recipes that share a bucket with the signature are considered
+        """
+        candidates = self.candidates(signature)
+        if not candidates:
+            return []
+        similarity = (self._all_signatures()[candidates] == signature).mean(axis=1)
+        # stable sort: ties in corpus order
+        best = np.argsort(-similarity, kind="stable")[:k]
+        return [self.recipes[candidates[i]] + (float(similarity[i]),) for i in best.tolist()]
+
+    def query(self, G, k=10):
+        """
+        Returns: the top k structurally similar recipes to recipe graph G (see query_signature)
+        """
+        return self.query_signature(self.graph_signature(G), k)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "signatures.npy"), self._all_signatures())
+        with open(os.path.join(path, "recipes.json"), "w", encoding="utf-8") as o:
+            json.dump(self.recipes, o, ensure_ascii=False)
+        meta = {
+            "version": FORMAT_VERSION,
+            "graph_type": self.graph_type,
+            "iterations": self.iterations,
+            "num_perm": self.hasher.num_perm,
+            "bands": self.bands,
+            "seed": self.hasher.seed,
+            "recipes": len(self.recipes),
+        }
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as o:
+            json.dump(meta, o, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise IOError(f"Unsupported similarity index version {meta['version']} in {path}.")
+        index = cls(meta["graph_type"], meta["iterations"], meta["num_perm"], meta["bands"], meta["seed"])
+        with open(os.path.join(path, "recipes.json"), encoding="utf-8") as f:
+            recipes = [tuple(recipe) for recipe in json.load(f)]
+        signatures = np.load(os.path.join(path, "signatures.npy"))
+        index.recipes = recipes
+        index.signatures = signatures
+        rows = signatures.shape[1] // index.bands
+        for band, buckets in enumerate(index.buckets):
+            keys = np.ascontiguousarray(signatures[:, band * rows : (band + 1) * rows])
+            for number, key in enumerate(keys):
+                buckets.setdefault(key.tobytes(), []).append(number)
+        return index
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Builds or queries a MinHash/LSH index over the structure of recipe graphs.""")
+    subcommands = arg_parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subcommands.add_parser("build", help="""Index the recipes of CoNLL-U files.""")
+    build_parser.add_argument("inputs", metavar="CONLLU_FILE", nargs="+",
+                              help="""CoNLL-U files with one or more recipe graphs, e.g. train.conllu.""")
+    build_parser.add_argument("-o", "--output", dest="index_dir", metavar="INDEX_DIR", required=True,
+                              help="""Output directory of the index.""")
+    build_parser.add_argument("-t", "--type", dest="graph_type", choices=list(GRAPH_TYPES), default="action",
+                              help="""Graph type the recipes are reduced to. Default: action""")
+    build_parser.add_argument("--iterations", type=int, default=2,
+                              help="""Number of Weisfeiler-Lehman iterations. Default: 2""")
+    build_parser.add_argument("--num-perm", dest="num_perm", type=int, default=128,
+                              help="""Length of the MinHash signatures. Default: 128""")
+    build_parser.add_argument("--bands", type=int, default=32,
+                              help="""Number of LSH bands (must divide --num-perm). Default: 32""")
+
+    query_parser = subcommands.add_parser(
+        "query", help="""Print the most similar indexed recipes for every recipe of a CoNLL-U file.""")
+    query_parser.add_argument("index_dir", metavar="INDEX_DIR", help="""Directory of the index.""")
+    query_parser.add_argument("query_file", metavar="CONLLU_FILE",
+                              help="""CoNLL-U file with one or more (full) recipe graphs.""")
+    query_parser.add_argument("-k", dest="k", type=int, default=10,
+                              help="""Number of similar recipes per query. Default: 10""")
+
+    args = arg_parser.parse_args()
+
+    if args.command == "build":
+        similarity_index = SimilarityIndex(args.graph_type, args.iterations, args.num_perm, args.bands)
+        n_recipes = sum(similarity_index.add_conllu(conllu_file) for conllu_file in args.inputs)
+        similarity_index.save(args.index_dir)
+        print(f"{n_recipes} recipes indexed in {args.index_dir}")
+    else:
+        similarity_index = SimilarityIndex.load(args.index_dir)
+        for G in iter_graphs_from_conllu(args.query_file, compact=True):
+            print(f"# {_graph_name(G)}")
+            for conllu_file, name, similarity in similarity_index.query(G, args.k):
+                print(f"{similarity:.3f}\t{conllu_file}\t{name}")
+            print()
@@ -0,0 +1,425 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Binary store for many recipe graphs in one file, with lazy loading of individual graphs.
+
+A store file (little-endian, all arrays aligned to 8 bytes) consists of
+    - a header (64 bytes): magic, format version, number of graphs and strings, and the positions of
+      the string table and the table of contents
+    - one block per graph with the arrays of a CompactRecipeGraph (see recipe_graph.py): a small block
+      header, the node IDs (int64, "end" as -1), the successors in CSR style (uint32 indptr and indices),
+      the names and codes (int32, -1: missing) of the node and edge attributes and the codes of the
+      recipe text, UPOS and MISC columns (if the graph has them)
+    - the string table shared by all graphs: uint64 offsets into one UTF-8 blob; every attribute value,
+      attribute name, token and graph name is stored once (values that are not strings, e.g. the integer
+      labels of graphs read without token IDs or the origins of consolidated graphs, as JSON; lists are
+      read back as tuples)
+    - the table of contents: byte offset, length and name (string code) of every graph block
+Opening a store only reads the header and memory-maps the file; the table of contents and the strings
+are read on demand, so opening takes the same time for a million graphs as for ten. graph(i) reads only
+block i and the strings it uses.
+
+append_graphs() writes new blocks behind the existing ones and then a new string table and table of
+contents; the header is updated last, so the store stays readable if appending fails. The previous tables
+remain in the file as unused bytes, so graphs should be appended in bulk rather than one by one.
+
+Run this script to convert CoNLL-U files into a store (subcommand build), to extract a graph (subcommand extract)
+or to run the test scenario (subcommand test).
+
+Tested with Python 3.11
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from recipe_graph import TEST_RECIPE, CompactRecipeGraph, iter_graphs_from_conllu, write_graph_to_simple_conllu
+
+MAGIC = b"RGSTORE\x00"
+FORMAT_VERSION = 1
+# magic, version, unused, number of graphs, number of strings, position of the string table,
+# position of the table of contents, end of the table of contents
+_HEADER = struct.Struct("<8sIIQQQQQ")
+_HEADER_SIZE = 64
+# number of nodes, edges, tokens, node attributes, edge attributes; flags: which token columns are stored
+_BLOCK_HEADER = struct.Struct("<IIIHHI")
+TOKEN_COLUMNS = ("recipe_text", "upos", "misc")
+TOC_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u8"), ("name", "<i8")])
+# prefix of values stored as JSON
+_JSON = "\x00"
+
+
+def _padding(n):
+    return -n % 8
+
+
+def _encode_value(value):
+    return value if isinstance(value, str) else _JSON + json.dumps(value, ensure_ascii=False)
+
+
+def _as_tuples(value):
+    return tuple(_as_tuples(v) for v in value) if isinstance(value, list) else value
+
+
+def _decode_value(text):
+    return _as_tuples(json.loads(text[1:])) if text.startswith(_JSON) else text
+
+
+def _graph_name(G):
+    # recipe name from the origin ("G_" + name) of the first node that has one
+    for _, attributes in G.nodes.data():
+        origin = attributes.get("origin")
+        if isinstance(origin, str):
+            return origin[2:] if origin.startswith("G_") else origin
+    return ""
+
+
+class _StringTable:
+    """
+    Interning of the strings of a store that is being written.
+    """
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self.codes = {s: i for i, s in enumerate(self.strings)}
+
+    def code(self, value):
+        value = _encode_value(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def codes_of(self, values):
+        """
+        Returns: an int32 array with the codes of all values of an attribute table
+        """
+        return np.asarray([self.code(v) for v in values], dtype=np.int32)
+
+    def to_bytes(self):
+        data = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros(len(data) + 1, dtype="<u8")
+        np.cumsum([len(d) for d in data], out=offsets[1:])
+        blob = b"".join(data)
+        return offsets.tobytes() + blob + bytes(_padding(len(blob)))
+
+
+def _encode_graph(G, strings):
+    """
+    Returns: the block of a graph (see module docstring) as bytes
+    """
+    if not isinstance(G, CompactRecipeGraph):
+        G = CompactRecipeGraph.from_recipe_graph(G)
+    parts = []
+
+    def add(array, dtype):
+        data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+        parts.append(data + bytes(_padding(len(data))))
+
+    columns = [getattr(G, name, None) for name in TOKEN_COLUMNS]
+    flags = sum(1 << j for j, column in enumerate(columns) if column is not None)
+    n_tokens = max((len(column) for column in columns if column is not None), default=0)
+    tables = (G.node_attributes, G.edge_attributes)
+    header = _BLOCK_HEADER.pack(len(G.node_ids), len(G.indices), n_tokens, len(tables[0].names), len(tables[1].names), flags)
+    parts.append(header + bytes(_padding(len(header))))
+    add(G.node_ids, "<i8")
+    add(G.indptr, "<u4")
+    add(G.indices, "<u4")
+    for table in tables:
+        add([strings.code(name) for name in table.names], "<i4")
+        for name in table.names:
+            # attribute codes -> string codes
+            values = np.append(strings.codes_of(table.values[name]), np.int32(-1))
+            add(values[table.codes[name]], "<i4")
+    for column in columns:
+        if column is not None:
+            if len(column) != n_tokens:
+                raise ValueError("The recipe text, UPOS and MISC columns of a graph must have the same length.")
+            add(strings.codes_of(column), "<i4")
+    return b"".join(parts)
+
+
+class GraphStore:
+    """
+    Read-only, memory-mapped graph store (see module docstring). Graphs are addressed by their number
+    (in the order they were written) or by name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise IOError(f"{path} is not a graph store.")
+        magic, version, _, self.n_graphs, self.n_strings, self._strings_pos, self._toc_pos, self._end = \
+            _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise IOError(f"{path} is not a graph store.")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise IOError(f"Unsupported graph store version {version} in {path}.")
+        self._string_offsets = np.frombuffer(self._map, dtype="<u8", count=self.n_strings + 1, offset=self._strings_pos)
+        self._blob_pos = self._strings_pos + 8 * (self.n_strings + 1)
+        self.toc = np.frombuffer(self._map, dtype=TOC_DTYPE, count=self.n_graphs, offset=self._toc_pos)
+        self._names = None
+
+    def close(self):
+        # arrays viewing the map must be released before it can be closed
+        self._string_offsets = self.toc = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.n_graphs
+
+    def _raw_string(self, code):
+        start, end = self._string_offsets[code : code + 2].tolist()
+        return self._map[self._blob_pos + start : self._blob_pos + end].decode("utf-8")
+
+    def string(self, code):
+        """
+        Returns: the string (or decoded JSON value) with the given code
+        """
+        return _decode_value(self._raw_string(code))
+
+    def strings(self, codes):
+        """
+        Returns: the list of the values of an array of codes
+        """
+        unique, inverse = np.unique(codes, return_inverse=True)
+        decoded = [self.string(code) for code in unique.tolist()]
+        return [decoded[i] for i in inverse.reshape(-1).tolist()]
+
+    def name(self, i):
+        return self.string(int(self.toc[i]["name"]))
+
+    @property
+    def names(self):
+        """
+        Dictionary from graph name to graph number (built on first use; for duplicate names, the last graph)
+        """
+        if self._names is None:
+            names = self.strings(self.toc["name"]) if self.n_graphs else []
+            self._names = {name: i for i, name in enumerate(names)}
+        return self._names
+
+    def graph(self, key, compact=False):
+        """
+        Loads one graph.
+
+        Arguments:
+            - key: number or name of the graph
+            - compact: return a CompactRecipeGraph instead of a RecipeGraph
+        """
+        i = self.names[key] if isinstance(key, str) else key
+        if not -self.n_graphs <= i < self.n_graphs:
+            raise IndexError(f"Graph number {i} out of range.")
+        offset = int(self.toc[i]["offset"])
+        n_nodes, n_edges, n_tokens, n_node_attributes, n_edge_attributes, flags = \
+            _BLOCK_HEADER.unpack_from(self._map, offset)
+        offset += _BLOCK_HEADER.size + _padding(_BLOCK_HEADER.size)
+
+        def read(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset).copy()
+            offset += array.nbytes + _padding(array.nbytes)
+            return array
+
+        node_ids = read("<i8", n_nodes)
+        indptr = read("<u4", n_nodes + 1).astype(np.int64)
+        indices = read("<u4", n_edges).astype(np.int64)
+        attributes = []
+        for n_attributes, length in ((n_node_attributes, n_nodes), (n_edge_attributes, n_edges)):
+            names = self.strings(read("<i4", n_attributes))
+            codes, values = dict(), dict()
+            for name in names:
+                string_codes = read("<i4", length)
+                present = string_codes >= 0
+                unique, local = np.unique(string_codes[present], return_inverse=True)
+                codes[name] = np.full(length, -1, dtype=np.int32)
+                codes[name][present] = local.reshape(-1)
+                values[name] = [self.string(code) for code in unique.tolist()]
+            attributes.extend([codes, values])
+        G = CompactRecipeGraph.from_arrays(node_ids, indptr, indices, *attributes)
+        for j, column in enumerate(TOKEN_COLUMNS):
+            if flags >> j & 1:
+                setattr(G, column, self.strings(read("<i4", n_tokens)))
+        return G if compact else G.to_recipe_graph()
+
+    def __getitem__(self, key):
+        return self.graph(key)
+
+    def __iter__(self):
+        for i in range(self.n_graphs):
+            yield self.graph(i)
+
+
+def append_graphs(path, graphs, names=None):
+    """
+    Appends graphs to a store (see module docstring); creates the store if it does not exist.
+
+    Arguments:
+        - graphs: iterable of RecipeGraphs or CompactRecipeGraphs
+        - names: optional iterable of graph names; default: the origin of the nodes without "G_"
+    Returns: the number of graphs appended
+    """
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with GraphStore(path) as store:
+            # stored form: JSON values must not be decoded
+            strings = _StringTable(store._raw_string(code) for code in range(store.n_strings))
+            toc = [tuple(entry) for entry in store.toc.tolist()]
+            start = store._end
+        mode = "r+b"
+    else:
+        strings = _StringTable()
+        toc = []
+        start = _HEADER_SIZE
+        mode = "w+b"
+
+    n_appended = 0
+    names = iter(names) if names is not None else None
+    with open(path, mode) as o:
+        if mode == "w+b":
+            o.write(bytes(_HEADER_SIZE))
+        o.seek(start)
+        position = start
+        for G in graphs:
+            name = next(names) if names is not None else _graph_name(G)
+            block = _encode_graph(G, strings)
+            o.write(block)
+            toc.append((position, len(block), strings.code(name)))
+            position += len(block)
+            n_appended += 1
+        strings_pos = position
+        string_data = strings.to_bytes()
+        o.write(string_data)
+        toc_pos = strings_pos + len(string_data)
+        toc_data = np.array(toc, dtype=TOC_DTYPE).tobytes()
+        o.write(toc_data)
+        end = toc_pos + len(toc_data)
+        o.flush()
+        os.fsync(o.fileno())
+        # the new tables become valid with the header
+        o.seek(0)
+        o.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(toc), len(strings.strings), strings_pos, toc_pos, end))
+        o.truncate(end)
+    return n_appended
+
+
+def write_graph_store(path, graphs, names=None):
+    """
+    Writes graphs into a new store (an existing file is replaced).
+
+    Returns: the number of graphs written
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    return append_graphs(path, graphs, names)
+
+
+## Test ##
+
+def _graph_items(G):
+    return dict(G.nodes.data()), {(u, v): attributes for u, v, attributes in G.edges.data()}
+
+
+def run_test(conllu_file=TEST_RECIPE, n_recipes=5):
+    """
+    Test scenario: writes the consolidated graph of the first recipes of a CoNLL-U file (with non-string
+    values: origins and counts) into a temporary store, appends the recipes and the consolidated graph again
+    and checks that all graphs are read back unchanged.
+    """
+    from consolidate_graphs import consolidate_graphs
+
+    graphs = []
+    for G in iter_graphs_from_conllu(conllu_file, compact=True):
+        graphs.append(G)
+        if len(graphs) == n_recipes:
+            break
+    C = consolidate_graphs(graphs, compact=True)
+    expected = [C] + graphs + [C]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.store")
+        write_graph_store(path, [C], ["consolidated"])
+        append_graphs(path, graphs)
+        append_graphs(path, [C], ["consolidated_again"])
+        with GraphStore(path) as store:
+            assert len(store) == len(expected), f"{len(store)} graphs instead of {len(expected)}"
+            for i, G in enumerate(expected):
+                assert _graph_items(store.graph(i, compact=True)) == _graph_items(G), f"graph {i} differs"
+            assert _graph_items(store["consolidated_again"]) == _graph_items(C.to_recipe_graph())
+    print(f"{len(expected)} graphs written, appended and read back unchanged")
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Converts CoNLL-U recipe graphs into a binary graph store or extracts graphs from it.""")
+    subcommands = arg_parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subcommands.add_parser("build", help="""Write the recipes of CoNLL-U files into a store.""")
+    build_parser.add_argument("inputs", metavar="CONLLU_FILE", nargs="+",
+                              help="""CoNLL-U files with one or more recipe graphs.""")
+    build_parser.add_argument("-o", "--output", dest="store", metavar="STORE_FILE", required=True,
+                              help="""Graph store file.""")
+    build_parser.add_argument("--append", dest="append", action="store_true",
+                              help="""Append to an existing store instead of replacing it.""")
+
+    extract_parser = subcommands.add_parser("extract", help="""Write one graph of a store as CoNLL-U.""")
+    extract_parser.add_argument("store", metavar="STORE_FILE", help="""Graph store file.""")
+    extract_parser.add_argument("graph", metavar="GRAPH", help="""Name or number of the graph.""")
+    extract_parser.add_argument("-o", "--output", dest="out", metavar="OUTPUT_FILE", required=True,
+                                help="""Output file.""")
+    extract_parser.add_argument("-f", "--format", dest="format", choices=["conllu", "simple"], default="conllu",
+                                help="""Output format: CoNLL-U with the full recipe text or the simplified format
+                                with graph nodes only. Default: conllu""")
+
+    test_parser = subcommands.add_parser(
+        "test", help="""Test scenario: write, append and read back a consolidated graph and recipes.""")
+    test_parser.add_argument("recipes", metavar="CONLLU_FILE", nargs="?", default=TEST_RECIPE,
+                             help="""CoNLL-U file with one or more recipe graphs. Default: recipe.conllu next to
+                             recipe_graph.py""")
+
+    args = arg_parser.parse_args()
+
+    if args.command == "build":
+        graphs = (G for conllu_file in args.inputs for G in iter_graphs_from_conllu(conllu_file, compact=True))
+        n_graphs = (append_graphs if args.append else write_graph_store)(args.store, graphs)
+        print(f"{n_graphs} graphs written to {args.store}")
+    elif args.command == "test":
+        run_test(args.recipes)
+    else:
+        with GraphStore(args.store) as store:
+            key = int(args.graph) if args.graph.isdigit() and args.graph not in store.names else args.graph
+            G = store.graph(key, compact=True)
+        if args.format == "simple":
+            write_graph_to_simple_conllu(G, args.out)
+        else:
+            G.write_to_conll(args.out)
@@ -34,170 +34,156 @@ References:
 """
 
 import argparse
+import itertools
 import json
-from ast import literal_eval
 import logging
 
 
-def read_prediction_tokens(pred_file):
+def iter_prediction_records(pred_file):
     """
-    Reads in the tokens from the tagger's output file.
-
-    Returns: a String list
-    """
-    tokens = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            tokens.extend(j["words"])
-    return tokens
-
-
-def read_prediction_tags(pred_file):
+    Streams the prediction file generated by our tagger or parser (i.e. json file), either in the
+    original AllenNLP format or in the lean format (see lean_predictions.py).
+    Every line (i.e. every recipe) is decoded exactly once and only one recipe is held
+    in memory at a time.
+
+    Yields: one dictionary per recipe with the keys
+        - words: a String list with the tokens
+        - tags: a String list with the predicted tags from the tagger's output file. Or the
+                tags used as part of the input for the parser.
+        - heads: a String list with the predicted heads (None for tagger output)
+        - deps: a String list with the predicted dependency names (None for tagger output)
+        - model_type: the source of the data, i.e. "tagger" or "parser"
+        - scores_offset: the recipe's first row in the score sidecar of a lean file (None otherwise)
     """
-    Reads in the predicted tags from the tagger's output file. Or the
-    tags used as part of the input for the parser.
-    Also determines the source of the data, i.e. whether it was
-    generated by the tagger or the parser.
-
-    Returns: a String list with the predicted tags.
-    """
-    model_type = None
-    tags = []
     with open(pred_file, encoding="utf-8") as f:
         for line in f:
+            if not line.strip():
+                continue
             j = json.loads(line)
-            try:
-                tags.extend(j["tags"])
-                model_type = "tagger"
-            except KeyError:
-                tags.extend(j["pos"])
-                model_type = "parser"
-    return tags, model_type
-
-
-def read_prediction_dependencies(pred_file):
-    """
-    Reads in the predictions from the parser's output file.
-
-    Returns: two String list with the predicted heads and dependency names, respectively.
+            if "predicted_heads" in j:
+                # AllenNLP parser output
+                tags = j["pos"]
+                heads = j["predicted_heads"]
+                deps = j["predicted_dependencies"]
+            elif "heads" in j:
+                # lean parser output
+                tags = j["tags"]
+                heads = j["heads"]
+                deps = j["deprels"]
+            else:
+                # AllenNLP or lean tagger output
+                yield {
+                    "words": j["words"],
+                    "tags": j["tags"],
+                    "heads": None,
+                    "deps": None,
+                    "model_type": "tagger",
+                    "scores_offset": j.get("scores_offset"),
+                }
+                continue
+            yield {
+                "words": j["words"],
+                "tags": tags,
+                "heads": list(map(str, heads)),
+                "deps": deps,
+                "model_type": "parser",
+                "scores_offset": j.get("scores_offset"),
+            }
+
+
+def _conllu_lines(record, offset=0):
     """
-    heads = []
-    deps = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            heads.extend(j["predicted_heads"])
-            deps.extend(j["predicted_dependencies"])
-    heads = list(map(str, heads))
-    return heads, deps
+    Compiles the CoNLL-U lines for one recipe record (see iter_prediction_records).
+    Domain-specific tags are required; heads and deps are only realised for parser records.
+    Tagger tokens are annotated with HEAD = 0 and DEPREL = root, so the parser's
+    dataset reader can read in the file without errors.
 
-def taggingcolumns2conllu(outfile, tokens, tags, pos_tags=None, filemode="w"):
-    """
-    Takes tokens and tags and writes them into a tsv file in CoNLL-U format.
-    Domain-specific tags are required, POS tags are optional.
     CoNLL-U columns: ID FORM LEMMA UPOS XPOS FEATS HEAD DEPREL DEPS MISC
 
-    All tokens are annotated with HEAD = 0 and DEPREL = root, so the parser's
-    dataset reader can read in the file without errors.
+    Returns: a String with one token per line
     """
-
+    tokens = record["words"]
+    tags = record["tags"]
+    heads = record["heads"]
+    deps = record["deps"]
     # double-check input
+    if heads is None:
+        if len(tokens) != len(tags):
+            raise ValueError(
+                f"Will not zip tokens and tags: number of tokens in tokens and "
+                f"number of tags in tags must be the same. "
+                f"Got {len(tokens)} and {len(tags)}."
+            )
+        # need to start counting from 1 bc 0 is used for None-node
+        return "".join(
+            f"{i}\t{_token}\t_\t_\t{_tag}\t_\t0\troot\t_\t_\n"
+            for (i, (_token, _tag)) in enumerate(zip(tokens, tags), start=offset + 1)
+        )
     if len(tokens) != len(tags):
         raise ValueError(
-            "Will not zip tokens and tags: number of tokens in tokens and "
-            "number of tags in tags must be the same. Got ",
-            len(tokens),
-            "and",
-            len(tags),
+            f"Will not zip tokens, tags, heads and deps: number of tokens "
+            f"in tokens and number of tags in tags must be the same. "
+            f"Got {len(tokens)}, {len(tags)}, {len(heads)} and {len(deps)}."
         )
-    # write file: one token per line
-    with open(outfile, filemode, encoding="utf-8") as o:
-        if pos_tags:
-            for (i, (_token, _pos, _tag)) in enumerate(zip(tokens, pos_tags, tags)):
-                # need to start counting from 1 bc 0 is used for None-node
-                o.write(
-                    str(i + 1)
-                    + "\t"
-                    + _token
-                    + "\t_\t"
-                    + _pos
-                    + "\t"
-                    + _tag
-                    + "\t_\t0\troot\t_\t_"
-                )
-                o.write("\n")
-            o.write("\n")
-        else:
-            for (i, (_token, _tag)) in enumerate(zip(tokens, tags)):
-                # need to start counting from 1 bc 0 is used for None-node
-                o.write(
-                    str(i + 1)
-                    + "\t"
-                    + _token
-                    + "\t_\t_\t"
-                    + _tag
-                    + "\t_\t0\troot\t_\t_"
-                )
-                o.write("\n")
-            o.write("\n")
+    return "".join(
+        f"{i}\t{_token}\t_\t_\t{_tag}\t_\t{_head}\t{_dep}\t_\t_\n"
+        for (i, (_token, _tag, _head, _dep)) in enumerate(
+            zip(tokens, tags, heads, deps), start=offset + 1
+        )
+    )
 
 
-def parsercolumns2conllu(outfile, tokens, tags, heads, deps, pos_tags=None, filemode="w"):
+def records2conllu(records, outfile, multi_mode=False, filemode="w"):
     """
-    Takes tokens, tags and dependency relations and writes them into a tsv file in CoNLL-U format.
-    Domain-specific tags are required, POS tags are optional.
+    Streams prediction records (see iter_prediction_records) into a tsv file in CoNLL-U format
+    through a single buffered file handle, so memory use does not depend on the size of the input.
 
-    CoNLL-U columns: ID FORM LEMMA UPOS XPOS FEATS HEAD DEPREL DEPS MISC
+    In multi mode, every record is written as a recipe of its own (token IDs start from 1,
+    recipes are separated by an empty line). Otherwise, all records are written as one
+    recipe with consecutive token IDs. In multi mode, no file is created if there are no records.
+
+    Returns: the number of records written
     """
-    # double-check input
-    if len(tokens) != len(tags):
-        raise ValueError(
-            f"Will not zip tokens, tags, heads and deps: number of tokens "
-            f"in tokens and number of tags in tags must be the same. "
-            f"Got {len(tokens)}, {len(tags)}, {len(heads)} and {len(deps)}."
-        )
-    # write file: one token per line
-    with open(outfile, filemode, encoding="utf-8") as o:
-        if pos_tags:
-            for (i, (_token, _pos, _tag, _head, _dep)) in enumerate(
-                zip(tokens, pos_tags, tags, heads, deps)
-            ):
-                # need to start counting from 1 bc 0 is used for None-node
-                o.write(
-                    str(i + 1)
-                    + "\t"
-                    + _token
-                    + "\t_\t"
-                    + _pos
-                    + "\t"
-                    + _tag
-                    + "\t_\t"
-                    + _head
-                    + "\t"
-                    + _dep
-                    + "\t_\t_"
-                )
-                o.write("\n")
-        else:
-            for (i, (_token, _tag, _head, _dep)) in enumerate(
-                zip(tokens, tags, heads, deps)
-            ):
-                # need to start counting from 1 bc 0 is used for None-node
-                o.write(
-                    str(i + 1)
-                    + "\t"
-                    + _token
-                    + "\t_\t_\t"
-                    + _tag
-                    + "\t_\t"
-                    + _head
-                    + "\t"
-                    + _dep
-                    + "\t_\t_"
+    n_records = 0
+    offset = 0
+
+    def chunks():
+        nonlocal n_records, offset
+        for record in records:
+            n_records += 1
+            yield _conllu_lines(record, offset)
+            if multi_mode:
+                yield "\n"
+            else:
+                offset += len(record["words"])
+
+    # read and convert the first record before the output file is created, so invalid input leaves no file behind
+    chunks = chunks()
+    first = next(chunks, None)
+    if first is None and multi_mode:
+        return 0
+    with open(outfile, filemode, encoding="utf-8", buffering=1 << 20) as o:
+        if first is not None:
+            o.writelines(itertools.chain([first], chunks))
+        if not multi_mode:
+            o.write("\n")
+    return n_records
+
+
+def _expect_model_type(records, model_type, pred_file):
+    """
+    Passes on the records and makes sure they can be converted as the expected model's output.
+    Parser records are accepted as tagger output: their input tags are used and heads and deps are dropped.
+    """
+    for record in records:
+        if record["model_type"] != model_type:
+            if model_type != "tagger":
+                raise ValueError(
+                    f"{pred_file} does not contain {model_type} output."
                 )
-                o.write("\n")
-        o.write("\n")
+            record = dict(record, heads=None, deps=None, model_type="tagger")
+        yield record
+
 
 def execute_tagger2c(args):
     """
@@ -206,25 +192,16 @@ def execute_tagger2c(args):
     CoNLL-U columns: ID FORM LEMMA UPOS XPOS FEATS HEAD DEPREL DEPS MISC
     Realised columns (all other columns contain dummy values): ID FORM _ (UPOS) XPOS _ _ _ _ _
     """
+    records = _expect_model_type(iter_prediction_records(args.pred_file), "tagger", args.pred_file)
     if args.multi_mode:
-        lineflag = False
-        with open(args.pred_file, encoding="utf-8") as f:
-            for line in f:
-                lineflag = True
-                j = json.loads(line)
-                tokens = j["words"]
-                tags = j["tags"]
-                taggingcolumns2conllu(args.out, tokens, tags, filemode="a")
-            if not lineflag:
-                raise IOError(
-                    "Empty file"
-                )  # Due to formatting and other errors in Lin et al. (2020)'s data,
-                # some recipes do not contain text, leaving us with empty files.
-                # Empty files could cause further errors; therefore, we want to delete them from the dataset.
+        if not records2conllu(records, args.out, multi_mode=True, filemode="a"):
+            raise IOError(
+                "Empty file"
+            )  # Due to formatting and other errors in Lin et al. (2020)'s data,
+            # some recipes do not contain text, leaving us with empty files.
+            # Empty files could cause further errors; therefore, we want to delete them from the dataset.
     else:
-        tokens = read_prediction_tokens(args.pred_file)
-        tags, _ = read_prediction_tags(args.pred_file)
-        taggingcolumns2conllu(args.out, tokens, tags)
+        records2conllu(records, args.out)
 
 
 def execute_parse2c(args):
@@ -234,28 +211,14 @@ def execute_parse2c(args):
     CoNLL-U columns: ID FORM LEMMA UPOS XPOS FEATS HEAD DEPREL DEPS MISC
     Realised columns (all other columns contain dummy values): ID FORM _ (UPOS) XPOS _ HEAD DEPREL DEPS _
     """
+    records = _expect_model_type(iter_prediction_records(args.pred_file), "parser", args.pred_file)
     if args.multi_mode:
-        # WIP - not yet tested
-        lineflag = False
-        with open(args.pred_file, encoding="utf-8") as f:
-            for line in f:
-                lineflag = True
-                j = json.loads(line)
-                tokens = j["words"]
-                tags = j["pos"]
-                heads = j["predicted_heads"]
-                heads = list(map(str, heads))
-                deps = j["predicted_dependencies"]
-                parsercolumns2conllu(args.out, tokens, tags, heads, deps, filemode="a")
-            if not lineflag:
-                raise IOError(
-                    "Empty file"
-                )  # we want to detect and subsequently delete empty files from the dataset.
+        if not records2conllu(records, args.out, multi_mode=True, filemode="a"):
+            raise IOError(
+                "Empty file"
+            )  # we want to detect and subsequently delete empty files from the dataset.
     else:
-        tokens = read_prediction_tokens(args.pred_file)
-        tags, _ = read_prediction_tags(args.pred_file)
-        heads, deps = read_prediction_dependencies(args.pred_file)
-        parsercolumns2conllu(args.out, tokens, tags, heads, deps)
+        records2conllu(records, args.out)
 
 
 if __name__ == "__main__":
@@ -282,7 +245,7 @@ if __name__ == "__main__":
         metavar="PRED_FILE",
         dest="pred_file",
         required=True,
-        help="""Prediction file in json format. Output of AllenNLP tagger or parser.""",
+        help="""Prediction file in json format. Output of AllenNLP tagger or parser, original or lean format.""",
     )
     arg_parser.add_argument(
         "-o",
@@ -0,0 +1,226 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Lean prediction format for our tagger's and parser's output.
+
+The original AllenNLP output serializes the tagger's logits (and other score tensors) as
+JSON text, which makes up almost all of the file. The lean format is a JSONL file with one
+recipe per line and only the keys
+    - words
+    - tags
+    - heads (parser only)
+    - deprels (parser only)
+    - scores_offset (only if a score sidecar is written)
+Score tensors can optionally be written into a float16 .npy sidecar with one row per token;
+`scores_offset` is the row of the recipe's first token. The sidecar can be memory-mapped,
+see load_scores() and recipe_scores().
+
+Lean files are accepted by json_to_conll.py, error_analysis.py and parser_evaluation.py.
+The lean_predictor.py module makes AllenNLP write this format directly; this script
+converts existing prediction files.
+
+Tested with Python 3.11
+"""
+
+import argparse
+import json
+import logging
+
+import numpy as np
+
+
+SCORE_DTYPE = np.float16
+
+
+def to_lean_record(j):
+    """
+    Reduces one decoded line of AllenNLP tagger or parser output to the lean format.
+
+    Returns: a dictionary with the keys words, tags and (parser output only) heads, deprels
+    """
+    if "predicted_heads" in j:
+        return {
+            "words": j["words"],
+            "tags": j["pos"],
+            "heads": j["predicted_heads"],
+            "deprels": j["predicted_dependencies"],
+        }
+    return {"words": j["words"], "tags": j["tags"]}
+
+
+class ScoreSidecarWriter:
+    """
+    Appends per-token score matrices to a float16 .npy file.
+
+    The .npy header is rewritten after every append, so the file is a valid (memory-mappable)
+    array at any point, e.g. while AllenNLP is still predicting.
+    """
+
+    def __init__(self, scores_file):
+        self.scores_file = scores_file
+        self.n_rows = 0
+        self.n_cols = None
+        self._f = open(scores_file, "wb")
+        self._header_len = None
+
+    def _write_header(self):
+        self._f.seek(0)
+        np.lib.format.write_array_header_1_0(
+            self._f,
+            {
+                "descr": np.lib.format.dtype_to_descr(np.dtype(SCORE_DTYPE)),
+                "fortran_order": False,
+                "shape": (self.n_rows, self.n_cols),
+            },
+        )
+        header_len = self._f.tell()
+        if self._header_len is None:
+            self._header_len = header_len
+        elif header_len != self._header_len:
+            # numpy reserves space for the shape to grow; this only fails for absurd sizes
+            raise RuntimeError(f"Cannot grow the header of {self.scores_file} in place.")
+        self._f.seek(0, 2)
+        self._f.flush()
+
+    def append(self, scores):
+        """
+        Appends the score matrix (num_tokens x num_classes) of one recipe.
+
+        Returns: the row offset of the recipe's first token
+        """
+        scores = np.asarray(scores, dtype=SCORE_DTYPE)
+        if scores.ndim != 2:
+            raise ValueError(f"Expected a 2-dimensional score matrix, got shape {scores.shape}.")
+        if self.n_cols is None:
+            self.n_cols = scores.shape[1]
+            self._write_header()
+        elif scores.shape[1] != self.n_cols:
+            raise ValueError(
+                f"All score matrices must have {self.n_cols} columns, got {scores.shape[1]}."
+            )
+        offset = self.n_rows
+        self._f.write(np.ascontiguousarray(scores).tobytes())
+        self.n_rows += scores.shape[0]
+        self._write_header()
+        return offset
+
+    def close(self):
+        if self._f.closed:
+            return
+        if self.n_cols is None:
+            # no scores at all: still leave a valid (empty) array behind
+            self.n_cols = 0
+            self._write_header()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_scores(scores_file):
+    """
+    Memory-maps a score sidecar.
+
+    Returns: a read-only float16 array with one row per token
+    """
+    return np.load(scores_file, mmap_mode="r")
+
+
+def recipe_scores(scores, record):
+    """
+    Returns: the (memory-mapped) score rows of one recipe, given its lean record
+    """
+    offset = record["scores_offset"]
+    return scores[offset : offset + len(record["words"])]
+
+
+def convert_to_lean(pred_file, out_file, scores_file=None, score_key="logits"):
+    """
+    Streams an AllenNLP prediction file into the lean format.
+    If scores_file is given, the score tensors stored under score_key are written into
+    a float16 sidecar.
+
+    Returns: the number of recipes converted
+    """
+    n_records = 0
+    sidecar = ScoreSidecarWriter(scores_file) if scores_file else None
+    try:
+        with open(pred_file, encoding="utf-8") as f, open(
+            out_file, "w", encoding="utf-8", buffering=1 << 20
+        ) as o:
+            for line in f:
+                if not line.strip():
+                    continue
+                j = json.loads(line)
+                record = to_lean_record(j)
+                if sidecar is not None:
+                    if score_key not in j:
+                        raise KeyError(f"{pred_file} contains no scores under '{score_key}'.")
+                    record["scores_offset"] = sidecar.append(j[score_key])
+                o.write(json.dumps(record, ensure_ascii=False))
+                o.write("\n")
+                n_records += 1
+    finally:
+        if sidecar is not None:
+            sidecar.close()
+    return n_records
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Converts AllenNLP tagger or parser output (json format) into the lean
+        prediction format: words, tags, heads and deprels only, with an optional float16 .npy
+        sidecar for the score tensors."""
+    )
+    arg_parser.add_argument(
+        "-p",
+        "--prediction",
+        metavar="PRED_FILE",
+        dest="pred_file",
+        required=True,
+        help="""Prediction file in json format. Output of AllenNLP tagger or parser.""",
+    )
+    arg_parser.add_argument(
+        "-o",
+        "--output_file",
+        dest="out",
+        metavar="OUTPUT_FILE",
+        help="""Path of the lean output file. Default is <prediction_file>.lean.jsonl if not specified""",
+    )
+    arg_parser.add_argument(
+        "-s",
+        "--scores",
+        dest="scores_file",
+        metavar="SCORES_FILE",
+        help="""Optional: path of a .npy sidecar for the score tensors. Scores are dropped when not specified.""",
+    )
+    arg_parser.add_argument(
+        "--score-key",
+        dest="score_key",
+        default="logits",
+        help="""Key of the score tensor in the prediction file. Default: logits""",
+    )
+    args = arg_parser.parse_args()
+
+    # default output file name
+    if args.out == None:
+        args.out = str(args.pred_file)[:-4] + "lean.jsonl"
+
+    logging.info(f"Converting {args.pred_file} into {args.out}")
+    convert_to_lean(args.pred_file, args.out, args.scores_file, args.score_key)
@@ -0,0 +1,67 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+AllenNLP predictor that writes our tagger's and parser's output in the lean prediction
+format (see lean_predictions.py) instead of dumping all output tensors as JSON text.
+
+Usage (from the repository root):
+    PYTHONPATH=data-scripts allennlp predict [archive file] [input file] --use-dataset-reader \
+        --include-package lean_predictor --predictor lean \
+        --predictor-args '{"scores_file": "[scores file].npy"}' --output-file [output file]
+
+The predictor arguments are optional; without `scores_file`, no scores are kept.
+"""
+
+import atexit
+import json
+from typing import Optional
+
+from allennlp.common.util import JsonDict
+from allennlp.data import DatasetReader
+from allennlp.models import Model
+from allennlp.predictors.predictor import Predictor
+
+from lean_predictions import ScoreSidecarWriter, to_lean_record
+
+
+@Predictor.register("lean")
+class LeanPredictor(Predictor):
+    """
+    Predicts with the model's own forward pass (use together with --use-dataset-reader)
+    and writes one lean JSON line per instance. Score tensors stored under `score_key`
+    go into a float16 .npy sidecar if `scores_file` is given.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        dataset_reader: DatasetReader,
+        frozen: bool = True,
+        scores_file: Optional[str] = None,
+        score_key: str = "logits",
+    ) -> None:
+        super().__init__(model, dataset_reader, frozen)
+        self._sidecar = ScoreSidecarWriter(scores_file) if scores_file else None
+        if self._sidecar is not None:
+            # allennlp predict never tells the predictor that it is done
+            atexit.register(self._sidecar.close)
+        self._score_key = score_key
+
+    def dump_line(self, outputs: JsonDict) -> str:
+        record = to_lean_record(outputs)
+        if self._sidecar is not None:
+            if self._score_key not in outputs:
+                raise KeyError(f"The model output contains no scores under '{self._score_key}'.")
+            record["scores_offset"] = self._sidecar.append(outputs[self._score_key])
+        return json.dumps(record, ensure_ascii=False) + "\n"
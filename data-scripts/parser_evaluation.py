@@ -24,23 +24,28 @@ Tested with Python 3.7
 """
 
 import argparse
-import json
-from ast import literal_eval
 import logging
-from collections import defaultdict
 import csv
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gold_cache import load_gold_table
+from eval_counts import HEADER, EvalCounts, merge_counts
+from json_to_conll import iter_prediction_records
+from significance import bootstrap_ci, paired_randomization_test, print_bootstrap, print_randomization_test
 
 def read_prediction_tokens(pred_file):
     """
-    Reads in the tokens from the tagger's output file.
+    Reads in the tokens from the tagger's output file (original or lean format).
 
     Returns: a String list
     """
     tokens = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            tokens.extend(j["words"])
+    for record in iter_prediction_records(pred_file):
+        tokens.extend(record["words"])
     return tokens
 
 def read_prediction_tags(pred_file):
@@ -52,59 +57,151 @@ def read_prediction_tags(pred_file):
     """
     model_type = None
     tags = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            try:
-                tags.extend(j["tags"])
-                model_type = "tagger"
-            except KeyError:
-                tags.extend(j["pos"])
-                model_type =  "parser"
+    for record in iter_prediction_records(pred_file):
+        tags.extend(record["tags"])
+        model_type = record["model_type"]
     return tags, model_type
 
 def read_prediction_dependencies(pred_file):
     """
-    Reads in the predictions from the parser's output file.
+    Reads in the predictions from the parser's output file (original or lean format).
 
     Returns: two String list with the predicted heads and dependency names, respectively.
     """
     heads = []
     deps = []
-    with open(pred_file, encoding="utf-8") as f:
-        for line in f:
-            j = json.loads(line)
-            heads.extend(j["predicted_heads"])
-            deps.extend(j["predicted_dependencies"])
-    heads = list(map(str, heads))
-    return heads,deps
+    for record in iter_prediction_records(pred_file):
+        heads.extend(record["heads"])
+        deps.extend(record["deps"])
+    return heads, deps
+
 
-def read_gold_conllu(gold_file):
+def _label_codes(labels, label_index):
     """
-    Reads in the gold annotation file in CoNLL-U format (all dependencies, i.e. multiple dependency relations per token, if applicable).
+    Encodes a sequence of labels as integers; label_index (dict from label to code)
+    is extended by unseen labels.
+
+    Returns: an int64 array with one code per label
+    """
+    if len(labels) == 0:
+        return np.zeros(0, dtype=np.int64)
+    uniq, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    codes = np.array([label_index.setdefault(label, len(label_index)) for label in uniq], dtype=np.int64)
+    return codes[inverse.reshape(-1)]
+
+
+def read_gold_arrays(gold_file, label_index=None, use_cache=True):
+    """
+    Reads in the gold annotation file in CoNLL-U format (all dependencies, i.e. multiple dependency relations per token, if applicable)
+    and encodes the gold edges as integer arrays in CSR style: the edges of token i are at positions indptr[i]:indptr[i+1].
+    If a token has several edges to the same head, the last one annotated counts.
+    The parsed file is taken from the gold cache (see gold_cache.py) unless use_cache is False.
 
     Returns:
-        - unlabelled: a list of sets with head token ID's; len(unlabelled) = num_tokens(gold_file)
-        - labelled: a list of sets with (head, dependency name) pairs; len(labelled) = num_tokens(gold_file)
-    """
-    labelled = []
-    unlabelled = []
-    with open(gold_file, "r", encoding="utf-8") as f:
-        for line in f:
-            if line == "\n":
-                continue
-            line = line.split("\t")
-            edges = set()
-            edges.add((line[6],line[7]))
-            if line[8] != "_":
-                for head, dep in literal_eval(line[8]):
-                    # literal eval produces int for heads, changed to str
-                    edge = (str(head), str(dep))
-                    edges.add(edge)
-            heads = set([str(h) for h,d in edges])
-            labelled.append(edges)
-            unlabelled.append(heads)
-    return unlabelled, labelled
+        - indptr: int64 array; len(indptr) = num_tokens(gold_file) + 1
+        - edge_heads: int64 array with the head token ID of every gold edge
+        - edge_deprels: int64 array with the label code of every gold edge
+        - label_index: dict from dependency name to label code (extended if given)
+    """
+    if label_index is None:
+        label_index = dict()
+    table = load_gold_table(gold_file, "conllu", use_cache=use_cache)
+    used, inverse = np.unique(table.edge_labels, return_inverse=True)
+    codes = np.array(
+        [label_index.setdefault(label, len(label_index)) for label in table.vocab[used].tolist()],
+        dtype=np.int64,
+    )
+    return table.edge_indptr, table.edge_heads, codes[inverse.reshape(-1)], label_index
+
+
+def read_prediction_arrays(pred_file, label_index):
+    """
+    Reads in the predictions from the parser's output file (original or lean format).
+
+    Returns: two int64 arrays with the predicted heads and the label codes of the predicted dependency names
+    """
+    heads = []
+    deps = []
+    for record in iter_prediction_records(pred_file):
+        heads.extend(record["heads"])
+        deps.extend(record["deps"])
+    return np.asarray(heads, dtype=np.int64), _label_codes(deps, label_index)
+
+
+def _classify_edges(indptr, gold_heads, gold_deprels, pred_heads, pred_deprels):
+    """
+    Compares every gold edge (CSR arrays, see read_gold_arrays) with the predicted edge of its token.
+
+    Returns: edge_pred_deprels (the predicted label per gold edge) and the boolean edge masks
+        match (TP of the gold label), fn (FN of the gold label), fp (FP of the predicted label) and
+        same_head (predicted head equals gold head)
+    """
+    n_tokens = len(indptr) - 1
+    if len(pred_heads) != n_tokens:
+        raise IOError("Your gold data and predicted data don't match in length.")
+    edge_token = np.repeat(np.arange(n_tokens), np.diff(indptr))
+    edge_pred_heads = pred_heads[edge_token]
+    edge_pred_deprels = pred_deprels[edge_token]
+
+    gold_root = gold_heads == 0
+    token_has_root = np.zeros(n_tokens, dtype=bool)
+    token_has_root[edge_token[gold_root]] = True
+
+    predicted = edge_pred_heads != 0
+    missed = ~predicted & ~token_has_root[edge_token]
+    spurious = predicted & gold_root
+    same_head = gold_heads == edge_pred_heads
+    match = predicted & ~gold_root & same_head & (gold_deprels == edge_pred_deprels)
+    wrong = predicted & ~gold_root & ~match
+    return edge_pred_deprels, match, missed | wrong, spurious | wrong, same_head
+
+
+def count_labelled(indptr, gold_heads, gold_deprels, pred_heads, pred_deprels, n_labels):
+    """
+    Labelled comparison of predicted edges (one per token) with gold edges (CSR arrays, see read_gold_arrays).
+    Every gold edge of a token is compared with the token's predicted edge:
+        - no edge predicted (head 0), but edge(s) in gold: each gold edge is a false negative
+        - edge predicted, but gold edge is the 0-edge: false positive for the predicted label
+        - edge predicted and gold edge has the same head and label: true positive
+        - otherwise: false negative for the gold label and false positive for the predicted label
+    Gold edges that share the head of the predicted edge (including 0 and 0) are entered
+    into the label confusion matrix.
+
+    Returns: tp, fp, fn (int64 arrays indexed by label code) and confusion
+        (n_labels x n_labels int64 array; rows: gold labels, columns: predicted labels)
+    """
+    edge_pred_deprels, match, fn_edges, fp_edges, same_head = _classify_edges(
+        indptr, gold_heads, gold_deprels, pred_heads, pred_deprels
+    )
+    tp = np.bincount(gold_deprels[match], minlength=n_labels)
+    fn = np.bincount(gold_deprels[fn_edges], minlength=n_labels)
+    fp = np.bincount(edge_pred_deprels[fp_edges], minlength=n_labels)
+    confusion = np.bincount(
+        gold_deprels[same_head] * n_labels + edge_pred_deprels[same_head],
+        minlength=n_labels * n_labels,
+    ).reshape(n_labels, n_labels)
+    return tp, fp, fn, confusion
+
+
+def count_labelled_per_recipe(recipe_offsets, indptr, gold_heads, gold_deprels, pred_heads, pred_deprels, n_labels):
+    """
+    Same comparison as count_labelled, but counted separately for every recipe
+    (recipe_offsets: token offsets of the recipes, see gold_cache.GoldTable).
+
+    Returns: int64 array (num_recipes x n_labels x 3) with TP, FP, FN per recipe and label code
+    """
+    edge_pred_deprels, match, fn_edges, fp_edges, _ = _classify_edges(
+        indptr, gold_heads, gold_deprels, pred_heads, pred_deprels
+    )
+    n_recipes = len(recipe_offsets) - 1
+    edge_recipe = np.repeat(np.arange(n_recipes), np.diff(indptr[recipe_offsets]))
+    counts = np.zeros((n_recipes, n_labels, 3), dtype=np.int64)
+    for k, (edges, labels) in enumerate(((match, gold_deprels), (fp_edges, edge_pred_deprels), (fn_edges, gold_deprels))):
+        counts[..., k] = np.bincount(
+            edge_recipe[edges] * n_labels + labels[edges], minlength=n_recipes * n_labels
+        ).reshape(n_recipes, n_labels)
+    return counts
+
 
 # ARCHIVED CODE: unlabeled evaluation
 # def evaluate_parser_unlabelled(args):
@@ -157,94 +254,275 @@ def read_gold_conllu(gold_file):
 #     print("Recall", (tp/(tp+fn)))
 #     print("F1", (tp/(tp+0.5*(fp+fn))))
 
+def _print_rows(rows):
+    print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9} {5:<9} {6:<9}'.format(*HEADER))
+    for output in rows:
+        print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9.4} {5:<9.4} {6:<9.4}'.format(*output))
+
+
 def evaluate_parser_labelled(args):
     # labelled evaluation!
-    # TODO: work-in-progress
 
+    label_index = dict()
     # read in goldfile
-    gold_unlabelled, gold_labelled = read_gold_conllu(args.gold_file)
+    indptr, gold_heads, gold_deprels, label_index = read_gold_arrays(args.gold_file, label_index, args.use_cache)
     # Read in prediction for the parsing task
-    pred_heads, pred_deps = read_prediction_dependencies(args.pred_file)
-    # Check compatibility
-    if len(gold_unlabelled) != len(pred_heads):
-        raise IOError("Your gold data and predicted data don't match in length.")
-    
-    # print(len(pred_heads), len(pred_deps))
+    pred_heads, pred_deprels = read_prediction_arrays(args.pred_files[0], label_index)
     # Compare prediction and expectation, and count errors
-    tp = {}
-    tp = defaultdict(lambda:0,tp)
-    fp = {}
-    fp = defaultdict(lambda:0,fp)
-    fn = {}
-    fn = defaultdict(lambda:0,fn)
-
-    for gold_labeled, pred_head, pred_dep in zip(gold_labelled,pred_heads, pred_deps):
-        gold = dict()
-        for gold_head, gold_dep in gold_labeled:
-            gold[gold_head] = gold_dep
-        if pred_head == "0":
-            # if no edge is predicted
-            if pred_head not in gold.keys():
-                # but edge exists in gold (i.e. "0" is not in gold)
-                for gold_head, gold_dep in gold.items():
-                    fn[gold_dep] += 1
+    tp, fp, fn, confusion = count_labelled(
+        indptr, gold_heads, gold_deprels, pred_heads, pred_deprels, len(label_index)
+    )
+    counts = EvalCounts.from_arrays(tp, fp, fn, label_index, n_tokens=len(pred_heads))
+    rows = counts.rows()
+
+    _print_rows(rows)
+
+    if args.counts_file:
+        counts.dump(args.counts_file)
+
+    if args.output_file:
+        with open(args.output_file, "w", encoding="utf-8") as o:
+            tsv_writer = csv.writer(o, delimiter='\t')
+            tsv_writer.writerow(HEADER)
+            for output in rows:
+                tsv_writer.writerow(output)
+
+    if args.confusion_file:
+        labels = sorted(label_index)
+        codes = [label_index[label] for label in labels]
+        with open(args.confusion_file, "w", encoding="utf-8") as o:
+            tsv_writer = csv.writer(o, delimiter='\t')
+            tsv_writer.writerow(["Gold \\ Predicted"] + labels)
+            for label, row in zip(labels, confusion[np.ix_(codes, codes)]):
+                tsv_writer.writerow([label] + row.tolist())
+
+
+def report_significance(args):
+    """
+    Recipe-level bootstrap confidence intervals (args.bootstrap) for the prediction file and/or a paired
+    approximate randomization test against a second prediction file (args.compare_file), see significance.py.
+    """
+    recipe_offsets = load_gold_table(args.gold_file, "conllu", use_cache=args.use_cache).recipe_offsets
+    indptr, gold_heads, gold_deprels, label_index = read_gold_arrays(args.gold_file, use_cache=args.use_cache)
+    pred_files = [args.pred_files[0]] + ([args.compare_file] if args.compare_file else [])
+    predictions = [read_prediction_arrays(pred_file, label_index) for pred_file in pred_files]
+    recipe_counts = [
+        count_labelled_per_recipe(
+            recipe_offsets, indptr, gold_heads, gold_deprels, pred_heads, pred_deprels, len(label_index)
+        )
+        for pred_heads, pred_deprels in predictions
+    ]
+    # report the labels with at least one true positive (in any of the systems), sorted by label
+    labels = sorted(label for label, code in label_index.items() if any(c[:, code, 0].sum() for c in recipe_counts))
+    # rows of the reported labels plus the overall (micro-averaged) row
+    rows = [label_index[label] for label in labels] + [-1]
+    n_recipes = len(recipe_offsets) - 1
+
+    if args.bootstrap:
+        point, low, high = bootstrap_ci(recipe_counts[0], args.resamples, args.confidence, args.seed)
+        print()
+        print_bootstrap(labels, point[rows], low[rows], high[rows], args.resamples, n_recipes, args.confidence)
+    if args.compare_file:
+        f1_a, f1_b, p_values = paired_randomization_test(
+            recipe_counts[0], recipe_counts[1], args.resamples, args.seed
+        )
+        print()
+        print_randomization_test(
+            labels, f1_a[rows], f1_b[rows], p_values[rows], args.resamples, n_recipes, *pred_files
+        )
+
+
+# gold arrays (indptr, edge_heads, edge_deprels, label_index), set once per worker process
+_gold = None
+
+
+def _init_worker(gold):
+    global _gold
+    _gold = gold
+
+
+def evaluate_counts(pred_file, gold):
+    """
+    Evaluates one prediction file against gold arrays (see read_gold_arrays).
+
+    Returns: EvalCounts
+    """
+    indptr, gold_heads, gold_deprels, label_index = gold
+    label_index = dict(label_index)
+    pred_heads, pred_deprels = read_prediction_arrays(pred_file, label_index)
+    tp, fp, fn, _ = count_labelled(
+        indptr, gold_heads, gold_deprels, pred_heads, pred_deprels, len(label_index)
+    )
+    return EvalCounts.from_arrays(tp, fp, fn, label_index, n_tokens=len(pred_heads))
+
+
+def _evaluate_run(pred_file):
+    return evaluate_counts(pred_file, _gold)
+
+
+def evaluate_shard(shard):
+    """
+    Evaluates one shard of a corpus, i.e. a (prediction file, gold file) pair.
+
+    Returns: EvalCounts, to be merged with the counts of the other shards
+    """
+    pred_file, gold_file = shard
+    return evaluate_counts(pred_file, read_gold_arrays(gold_file))
+
+
+def evaluate_shards(shards, jobs=None):
+    """
+    Evaluates a corpus split into shards ((prediction file, gold file) pairs) in a pool of
+    worker processes and merges the partial counts.
+
+    Returns: EvalCounts for the whole corpus
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return merge_counts(executor.map(evaluate_shard, shards))
+
+
+def _safe_div(a, b):
+    return np.divide(a, b, out=np.zeros_like(a, dtype=float), where=b != 0)
+
+
+def summarize_runs(run_counts):
+    """
+    Aggregates the counts of several runs (list of EvalCounts) per label,
+    over all labels with at least one true positive in any run.
+    Scores of labels without predictions or gold edges in a run are counted as 0.
+
+    Returns: (labels, mean, std) where mean and std are (num_labels x 6) arrays with the
+        columns TP, FP, FN, Recall, Precision, F1 (std: population standard deviation over runs)
+    """
+    labels = sorted({label for counts in run_counts for label, (tp, _, _) in counts.labels.items() if tp > 0})
+    counts = np.array(
+        [[counts.counts(label) for label in labels] for counts in run_counts], dtype=float
+    ).reshape(len(run_counts), len(labels), 3)
+    tp, fp, fn = counts[..., 0], counts[..., 1], counts[..., 2]
+    scores = np.stack(
+        [tp, fp, fn, _safe_div(tp, tp + fn), _safe_div(tp, tp + fp), _safe_div(tp, tp + 0.5 * (fp + fn))],
+        axis=-1,
+    )
+    return labels, scores.mean(axis=0), scores.std(axis=0)
+
+
+def evaluate_runs(args):
+    """
+    Evaluates several prediction files (e.g. one per seed) against the same gold file.
+    The gold file is read once; the runs are evaluated in parallel.
+    Prints one table per run and the mean and standard deviation per label; optionally
+    writes everything into one TSV or JSON file (chosen by the file extension of args.output_file).
+    """
+    gold = read_gold_arrays(args.gold_file, use_cache=args.use_cache)
+    if args.jobs == 1:
+        _init_worker(gold)
+        run_counts = [_evaluate_run(pred_file) for pred_file in args.pred_files]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker, initargs=(gold,)) as executor:
+            run_counts = list(executor.map(_evaluate_run, args.pred_files))
+
+    run_rows = []
+    for pred_file, counts in zip(args.pred_files, run_counts):
+        rows = counts.rows()
+        run_rows.append(rows)
+        print(f"Run: {pred_file}")
+        _print_rows(rows)
+        print()
+
+    labels, mean, std = summarize_runs(run_counts)
+    print(f"Mean ± std over {len(run_counts)} runs")
+    print('{0:<10} {1:^11} {2:^11} {3:^11} {4:<15} {5:<15} {6:<15}'.format(*HEADER))
+    for label, m, sd in zip(labels, mean, std):
+        print('{0:<10} {1:>5.1f}±{2:<5.1f} {3:>5.1f}±{4:<5.1f} {5:>5.1f}±{6:<5.1f} '
+              '{7:.4f}±{8:<8.4f} {9:.4f}±{10:<8.4f} {11:.4f}±{12:<8.4f}'.format(
+                  label, *[v for pair in zip(m, sd) for v in pair]))
+
+    if args.output_file:
+        if args.output_file.endswith(".json"):
+            summary = {
+                label: {
+                    name: {"mean": float(m[k]), "std": float(sd[k])}
+                    for k, name in enumerate(HEADER[1:])
+                }
+                for label, m, sd in zip(labels, mean, std)
+            }
+            runs = {
+                pred_file: [dict(zip(HEADER, row)) for row in rows]
+                for pred_file, rows in zip(args.pred_files, run_rows)
+            }
+            with open(args.output_file, "w", encoding="utf-8") as o:
+                json.dump({"gold": args.gold_file, "runs": runs, "summary": summary}, o, indent=2)
         else:
-            # if edge is predicted
-            for gold_head, gold_dep in gold.items():
-                if gold_head == "0":
-                    # but edge should not have been predicted - false pos
-                    fp[pred_dep] += 1
-                elif gold_head == pred_head and gold_dep == pred_dep:
-                    # perfect match
-                    tp[gold_dep] += 1
-                else:
-                    # record fn and fp
-                    fn[gold_dep] += 1
-                    fp[pred_dep] += 1
-
-    # for label in tp.keys():
-    #     print("Label:", label)
-    #     print("TP", tp[label])
-    #     print("FP", fp[label])
-    #     print("FN", fn[label])
-    #     print("Recall", (tp[label]/(tp[label]+fn[label])))
-    #     print("Precision", (tp[label]/(tp[label]+fp[label])))
-    #     print("F1", (tp[label]/(tp[label]+0.5*(fp[label]+fn[label]))))
-    #     print("-"*15)
-
-    # DEBUG - some labels were never predicted by model (likely errors in data)
-    # fn_minus_tp = set(fn.keys()).difference(set(tp.keys()))
-    # print("In FP but not in TP:", set(fp.keys()).difference(set(tp.keys())))
-    # print("In FN but not in TP:", set(fn.keys()).difference(set(tp.keys())))
-    # print("In FN but not in FP:", set(fn.keys()).difference(set(fp.keys())))
-
-    header = ["Label", "TP", "FP", "FN", "Recall", "Precision", "F1"]
-    print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9} {5:<9} {6:<9}'.format(*header))
-    for label in sorted(tp.keys()):
-        output = label, tp[label], fp[label], fn[label], (tp[label]/(tp[label]+fn[label])), (tp[label]/
-            (tp[label]+fp[label])), (tp[label]/(tp[label]+0.5*(fp[label]+fn[label])))
-        print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9.4} {5:<9.4} {6:<9.4}'.format(*output))
-    
-    # debug
-    # for label in fn_minus_tp:
-    #     output = label, tp[label], fp[label], fn[label]
-    #     print('{0:<10} {1:>5} {2:>5} {3:>5}'.format(*output))
-    
+            with open(args.output_file, "w", encoding="utf-8") as o:
+                tsv_writer = csv.writer(o, delimiter='\t')
+                tsv_writer.writerow(["Run"] + HEADER)
+                for pred_file, rows in zip(args.pred_files, run_rows):
+                    for output in rows:
+                        tsv_writer.writerow((pred_file,) + output)
+                for name, values in (("mean", mean), ("std", std)):
+                    for label, row in zip(labels, values):
+                        tsv_writer.writerow([name, label] + row.tolist())
+
+
+def expand_prediction_files(patterns):
+    """
+    Expands glob patterns (e.g. "runs/seed_*/test.json"); other paths are kept as they are.
+
+    Returns: a list of prediction files
+    """
+    pred_files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise IOError(f"No prediction files match {pattern}.")
+            pred_files.extend(matches)
+        else:
+            pred_files.append(pattern)
+    return pred_files
+
+
+def merge_and_report(args):
+    """
+    Reduce step for sharded evaluation: merges the counts files written with --counts
+    and reports the scores of the whole corpus.
+    """
+    counts = merge_counts(args.merge_files)
+    rows = counts.rows()
+    _print_rows(rows)
+    recall, precision, f1 = counts.overall()
+    tp, fp, fn = counts.totals()
+    print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9.4} {5:<9.4} {6:<9.4}'.format("(overall)", tp, fp, fn, recall, precision, f1))
+
     if args.output_file:
         with open(args.output_file, "w", encoding="utf-8") as o:
             tsv_writer = csv.writer(o, delimiter='\t')
-            tsv_writer.writerow(header)
-            for label in sorted(tp.keys()):
-                output = label, tp[label], fp[label], fn[label], (tp[label]/(tp[label]+fn[label])), (tp[label]/
-                    (tp[label]+fp[label])), (tp[label]/(tp[label]+0.5*(fp[label]+fn[label])))
+            tsv_writer.writerow(HEADER)
+            for output in rows:
                 tsv_writer.writerow(output)
+    if args.counts_file:
+        counts.dump(args.counts_file)
 
 
 def execute_eval(args):
+    if args.merge_files:
+        logging.info("Merging evaluation counts from " + ", ".join(args.merge_files))
+        merge_and_report(args)
+        return
+
     logging.info(
-        "Evaluating " + args.pred_file + "\nwith respect to " + args.gold_file)
+        "Evaluating " + ", ".join(args.pred_files) + "\nwith respect to " + args.gold_file)
 
-    evaluate_parser_labelled(args)
+    if len(args.pred_files) == 1:
+        evaluate_parser_labelled(args)
+        if args.bootstrap or args.compare_file:
+            report_significance(args)
+    else:
+        if args.confusion_file or args.counts_file:
+            raise RuntimeError("Confusion matrix and counts can only be written for a single prediction file.")
+        if args.bootstrap or args.compare_file:
+            raise RuntimeError("Bootstrap and significance tests can only be run for a single prediction file.")
+        evaluate_runs(args)
 
 
 if __name__ == "__main__":
@@ -253,16 +531,46 @@ if __name__ == "__main__":
     arg_parser = argparse.ArgumentParser(
         description="""Takes AllenNLP parser prediction and complementary annotated (gold) file. \n
         Prints out labeled evaluation results""")
-    arg_parser.add_argument("-p", "--prediction", dest="pred_file", metavar="PRED_FILE", required=True,
-                            help="""Prediction file in json format. Output of AllenNLP parser.""")
-    arg_parser.add_argument("-g", "--gold", dest="gold_file", metavar="GOLD_FILE", required=True,
+    arg_parser.add_argument("-p", "--prediction", dest="pred_files", metavar="PRED_FILE", nargs="+",
+                            help="""Prediction file(s) in json format. Output of AllenNLP parser. Several files or glob patterns
+                            (e.g. one run per seed) are evaluated against the same gold file and summarized by mean and standard deviation.""")
+    arg_parser.add_argument("-g", "--gold", dest="gold_file", metavar="GOLD_FILE",
                             help="""Annotated (gold) file in CoNLL-U format.""")
     arg_parser.add_argument("-o", "--output", dest="output_file", metavar="OUTPUT_FILE", required=False,
-                            help="""Optional: specify output path to write eval results. Print on console only when not specified.""")
+                            help="""Optional: specify output path to write eval results. Print on console only when not specified.
+                            For several prediction files, the results are written as JSON if the path ends with .json, otherwise as TSV.""")
+    arg_parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=None,
+                            help="""Optional: number of worker processes for several prediction files. Default: number of CPUs""")
+    arg_parser.add_argument("-c", "--confusion", dest="confusion_file", metavar="CONFUSION_FILE", required=False,
+                            help="""Optional: specify output path to write the label confusion matrix (rows: gold labels,
+                            columns: predicted labels; counted over edges with correctly predicted heads).""")
+    arg_parser.add_argument("--counts", dest="counts_file", metavar="COUNTS_FILE", required=False,
+                            help="""Optional: write the per-label TP/FP/FN counts as JSON, e.g. for one shard of a corpus,
+                            to be merged later with --merge.""")
+    arg_parser.add_argument("--merge", dest="merge_files", metavar="COUNTS_FILE", nargs="+",
+                            help="""Reduce step for sharded evaluation: merge counts files written with --counts and report
+                            the scores of the whole corpus (instead of evaluating -p against -g).""")
+    arg_parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                            help="""Parse the gold file from scratch instead of using the gold cache (see gold_cache.py).""")
+    arg_parser.add_argument("--bootstrap", dest="bootstrap", action="store_true",
+                            help="""Optional: report recipe-level bootstrap confidence intervals of recall, precision and F1.""")
+    arg_parser.add_argument("--compare", dest="compare_file", metavar="PRED_FILE_B", required=False,
+                            help="""Optional: second prediction file for the same gold file; runs a paired approximate
+                            randomization test (over recipes) on the F1 difference.""")
+    arg_parser.add_argument("--resamples", dest="resamples", type=int, default=10000,
+                            help="""Number of bootstrap resamples / randomization trials. Default: 10000""")
+    arg_parser.add_argument("--confidence", dest="confidence", type=float, default=0.95,
+                            help="""Confidence level of the bootstrap intervals. Default: 0.95""")
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=None,
+                            help="""Optional: random seed for resampling.""")
 
     args = arg_parser.parse_args()
 
     args.debug = False
+    if not args.merge_files:
+        if not args.pred_files or not args.gold_file:
+            arg_parser.error("the following arguments are required: -p/--prediction, -g/--gold (unless --merge is given)")
+        args.pred_files = expand_prediction_files(args.pred_files)
 
     #########################
     #### Start execution ####
@@ -4,13 +4,20 @@ Class that deals with different representations of recipe graphs.
 This class has functions to read from and write to different formats, as well has functions that
 manipulate the graph, e.g. reduction from full graph to action graph.
 Internally, the recipe graph is ALWAYS represented as an nx.DiGraph from which this class inherits.
+
+Importing this module has no side effects and does not import networkx or numpy: RecipeGraph is only
+defined (and networkx imported) when it is first used, numpy when a CompactRecipeGraph is built.
+This keeps short-lived worker processes that import the module cheap.
+Run this script to reduce a recipe graph (subcommand reduce) or to run the test scenario (subcommand test).
 """
 # Last updated by Theresa, Jan 2023
 
+import argparse
 import os
-import networkx as nx
-import copy
-import ast
+import heapq
+
+from deps_codec import format_deps, parse_deps
+from json_to_conll import iter_prediction_records
 
 
 
@@ -21,78 +28,82 @@ import ast
 #########################################################################
 # TODO: include the functions in the lower part of this file as methods of this class
 
-class RecipeGraph(nx.DiGraph):  
-    # class inherits from network X directed graph
+class _RecipeGraphMethods:
+    # methods of RecipeGraph, which inherits from network X directed graph (see _recipe_graph_class())
     # additional attribute tokenized_recipe_text which could be a list of string tokens
 
     def __init__(self):
-        nx.DiGraph.__init__(self)
+        super().__init__()
         self.recipe_text = None
         self.upos = None
         self.misc = None
 
+    def token_tags(self, tag_format="iob2"):
+        """
+        Expands the nodes into the tags of the tokens they cover: a node with ID i and a label of n tokens
+        (e.g. "5_the butter" or "the butter") covers the tokens i..i+n-1. Tokens covered by several nodes
+        get the tag of the last of these nodes (in node order).
+
+        Arguments:
+            - tag_format: "iob2" (B-, I-) or "bioul" (U- for single-token nodes, B-, I-, L-)
+        Returns: a dictionary from token ID to tag, e.g. {5: "B-F", 6: "I-F"}
+        """
+        if tag_format not in ("iob2", "bioul"):
+            raise ValueError(f"Unexpected tag format {tag_format}. Valid options are {{iob2, bioul}}.")
+        tags = dict()
+        for node, attributes in self.nodes.data():
+            if node == "end":
+                continue
+            parts = attributes["label"].split("_")
+            if len(parts) > 2:
+                raise RuntimeError(f"Unexpected value {parts} for variable 'tokens'.")
+            # number of text tokens of the node, i.e. the tokens node, node+1, ...
+            n_tokens = parts[-1].count(" ") + 1
+            node_type = attributes["node-type"]
+            if tag_format == "bioul" and n_tokens == 1:
+                tags[node] = "U-" + node_type
+                continue
+            tags[node] = "B-" + node_type
+            inside = "I-" + node_type
+            for id in range(node + 1, node + n_tokens):
+                tags[id] = inside
+            if tag_format == "bioul":
+                tags[node + n_tokens - 1] = "L-" + node_type
+        return tags
+
     def write_to_conll(self, outfile, tag_format="iob2"):
         """
         CoNLL-U columns: ID FORM LEMMA UPOS XPOS FEATS HEAD DEPREL DEPS MISC
-        """
-        # TODO: action graphs and fat graph tags should be in IOB2 format; in general, the choice
-        ## between IOB2 and BIOUL should be an argument of this function with default value IOB2.
 
-        c_graph= nx.DiGraph() # create new (temporary) graph s.t. self does not get messed up
-        for node in self.nodes:
-            if node != "end":
-                tokens = self.nodes[node]["label"].split("_")
-                if len(tokens) == 2:
-                    tokens = tokens[1].split(" ")
-                elif len(tokens) == 1:
-                    tokens = tokens[0].split(" ")
-                else:
-                    raise RuntimeError(f"Unexpected value {tokens} for variable 'tokens'.")
-
-                # if node has more than one text token, split node into several nodes s.t. each original token gets its own node
-                if tag_format == "iob2":
-                    new_nodes = list()
-                    first_token = tokens.pop(0)
-                    attributes = self.nodes[node]
-                    first_attributes = copy.deepcopy(attributes)
-                    first_attributes["label"] = first_token
-                    first_attributes["node-type"] = "B-" + attributes["node-type"]
-                    new_nodes.append((node, first_attributes))
-                    for n,t in enumerate(tokens):
-                        n += 1
-                        # each node corresponds to exactly one token in the original recipe text
-                        node_attributes = copy.deepcopy(self.nodes[node])
-                        node_attributes["label"] = t
-                        node_attributes["node-type"] = "I-" + attributes["node-type"]
-                        new_nodes.append((node+n,node_attributes))
-                else:
-                    # tag_format == "bioul"
-                    raise NotImplementedError()
-                c_graph.add_nodes_from(new_nodes)
+        Each token gets the tag of the node that covers it (see token_tags()); the edges of a node are
+        written on its first token. Lines are streamed to the file without building intermediate graphs.
+
+        Arguments:
+            - outfile: output path or an open text file
+            - tag_format: "iob2" (default) or "bioul"
+        """
+        tags = self.token_tags(tag_format)
 
         # Write graph into CoNLL-U file
-        with open(outfile, "w", encoding="utf-8") as o:
-
-            for id, token in enumerate(self.recipe_text):
-                id += 1
-
-                columns = [str(id), token, "_"]  # ID FORM LEMMA
-                columns.append(self.upos[id - 1])  # UPOS
-
-                if id in c_graph: # would that be the case or do I have to compare against node["label"].split(" ")[0].split("_")[0] ?
-                    columns.append(c_graph.nodes[id]['node-type']) # XPOS
-                    columns.append("_") # FEATS
-                    if c_graph.nodes[id]["node-type"].startswith("B"):
-                        columns.extend(self.heads_to_columns(id)) # HEAD DEPREL DEPS
-                    else:
-                        columns.extend(["0", "root", "_"]) # HEAD DEPREL DEPS
-                    columns.append(self.misc[id-1]) # MISC (might be more detailed in the future depending on node attributes
+        o = outfile if hasattr(outfile, "write") else open(outfile, "w", encoding="utf-8", buffering=1 << 16)
+        try:
+            for id, token in enumerate(self.recipe_text, start=1):
+                tag = tags.get(id)
+                if tag is None:
+                    # ID FORM LEMMA UPOS XPOS FEATS HEAD DEPREL DEPS MISC
+                    o.write(f"{id}\t{token}\t_\t{self.upos[id - 1]}\tO\t_\t0\troot\t_\t{self.misc[id - 1]}\n")
+                    continue
+                if tag[0] in "BU":
+                    edge_columns = "\t".join(self.heads_to_columns(id)) # HEAD DEPREL DEPS
                 else:
-                    columns.extend(["O", "_", "0", "root", "_"]) # XPOS FEATS HEAD DEPREL DEPS
-                    columns.append(self.misc[id-1]) # MISC
-                o.write("\t".join(columns))
-                o.write("\n")
-        print(f"NetworkX graph has been transformed in conllu format. File: {os.path.abspath(outfile)}")
+                    edge_columns = "0\troot\t_"
+                # MISC might be more detailed in the future depending on node attributes
+                o.write(f"{id}\t{token}\t_\t{self.upos[id - 1]}\t{tag}\t_\t{edge_columns}\t{self.misc[id - 1]}\n")
+        finally:
+            if o is not outfile:
+                o.close()
+        if o is not outfile:
+            print(f"NetworkX graph has been transformed in conllu format. File: {os.path.abspath(outfile)}")
 
     def heads_to_columns(self, node):
         """
@@ -122,10 +133,10 @@ class RecipeGraph(nx.DiGraph):
                 label = self.edges[node,head]["label"]
                 additional_edges.append((head,label))
         else:
-            # no remaining pairs; therefore, fill column 9 with wildcard placeholder
-            additional_edges = "_"
+            # no remaining pairs; column 9 gets the wildcard placeholder
+            additional_edges = []
 
-        columns = [str(first_head), first_label, str(additional_edges).replace(" ","")] # TODO: the replace should also be performed in json_to_conll.py (or even better: just implement read_parser_output() in here; then conversion from json to conllu will use this writing function)
+        columns = [str(first_head), first_label, format_deps(additional_edges, compact=True)]
         
         return columns
     
@@ -133,20 +144,70 @@ class RecipeGraph(nx.DiGraph):
 
     #TODO's
 
-    # reading in from annotation tool file format (implement only if needed; might be available somewhere)
+    # reading in from annotation tool file format
     # I think some coreference files have the same format
-    def read_graph_from_brat(self, file):
-        raise NotImplementedError
+    def read_graph_from_brat(self, file, parzu_file=None, token_ids=True):
+        """
+        Reads a recipe annotated with the brat tool (*.ann) and its ParZu parse (tokens and POS tags) into
+        this graph, replacing its content. The graph is the same as reading the CoNLL-U file written by
+        brat_to_conll.py, but is built in memory with the parsing logic of brat_to_conll.py.
+        :param parzu_file: default: prefix from file + "txt.parzu" (as in brat_to_conll.py)
+        :return: self
+        """
+        if parzu_file is None:
+            parzu_file = str(file)[:-3] + "txt.parzu"
+        return self._read_rows(_brat_rows(file, parzu_file), file, token_ids)
 
-    # from flow file format as used by Y'20 (implement only if needed; might already be available somewhere)
-    def read_graph_from_flow(self, file):
-        raise NotImplementedError
+    # from flow file format as used by Y'20
+    def read_graph_from_flow(self, file, list_file=None, token_ids=True):
+        """
+        Reads a recipe flow graph of Yamakata et al. (2020) (*.flow) and its tokens and tags (*.list) into
+        this graph, replacing its content. The graph is the same as reading the CoNLL-U file written by
+        flowgraph_to_conll.py, but is built in memory with read_list() and read_flow() from flowgraph_to_conll.py.
+        :param list_file: default: prefix from file + "list"
+        :return: self
+        """
+        if list_file is None:
+            list_file = str(file)[:-4] + "list"
+        return self._read_rows(_flow_rows(list_file, file), file, token_ids)
+
+    def _read_rows(self, rows, file, token_ids):
+        # rows: CoNLL-U columns of one recipe (see _read_graph_rows); the origin is named after file
+        origin = "G_" + os.path.splitext(os.path.basename(file))[0]
+        nodes, edges, text_tokens, upos_tokens, misc_tokens = _read_graph_rows(rows, token_ids, origin)
+        self.clear()
+        self.add_nodes_from(nodes)
+        self.add_edges_from(edges)
+        self.recipe_text = text_tokens
+        self.upos = upos_tokens
+        self.misc = misc_tokens
+        return self
 
     # from tagger and parser outputs
-    def read_tagger_output_json(self, file):
-        raise NotImplementedError
-    def read_parser_output_json(self, file):
-        raise NotImplementedError
+    def read_tagger_output_json(self, file, token_ids=True):
+        """
+        Reads the tagger's predictions (AllenNLP json or lean format) into this graph, replacing its content.
+        All recipes in the file become one recipe with consecutive token IDs, as with json_to_conll.py
+        without --multi. The nodes come from the predicted tags; tagger output has no edges.
+        For files with many recipes, use iter_graphs_from_predictions().
+
+        Returns: self
+        """
+        return self._read_output_json(file, "tagger", token_ids)
+
+    def read_parser_output_json(self, file, token_ids=True):
+        """
+        Reads the parser's predictions (AllenNLP json or lean format) into this graph, replacing its content,
+        like read_tagger_output_json(). The nodes come from the input tags, the edges from the predicted
+        heads and dependencies.
+
+        Returns: self
+        """
+        return self._read_output_json(file, "parser", token_ids)
+
+    def _read_output_json(self, file, model_type, token_ids):
+        return self._read_rows(_prediction_rows(iter_prediction_records(file), model_type, file), file, token_ids)
+
     def read_sandros_parsers_output(self, file):
         raise NotImplementedError
 
@@ -167,8 +228,345 @@ class RecipeGraph(nx.DiGraph):
             # self[some_token]["amr"] = amr node ID of node
         raise NotImplementedError
 
-# The Jovo prototype needs a function next_step() but maybe we'll have a separate class for that;
-# also see dummy class in jovo repo
+
+def _recipe_graph_class():
+    """
+    Defines the class RecipeGraph on first use, s.t. networkx is only imported when it is needed.
+
+    Returns: the class RecipeGraph
+    """
+    if "RecipeGraph" not in globals():
+        import networkx as nx
+
+        class RecipeGraph(_RecipeGraphMethods, nx.DiGraph):
+            pass
+
+        # s.t. instances can be pickled (e.g. sent to or from worker processes)
+        RecipeGraph.__qualname__ = "RecipeGraph"
+        globals()["RecipeGraph"] = RecipeGraph
+    return globals()["RecipeGraph"]
+
+
+def __getattr__(name):
+    # e.g. `from recipe_graph import RecipeGraph` or `recipe_graph.RecipeGraph`
+    if name == "RecipeGraph":
+        return _recipe_graph_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _AttributeTable:
+    """
+    Interned attributes of a sequence of items (nodes or edges): per attribute name, one int32 code
+    per item (-1 if the item does not have the attribute) and the list of distinct values.
+    """
+
+    def __init__(self, attribute_dicts):
+        import numpy as np
+
+        self.names = []
+        self.codes = dict()
+        self.values = dict()
+        index = dict()
+        n = len(attribute_dicts)
+        for i, attributes in enumerate(attribute_dicts):
+            for name, value in attributes.items():
+                if name not in self.codes:
+                    self.names.append(name)
+                    self.codes[name] = np.full(n, -1, dtype=np.int32)
+                    self.values[name] = []
+                    index[name] = dict()
+                code = index[name].get(value)
+                if code is None:
+                    code = index[name][value] = len(self.values[name])
+                    self.values[name].append(value)
+                self.codes[name][i] = code
+
+    @classmethod
+    def from_codes(cls, codes, values):
+        """
+        Builds the table from the int32 code array and the list of distinct values of every attribute
+        name (two dictionaries with the same keys, in attribute order).
+        """
+        table = cls([])
+        table.names = list(codes)
+        table.codes = dict(codes)
+        table.values = dict(values)
+        return table
+
+    def __getitem__(self, i):
+        attributes = dict()
+        for name in self.names:
+            code = self.codes[name][i]
+            if code >= 0:
+                attributes[name] = self.values[name][code]
+        return attributes
+
+
+class _NodeView:
+    """
+    Read-only view on the nodes of a CompactRecipeGraph (like G.nodes of a nx.DiGraph).
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __len__(self):
+        return len(self._graph)
+
+    def __contains__(self, node):
+        return node in self._graph
+
+    def __getitem__(self, node):
+        return self._graph.node_attributes[self._graph.position(node)]
+
+    def data(self):
+        attributes = self._graph.node_attributes
+        return ((node, attributes[i]) for i, node in enumerate(self._graph.node_keys()))
+
+
+class _EdgeView:
+    """
+    Read-only view on the edges of a CompactRecipeGraph (like G.edges of a nx.DiGraph).
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        g = self._graph
+        keys = g.node_keys()
+        for u in range(len(keys)):
+            for v in g.indices[g.indptr[u] : g.indptr[u + 1]].tolist():
+                yield keys[u], keys[v]
+
+    def __len__(self):
+        return len(self._graph.indices)
+
+    def __contains__(self, edge):
+        return self._graph.edge_position(*edge) is not None
+
+    def __getitem__(self, edge):
+        e = self._graph.edge_position(*edge)
+        if e is None:
+            raise KeyError(f"The edge {edge} is not in the graph.")
+        return self._graph.edge_attributes[e]
+
+    def data(self):
+        # edges in CSR order, i.e. edge e has the attributes edge_attributes[e]
+        attributes = self._graph.edge_attributes
+        return ((u, v, attributes[e]) for e, (u, v) in enumerate(self))
+
+
+class CompactRecipeGraph:
+    """
+    Array-backed, read-only recipe graph with the same content as a RecipeGraph.
+
+    Nodes are numbered 0..n-1 in the order of the RecipeGraph's nodes; their IDs are stored in an int64
+    array (the node "end" as END_ID). Edges are stored CSR-style in both directions:
+        - successors of node i: indices[indptr[i]:indptr[i+1]], in the RecipeGraph's successor order
+        - predecessors of node i: in_indices[in_indptr[i]:in_indptr[i+1]]
+    Node attributes (label, node-type, origin, ...) and edge attributes (label) are interned per
+    attribute name (see _AttributeTable), s.t. e.g. the repeated edge labels are stored once.
+    nodes, edges, successors() and predecessors() behave like the nx.DiGraph methods for reading,
+    so the writers accept both classes; conversion to and from RecipeGraph is lossless
+    (except for the order of predecessors, which follows the order of the edges).
+    """
+
+    END_ID = -1
+
+    def __init__(self, node_ids, node_attributes, indptr, indices, edge_attributes):
+        import numpy as np
+
+        self.node_ids = node_ids
+        self.node_attributes = node_attributes
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_attributes = edge_attributes
+        # predecessors: edges sorted by target (stable, i.e. by source within each target)
+        sources = np.repeat(np.arange(len(node_ids)), np.diff(indptr))
+        self.in_indices = sources[np.argsort(indices, kind="stable")]
+        self.in_indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=len(node_ids)), out=self.in_indptr[1:])
+        # dense lookup table from node ID to position (-1: no such node)
+        self._positions = np.full(max(int(node_ids.max(initial=0)), 0) + 1, -1, dtype=np.int64)
+        token_nodes = node_ids >= 0
+        self._positions[node_ids[token_nodes]] = np.flatnonzero(token_nodes)
+        end = np.flatnonzero(~token_nodes)
+        self._end_position = int(end[0]) if len(end) else -1
+        self.recipe_text = None
+        self.upos = None
+        self.misc = None
+
+    @classmethod
+    def from_dicts(cls, nodes, adjacency):
+        """
+        Builds the arrays from a dict from node to attribute dict (in node order) and a dict
+        from node to a dict from successor to edge attribute dict (in successor order).
+        """
+        import numpy as np
+
+        keys = list(nodes)
+        positions = {node: i for i, node in enumerate(keys)}
+        node_ids = np.array([cls.END_ID if node == "end" else node for node in keys], dtype=np.int64)
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        indices = []
+        edge_dicts = []
+        for i, node in enumerate(keys):
+            for successor, attributes in adjacency.get(node, {}).items():
+                indices.append(positions[successor])
+                edge_dicts.append(attributes)
+            indptr[i + 1] = len(indices)
+        return cls(
+            node_ids,
+            _AttributeTable([nodes[node] for node in keys]),
+            indptr,
+            np.asarray(indices, dtype=np.int64),
+            _AttributeTable(edge_dicts),
+        )
+
+    @classmethod
+    def from_arrays(cls, node_ids, indptr, indices, node_codes, node_values, edge_codes, edge_values):
+        """
+        Builds the graph from its arrays without building attribute dicts (e.g. for loading it from a file).
+        Attributes are given per attribute name as an int32 array with one code per node (or edge; -1 if the
+        node does not have the attribute) and the list of values the codes refer to (see _AttributeTable).
+        """
+        return cls(
+            node_ids,
+            _AttributeTable.from_codes(node_codes, node_values),
+            indptr,
+            indices,
+            _AttributeTable.from_codes(edge_codes, edge_values),
+        )
+
+    @classmethod
+    def from_node_and_edge_lists(cls, node_tuples, edge_list):
+        """
+        Builds the graph from (node, attributes) and (head, tail, attributes) tuples, with the same node
+        and edge order as adding them to a nx.DiGraph with add_nodes_from() and add_edges_from().
+        """
+        nodes = dict()
+        adjacency = dict()
+        for node, attributes in node_tuples:
+            nodes.setdefault(node, dict()).update(attributes)
+        for u, v, attributes in edge_list:
+            nodes.setdefault(u, dict())
+            nodes.setdefault(v, dict())
+            adjacency.setdefault(u, dict()).setdefault(v, dict()).update(attributes)
+        return cls.from_dicts(nodes, adjacency)
+
+    @classmethod
+    def from_recipe_graph(cls, G):
+        """
+        Converts a RecipeGraph (or any nx.DiGraph with integer node IDs plus "end") into a CompactRecipeGraph.
+        """
+        compact = cls.from_dicts(dict(G.nodes(data=True)), {u: dict(G.adj[u]) for u in G})
+        compact.recipe_text = getattr(G, "recipe_text", None)
+        compact.upos = getattr(G, "upos", None)
+        compact.misc = getattr(G, "misc", None)
+        return compact
+
+    def to_recipe_graph(self):
+        """
+        Converts the graph back into a RecipeGraph.
+        """
+        G = _recipe_graph_class()()
+        G.add_nodes_from(self.nodes.data())
+        G.add_edges_from((u, v, dict(attributes)) for u, v, attributes in self.edges.data())
+        G.recipe_text = self.recipe_text
+        G.upos = self.upos
+        G.misc = self.misc
+        return G
+
+    def node_keys(self):
+        """
+        Returns: a list with the node IDs in node order ("end" for the end node)
+        """
+        return ["end" if node == self.END_ID else node for node in self.node_ids.tolist()]
+
+    def position(self, node):
+        """
+        Returns: the position (0..n-1) of node; raises KeyError if node is not in the graph
+        """
+        if node == "end":
+            if self._end_position < 0:
+                raise KeyError(node)
+            return self._end_position
+        import numpy as np
+
+        if isinstance(node, (int, np.integer)) and 0 <= node < len(self._positions):
+            i = self._positions[node]
+            if i >= 0:
+                return int(i)
+        raise KeyError(node)
+
+    def edge_position(self, u, v):
+        """
+        Returns: the position of edge (u, v) in the CSR arrays, or None if there is no such edge
+        """
+        try:
+            i, j = self.position(u), self.position(v)
+        except KeyError:
+            return None
+        import numpy as np
+
+        start = self.indptr[i]
+        hits = np.flatnonzero(self.indices[start : self.indptr[i + 1]] == j)
+        return int(start + hits[0]) if len(hits) else None
+
+    def _key(self, i):
+        node = int(self.node_ids[i])
+        return "end" if node == self.END_ID else node
+
+    def successors(self, node):
+        i = self.position(node)
+        return (self._key(j) for j in self.indices[self.indptr[i] : self.indptr[i + 1]].tolist())
+
+    def predecessors(self, node):
+        i = self.position(node)
+        return (self._key(j) for j in self.in_indices[self.in_indptr[i] : self.in_indptr[i + 1]].tolist())
+
+    def has_edge(self, u, v):
+        return self.edge_position(u, v) is not None
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def edges(self):
+        return _EdgeView(self)
+
+    def __iter__(self):
+        return iter(self.node_keys())
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node):
+        try:
+            self.position(node)
+        except KeyError:
+            return False
+        return True
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    # the CoNLL-U writer of RecipeGraph only reads the graph
+    token_tags = _RecipeGraphMethods.token_tags
+    write_to_conll = _RecipeGraphMethods.write_to_conll
+    heads_to_columns = _RecipeGraphMethods.heads_to_columns
+
+
+# The Jovo prototype needs a function next_step(): see StepIndex in step_index.py, which precomputes the
+# execution order of the action graph; also see dummy class in jovo repo
 
 
 
@@ -211,37 +609,95 @@ def reduced_tag(tag):
     else:
         return tag
 
+def _reduced_successors(successors, kept):
+    """
+    Computes the successor lists of the reduced graph, i.e. the result of deleting the removed nodes one by
+    one (in node order) and reconnecting their predecessors to their successors, without building the
+    intermediate graphs: kept node u ends up with an edge to kept node v iff the original graph has a path
+    from u to v whose inner nodes (if any) are all removed.
+
+    Deleting node x appends x's successors to the successor list of each predecessor of x. So the successor
+    list x has at the time of its deletion is computed once (from the lists of the removed nodes deleted
+    before x) and then reused for all predecessors; this keeps the order of the successors exactly as
+    in the step-by-step deletion.
+
+    Arguments:
+        - successors: list with the successor positions of every node (in successor order)
+        - kept: boolean list, True for the nodes of the reduced graph
+    Returns: dict from kept node position to the list of its successor positions in the reduced graph
+    """
+    n = len(successors)
+    # at_deletion[x]: successor list of removed node x at the time of its deletion
+    at_deletion = dict()
+
+    def expand(initial, limit):
+        # successor list after deleting all removed nodes before position limit
+        present = set(initial)
+        expanded = list(initial)
+        pending = [s for s in expanded if not kept[s] and s < limit]
+        heapq.heapify(pending)
+        while pending:
+            x = heapq.heappop(pending)
+            present.discard(x)
+            # x's successors are kept nodes or removed nodes after x (or x itself)
+            for s in at_deletion[x]:
+                if s != x and s not in present:
+                    present.add(s)
+                    expanded.append(s)
+                    if not kept[s] and s < limit:
+                        heapq.heappush(pending, s)
+        return [s for s in expanded if s in present]
+
+    for x in range(n):
+        if not kept[x]:
+            at_deletion[x] = expand(successors[x], x)
+    return {u: expand(successors[u], n) for u in range(n) if kept[u]}
+
+
 def generate_reduced_graph(G, desired):
     """
-    traverse full graph and delete nodes with undesired labels;
-    reconnect their predecessor(s) to their successor(s)
+    Computes the reduced graph of G, i.e. the graph without the nodes with undesired labels,
+    where the predecessor(s) of deleted nodes are reconnected to their successor(s)
+    (see _reduced_successors). G itself is not changed.
 
     Arguments:
-        - G: an nx.DiGraph
+        - G: a RecipeGraph (or nx.DiGraph) or a CompactRecipeGraph
         - desired: a List of NE-labels to define which kinds of nodes are to be preserved in the reduced graph
+    Returns: the reduced graph as a new object of the same class as G; kept nodes get the
+        additional attribute 'tag' (their reduced node type) and all edges are labelled "edge"
     """
-
-    # copy nodes so we can delete nodes while iterating over them
-    _nodes = copy.deepcopy(G.nodes)
-    for node in _nodes:
-        #print(f"node: {node} (should be int ID)")
-        #print(node, G.nodes[node])
-        if node != "end":
-            tag = reduced_tag(G.nodes[node]['node-type'])
-            if not tag in desired:
-                # add new edges from all predecessors of node to all successors
-                G.add_edges_from([(p,s) for p in G.predecessors(node) for s in G.successors(node)])
-                # delete node from G
-                G.remove_node(node)
-            else:
-                # change G[node]['tag'] to its reduced form
-                G.nodes[node]['tag'] = tag
-        else:
-            pass # TODO: do we need to do anything about the end nodes? What do they mean?
+    compact = isinstance(G, CompactRecipeGraph)
+    nodes = list(G.nodes)
+    positions = {node: i for i, node in enumerate(nodes)}
+    successors = [[positions[s] for s in G.successors(node)] for node in nodes]
+    tags = [None if node == "end" else reduced_tag(G.nodes[node]['node-type']) for node in nodes]
+    # the end node is always kept
+    kept = [tag is None or tag in desired for tag in tags]
+    reduced = _reduced_successors(successors, kept)
+
+    node_dicts = dict()
+    for i, node in enumerate(nodes):
+        if kept[i]:
+            attributes = dict(G.nodes[node])
+            if node != "end":
+                attributes['tag'] = tags[i]
+            node_dicts[node] = attributes
     # add label "edge" to all edges; I believe it was the alignment model that expects the label "edge" in action graphs
-    for h,t in G.edges:
-        G[h][t]['label'] = "edge"
-    return G
+    adjacency = {
+        nodes[u]: {nodes[s]: {"label": "edge"} for s in reduced_successors}
+        for u, reduced_successors in reduced.items()
+    }
+
+    if compact:
+        R = CompactRecipeGraph.from_dicts(node_dicts, adjacency)
+    else:
+        R = G.__class__()
+        R.add_nodes_from(node_dicts.items())
+        R.add_edges_from((u, s, attributes) for u, successors in adjacency.items() for s, attributes in successors.items())
+    for attribute in ("recipe_text", "upos", "misc"):
+        if hasattr(G, attribute):
+            setattr(R, attribute, getattr(G, attribute))
+    return R
 
 
 #################################################################
@@ -259,31 +715,28 @@ def edges_from_columns(columns):
     main_edge = (int(columns[6]), columns[7])
     edges = set()
     edges.add(main_edge)
-    if columns[8] == "_":
-        pass
-    elif columns[8].startswith("["):
-        try:
-            edges = edges.union(set(ast.literal_eval(columns[8]))) # parses IDs as int
-        except SyntaxError:
-            #SyntaxError: unexpected EOF while parsing
-            raise SyntaxError("Elements in column DEPS must not contain white space.")
-    else:
-        # Sandro's parsers' output format
-        _edges = columns[8].split("|")
-        for _e in _edges:
-            id,label = _e.split(":")
-            edges.add(tuple(int(id),label))
-
+    # list notation (e.g. "[(29,'t'),(34,'d')]") or Sandro's parsers' output format (e.g. "29:t|34:d")
+    # or, for rows built in memory, a list of (int, string) pairs
+    deps = columns[8]
+    edges.update(parse_deps(deps) if isinstance(deps, str) else deps) # parses IDs as int
     return edges
 
-def _read_graph_conllu(conllu_graph_file, token_ids, origin):
-    # TODO: can only read IOB2 tag format so far
+def _split_lines(lines):
+    """
+    :param lines: the token lines of one recipe in conllu format (see _iter_recipe_lines)
+    :return: generator of the column lists of the lines
+    """
+    for line in lines:
+        yield line.rstrip("\r\n").split("\t") # DEPS cells may contain spaces
+
+def _read_graph_rows(rows, token_ids, origin):
     """
     Reads in a graph - either recipe graph or action graph - and extracts all nodes,
-    edges, tag labels from the file.
+    edges, tag labels from the rows of one recipe.
     Input format is CoNLL-U: either the one we have been using where DEPS column values are lists of pairs of strings
     (e.g. "[(29,'t'),(34,'d')]") or the one that Sandro's parsers output (e.g. "29:t|34:d").
-    :param conllu_graph_file: path to graph file in conllu format
+    Tags can be in IOB2 or BIOUL format (U- is read like B-, L- like I-).
+    :param rows: the CoNLL-U columns of every token line of one recipe (see _split_lines)
     :param token_ids: whether the node labels should include the token ids
                 e.g. if ids = True then node is labelled with "1_Preheat" otherwise with "Preheat"
     :param origin: name of the recipe which the graph encodes
@@ -299,86 +752,84 @@ def _read_graph_conllu(conllu_graph_file, token_ids, origin):
     parents = []
     children = []
 
-    with open(conllu_graph_file, "r", encoding="utf-8") as grf:
-        complete_token = ""
-        prev_id = 0
-        prev_label = "O"
-        for line in grf:
-            columns = line.strip().split()
-            id = int(columns[0])
-            token = columns[1]
-            upos = columns[3]
-            tag = columns[4]
-            misc = columns[9]
-            edges = edges_from_columns(columns)
-
-            text_tokens.append(token)
-            upos_tokens.append(upos)
-            misc_tokens.append(misc)
-
-            if tag == "O":
-                if complete_token != "":
-                    node_tuple = (prev_id, {"label": complete_token, "node-type": prev_label, "origin": origin})
-                    node_tuples.append(node_tuple)
-                    complete_token = ""
-
-            elif tag[0] == "B":
-                if complete_token != "":
-                    node_tuple = (prev_id, {"label": complete_token, "node-type": prev_label, "origin": origin})
-                    node_tuples.append(node_tuple)
-                if token_ids:
-                    complete_token = str(id) + "_" + token
-                else:
-                    #complete_token = token
-                    complete_token = id #TODO: should be `complete_token = token`, right?
-                prev_id = id
-                prev_label = tag.split("-")[1]
-                """if edge_head != "0":
+    complete_token = ""
+    prev_id = 0
+    prev_label = "O"
+    for columns in rows:
+        id = int(columns[0])
+        token = columns[1]
+        upos = columns[3]
+        tag = columns[4]
+        misc = columns[9]
+        edges = edges_from_columns(columns)
+
+        text_tokens.append(token)
+        upos_tokens.append(upos)
+        misc_tokens.append(misc)
+
+        if tag == "O":
+            if complete_token != "":
+                node_tuple = (prev_id, {"label": complete_token, "node-type": prev_label, "origin": origin})
+                node_tuples.append(node_tuple)
+                complete_token = ""
+
+        elif tag[0] == "B" or tag[0] == "U":
+            if complete_token != "":
+                node_tuple = (prev_id, {"label": complete_token, "node-type": prev_label, "origin": origin})
+                node_tuples.append(node_tuple)
+            if token_ids:
+                complete_token = str(id) + "_" + token
+            else:
+                #complete_token = token
+                complete_token = id #TODO: should be `complete_token = token`, right?
+            prev_id = id
+            prev_label = tag.split("-")[1]
+            """if edge_head != "0":
+                edge_list.append((id, edge_head, {"label": edge_label}))
+                parents.append(id)
+                children.append(edge_head)"""
+            for edge_head, edge_label in edges:
+                #edge_head = int(edge_head)
+                if edge_head != 0:
                     edge_list.append((id, edge_head, {"label": edge_label}))
                     parents.append(id)
-                    children.append(edge_head)"""
-                for edge_head, edge_label in edges:
-                    #edge_head = int(edge_head)
-                    if edge_head != 0:
-                        edge_list.append((id, edge_head, {"label": edge_label}))
-                        parents.append(id)
-                        children.append(edge_head)
-
-            elif tag[0] == "I":
-                complete_token += " " + token
-                # TODO: put the following note / explanation into the GitHub Wiki
-                ## We didn't use to ignore the annotations on the "I-" tokens. This is mainly an issue of the
-                ## tree parser. With the proper graph parser, the parser can generate several edges on one
-                ## token (i.e. the "B-" token).
-                ## -  Reason for their existence: The parser annotates all tokens of the recipe text (as opposed to all
-                ## nodes in the graph, i.e. all meaningful chunks of the text).
-                ## - Argument why we'ven been adding such dependency edges to the corresponding node: the parser is
-                ## a tree parser and this is the only way to get multiple heads for one node.
-                ## Example of where the additional edge reflects the structure of the cooking process (both
-                ## heads of "ice cubes" are meaningful:
-                ## 130    Serve    _    _    B-Ac    _    137    t    _    _
-                ## 131    tea    _    _    B-F    _    130    t    _    _
-                ## 132    in    _    _    O    _    0    root    _    _
-                ## 133    glasses    _    _    B-T    _    130    d    _    _
-                ## 134    over    _    _    O    _    0    root    _    _
-                ## 135    ice    _    _    B-F    _    133    f-part-of    _    _
-                ## 136    cubes    _    _    I-F    _    137    t    _    _
-                ## 137    to    _    _    B-Ac2    _    0    root    _    _
-                ## 138    chill    _    _    I-Ac2    _    137    o    _    _
-                ## (from github/ara2.../southern_sweet_tea_3.conllu)
-                ## - Argument for ignoring dependency annotation on "I-" tokens: Strong bias
-                ## multi-token nodes vs single-token nodes. Also, it's not clear whether the parsing
-                ## accuracy on these annotations is satisfiable and whether it is actually correct to interpret them as
-                ## equally good as the annotations on the "B-" tokens.
-                ## Example where the additional edge makes no sense and is actually problematic because it is
-                ## creating a cycle:
-                ## 137	to	_	_	B-Ac2	_	0	root	_	_
-                ## 138	chill	_	_	I-Ac2	_	137	o	_	_
-                ## (from github/ara2.../southern_sweet_tea_3.conllu)
-
-        if complete_token != "":
-            node_tuple = (prev_id, {"label": complete_token, "node-type": prev_label, "origin": origin})
-            node_tuples.append(node_tuple)
+                    children.append(edge_head)
+
+        elif tag[0] == "I" or tag[0] == "L":
+            complete_token += " " + token
+            # TODO: put the following note / explanation into the GitHub Wiki
+            ## We didn't use to ignore the annotations on the "I-" tokens. This is mainly an issue of the
+            ## tree parser. With the proper graph parser, the parser can generate several edges on one
+            ## token (i.e. the "B-" token).
+            ## -  Reason for their existence: The parser annotates all tokens of the recipe text (as opposed to all
+            ## nodes in the graph, i.e. all meaningful chunks of the text).
+            ## - Argument why we'ven been adding such dependency edges to the corresponding node: the parser is
+            ## a tree parser and this is the only way to get multiple heads for one node.
+            ## Example of where the additional edge reflects the structure of the cooking process (both
+            ## heads of "ice cubes" are meaningful:
+            ## 130    Serve    _    _    B-Ac    _    137    t    _    _
+            ## 131    tea    _    _    B-F    _    130    t    _    _
+            ## 132    in    _    _    O    _    0    root    _    _
+            ## 133    glasses    _    _    B-T    _    130    d    _    _
+            ## 134    over    _    _    O    _    0    root    _    _
+            ## 135    ice    _    _    B-F    _    133    f-part-of    _    _
+            ## 136    cubes    _    _    I-F    _    137    t    _    _
+            ## 137    to    _    _    B-Ac2    _    0    root    _    _
+            ## 138    chill    _    _    I-Ac2    _    137    o    _    _
+            ## (from github/ara2.../southern_sweet_tea_3.conllu)
+            ## - Argument for ignoring dependency annotation on "I-" tokens: Strong bias
+            ## multi-token nodes vs single-token nodes. Also, it's not clear whether the parsing
+            ## accuracy on these annotations is satisfiable and whether it is actually correct to interpret them as
+            ## equally good as the annotations on the "B-" tokens.
+            ## Example where the additional edge makes no sense and is actually problematic because it is
+            ## creating a cycle:
+            ## 137	to	_	_	B-Ac2	_	0	root	_	_
+            ## 138	chill	_	_	I-Ac2	_	137	o	_	_
+            ## (from github/ara2.../southern_sweet_tea_3.conllu)
+
+    if complete_token != "":
+        node_tuple = (prev_id, {"label": complete_token, "node-type": prev_label, "origin": origin})
+        node_tuples.append(node_tuple)
 
     # add 'end' node (TODO: should we add also the start node?)
     for child in children:
@@ -405,18 +856,326 @@ def _read_graph_conllu(conllu_graph_file, token_ids, origin):
     return node_tuples, edge_list, text_tokens, upos_tokens, misc_tokens #, tags_dict
 
 
-def read_graph_from_conllu(conllu_graph_file, token_ids=True):
+def _iter_recipe_lines(lines):
+    """
+    Splits the lines of a CoNLL-U file into recipes, which are separated by empty lines.
+    Comment lines (starting with #) are collected for the recipe that follows them.
+    :param lines: iterable of lines, e.g. an open file
+    :return: generator of (comment lines, token lines) per recipe
+    """
+    comments = []
+    recipe = []
+    for line in lines:
+        if line.startswith("#"):
+            comments.append(line)
+        elif line.strip() == "":
+            if recipe:
+                yield comments, recipe
+                comments = []
+                recipe = []
+        else:
+            recipe.append(line)
+    if recipe:
+        yield comments, recipe
+
+
+def _recipe_name(comments, default):
+    """
+    :return: the recipe name given in a "# name = ..." or "# sent_id = ..." comment, otherwise default
+    """
+    for comment in comments:
+        key, sep, value = comment.lstrip("#").partition("=")
+        if sep and key.strip() in ("name", "sent_id"):
+            return value.strip()
+    return default
+
+
+def _graph_from_rows(rows, token_ids, compact, origin):
+    """
+    Builds the graph of one recipe from the columns of its token lines (see _read_graph_rows).
+    :return: a graph in NetworkX format (RecipeGraph) or a CompactRecipeGraph
+    """
+    nodes, edges, text_tokens, upos_tokens, misc_tokens = _read_graph_rows(rows, token_ids, origin)
+
+    if compact:
+        G = CompactRecipeGraph.from_node_and_edge_lists(nodes, edges)
+    else:
+        G = _recipe_graph_class()()
+        G.add_nodes_from(nodes)
+        G.add_edges_from(edges)
+    # TODO: it would be better to create a small class with all the information of the original CoNLL-U file
+    ## i.e. the column informations like tokens, upos, misc for the whole text (not just tokens that are in graph nodes),
+    ## also "origin"
+    ## Then, each node and G would have one attribute 'origin' which is an instance of the mentioned class. In particular,
+    ## all nodes from the same file (and the graph, if applicable) have the exact same object as origin.
+    G.recipe_text = text_tokens
+    G.upos = upos_tokens
+    G.misc = misc_tokens
+    return G
+
+
+def index_conllu_recipes(conllu_file):
+    """
+    Indexes the recipes of a multi-recipe CoNLL-U file (e.g. train.conllu) for random access
+    with iter_graphs_from_conllu(..., recipes=[...]). Recipes are named as in iter_graphs_from_conllu().
+    :param conllu_file: path to a CoNLL-U file with one or more recipes separated by empty lines
+    :return: an (ordered) dictionary from recipe name to the byte offset of the recipe in the file
+    """
+    stem = os.path.splitext(os.path.basename(conllu_file))[0]
+    index = dict()
+    offset = 0
+    start = None  # offset of the first line (comment or token) of the current recipe
+    comments = []
+    has_tokens = False
+    with open(conllu_file, "rb") as f:
+        for line in f:
+            if line.strip() == b"":
+                if has_tokens:
+                    name = _recipe_name(comments, f"{stem}_{len(index)}")
+                    if name in index:
+                        raise IOError(f"Recipe name {name} occurs twice in {conllu_file}.")
+                    index[name] = start
+                    start = None
+                    comments = []
+                    has_tokens = False
+            else:
+                if start is None:
+                    start = offset
+                if line.startswith(b"#"):
+                    comments.append(line.decode("utf-8"))
+                else:
+                    has_tokens = True
+            offset += len(line)
+    if has_tokens:
+        name = _recipe_name(comments, f"{stem}_{len(index)}")
+        if name in index:
+            raise IOError(f"Recipe name {name} occurs twice in {conllu_file}.")
+        index[name] = start
+    return index
+
+
+def iter_graphs_from_conllu(conllu_file, token_ids=True, compact=False, recipes=None, index=None):
+    """
+    Reads the recipes of a multi-recipe CoNLL-U file (e.g. train.conllu, recipes separated by empty lines)
+    one by one and yields their graphs. Only the current recipe is held in memory.
+    Recipes are named by a "# name = ..." or "# sent_id = ..." comment if they have one, otherwise
+    <file name>_<position of the recipe in the file>; the origin of their nodes is "G_" + name.
+    :param conllu_file: path to the CoNLL-U file, or an open text stream (without recipes and index)
+    :param token_ids: see _read_graph_rows
+    :param compact: yield CompactRecipeGraphs instead of RecipeGraphs
+    :param recipes: optional list of recipe names; only these recipes are read, in this order, by seeking
+                to their offsets in the file
+    :param index: optional index of the file (see index_conllu_recipes), built if needed and not given
+    :return: generator of graphs in NetworkX format (RecipeGraph) or CompactRecipeGraphs
+    """
+    if recipes is not None:
+        if index is None:
+            index = index_conllu_recipes(conllu_file)
+        with open(conllu_file, "rb") as f:
+            for name in recipes:
+                if name not in index:
+                    raise KeyError(f"There is no recipe {name} in {conllu_file}.")
+                f.seek(index[name])
+                lines = []
+                for line in f:
+                    if line.strip() == b"":
+                        break
+                    if not line.startswith(b"#"):
+                        lines.append(line.decode("utf-8"))
+                yield _graph_from_rows(_split_lines(lines), token_ids, compact, "G_" + name)
+        return
+
+    if hasattr(conllu_file, "read"):
+        stem = os.path.splitext(os.path.basename(getattr(conllu_file, "name", "recipe")))[0]
+        for i, (comments, lines) in enumerate(_iter_recipe_lines(conllu_file)):
+            yield _graph_from_rows(_split_lines(lines), token_ids, compact, "G_" + _recipe_name(comments, f"{stem}_{i}"))
+        return
+    with open(conllu_file, "r", encoding="utf-8") as f:
+        yield from iter_graphs_from_conllu(f, token_ids, compact)
+
+
+def _prediction_rows(records, model_type, pred_file, offset=0):
+    """
+    Compiles the CoNLL-U columns that json_to_conll.py writes for prediction records (see
+    iter_prediction_records), without writing them: ID FORM _ _ XPOS _ HEAD DEPREL _ _, where tagger
+    tokens get HEAD = 0 and DEPREL = root. Token IDs continue after offset.
+    :return: generator of column lists
+    """
+    for record in records:
+        if model_type is not None and record["model_type"] != model_type:
+            raise ValueError(f"{pred_file} does not contain {model_type} output.")
+        tokens = record["words"]
+        tags = record["tags"]
+        heads = record["heads"]
+        deps = record["deps"]
+        if heads is None:
+            heads = ["0"] * len(tokens)
+            deps = ["root"] * len(tokens)
+        if not len(tokens) == len(tags) == len(heads) == len(deps):
+            raise ValueError(
+                f"Will not zip tokens, tags, heads and deps: number of tokens "
+                f"in tokens and number of tags in tags must be the same. "
+                f"Got {len(tokens)}, {len(tags)}, {len(heads)} and {len(deps)}."
+            )
+        for i, (token, tag, head, dep) in enumerate(zip(tokens, tags, heads, deps), start=offset + 1):
+            yield [str(i), token, "_", "_", tag, "_", head, dep, "_", "_"]
+        offset += len(tokens)
+
+
+def iter_graphs_from_predictions(pred_file, model_type=None, token_ids=True, compact=False):
+    """
+    Streams the predictions of our tagger or parser (AllenNLP json or lean format, one recipe per line)
+    and yields one graph per recipe, as json_to_conll.py --multi followed by iter_graphs_from_conllu()
+    would, but without writing and rereading a CoNLL-U file. Tagger output gives graphs without edges.
+    Recipe i gets the origin "G_<file name>_<i>".
+    :param pred_file: prediction file (see json_to_conll.iter_prediction_records)
+    :param model_type: optional; "tagger" or "parser" to make sure the file contains output of that model
+    :param token_ids: see _read_graph_rows
+    :param compact: yield CompactRecipeGraphs instead of RecipeGraphs
+    :return: generator of graphs in NetworkX format (RecipeGraph) or CompactRecipeGraphs
+    """
+    stem = os.path.splitext(os.path.basename(pred_file))[0]
+    for i, record in enumerate(iter_prediction_records(pred_file)):
+        yield _graph_from_rows(_prediction_rows([record], model_type, pred_file), token_ids, compact, f"G_{stem}_{i}")
+
+
+def _flow_rows(list_file, flow_file):
+    """
+    Compiles the CoNLL-U columns that flowgraph_to_conll.py writes for a *.list / *.flow pair
+    (ID FORM _ POS LABEL _ HEAD DEPREL DEPS _), with DEPS as a list of (head, label) pairs.
+    :return: list of column lists
+    """
+    from flowgraph_to_conll import read_flow, read_list
+
+    id_dict, lines = read_list(list_file)
+    flow_dict = read_flow(flow_file, id_dict)
+    rows = []
+    for line in lines:
+        if line == []:
+            # sentence boundary
+            continue
+        deps = flow_dict.get(line[0])
+        if deps:
+            rows.append([str(line[0]), line[1], "_", line[2], line[3], "_", str(deps[0][0]), deps[0][1], deps[1:], "_"])
+        else:
+            # token has no head, so it must be root
+            rows.append([str(line[0]), line[1], "_", line[2], line[3], "_", "0", "root", "_", "_"])
+    return rows
+
+
+def _brat_rows(ann_file, parzu_file):
+    """
+    Compiles the CoNLL-U columns that brat_to_conll.py writes for a brat annotation file and its ParZu
+    parse (ID FORM _ POS LABEL _ HEAD DEPREL DEPS _), with DEPS as a list of (head, label) pairs.
+    As in brat_to_conll.py, annotated tokens without a head are written with the label O.
+    :return: list of column lists
+    """
+    # brat_to_conll imports pandas
+    from brat_to_conll import add_dependencies, align_parzu, read_annotation
+
+    annotation, events, relations, aliasses = read_annotation(ann_file)
+    conll = align_parzu(annotation, parzu_file, os.devnull, False)
+    conll = add_dependencies(conll, events, relations, aliasses)
+    rows = []
+    for ref, entry in conll.items():
+        if ref[0] == "X" or ref[0] == "S":
+            continue
+        if ref[0] == "N":
+            # token not annotated
+            rows.append([str(entry[0]), entry[1], "_", entry[2], "O", "_", "0", "root", "_", "_"])
+        elif ref[0] == "T":
+            for line in entry:
+                if len(line) > 4:
+                    if len(line) > 5:
+                        # token is child of several heads; delete duplicates in deps
+                        line = line[:4] + list(set(line[4:]))
+                    head, deprel = line[4]
+                    deps = [(int(h), label) for h, label in set(line[5:])]
+                    rows.append([str(line[0]), line[1], "_", line[2], line[3], "_", head, deprel, deps, "_"])
+                else:
+                    rows.append([str(line[0]), line[1], "_", line[2], "O", "_", "0", "root", "_", "_"])
+        else:
+            raise RuntimeError("Unexpected reference " + ref)
+    return rows
+
+
+def iter_graphs_from_annotations(directory, annotation_format="flow", token_ids=True, compact=False):
+    """
+    Loads all annotated recipes of a corpus directory (searched recursively, in sorted order):
+        - "flow": every *.flow file with its *.list file (see RecipeGraph.read_graph_from_flow)
+        - "brat": every *.ann file with its *.txt.parzu file (see RecipeGraph.read_graph_from_brat)
+    The nodes' origin is "G_" + the name of the .flow or .ann file.
+    :param compact: yield CompactRecipeGraphs instead of RecipeGraphs
+    :return: generator of graphs in NetworkX format (RecipeGraph) or CompactRecipeGraphs
+    """
+    if annotation_format == "flow":
+        extension = ".flow"
+    elif annotation_format == "brat":
+        extension = ".ann"
+    else:
+        raise ValueError(f"Unexpected annotation format {annotation_format}. Valid options are {{flow, brat}}.")
+    files = []
+    for root, _, names in os.walk(directory):
+        files.extend(os.path.join(root, name) for name in names if name.endswith(extension))
+    for file in sorted(files):
+        if annotation_format == "flow":
+            rows = _flow_rows(file[:-4] + "list", file)
+        else:
+            rows = _brat_rows(file, file[:-3] + "txt.parzu")
+        yield _graph_from_rows(rows, token_ids, compact, "G_" + os.path.splitext(os.path.basename(file))[0])
+
+
+def _open_graph_index(index):
+    from graph_index import GraphIndex
+
+    return index if isinstance(index, GraphIndex) else GraphIndex(index)
+
+
+def find_nodes(index, label=None, lemma=None, node_type=None, incoming=None, outgoing=None):
+    """
+    Finds the graph nodes that fulfill all given conditions in an index built with graph_index.py.
+    E.g. the tools "oven" used by an action: find_nodes(index, label="oven", node_type="T", outgoing=("t", "Ac"))
+    (edges point from a token to its head, see graph_index.py).
+    :param index: a GraphIndex or the directory of one
+    :param label, lemma, node_type, incoming, outgoing: see GraphIndex.nodes
+    :return: list of (conllu file, recipe name, node ID) triples
+    """
+    index = _open_graph_index(index)
+    return index.locate(index.nodes(label, lemma, node_type, incoming, outgoing))
+
+
+def find_recipes(index, *patterns):
+    """
+    Finds the recipes that have a node for every pattern in an index built with graph_index.py.
+    :param index: a GraphIndex or the directory of one
+    :param patterns: dictionaries with the keyword arguments of find_nodes, e.g. {"label": "oven", "node_type": "T"}
+    :return: list of (conllu file, recipe name) pairs
+    """
+    return _open_graph_index(index).find_recipes(*patterns)
+
+
+def iter_graphs_from_index(index, *patterns, token_ids=True, compact=False):
+    """
+    Reads the graphs of the recipes found by find_recipes from their CoNLL-U files (see iter_graphs_from_conllu).
+    :return: generator of graphs in NetworkX format (RecipeGraph) or CompactRecipeGraphs
+    """
+    names = dict()  # conllu file -> recipe names, in corpus order
+    for conllu_file, name in find_recipes(index, *patterns):
+        names.setdefault(conllu_file, []).append(name)
+    for conllu_file, recipes in names.items():
+        yield from iter_graphs_from_conllu(conllu_file, token_ids, compact, recipes=recipes)
+
+
+def read_graph_from_conllu(conllu_graph_file, token_ids=True, compact=False):
     """
     Reads into a graph file - either recipe or action graph - in conllu format and transforms it into
     a NetworkX object.
     Input format is CoNLL-U: either the one we have been using where DEPS column values are lists of pairs of strings
     (e.g. "[(29,'t'),(34,'d')]") or the one that Sandro's parsers output (e.g. "29:t|34:d").
     :param graph_file: path to graph file in conllu format
-    :return: a graph in NetworkX format
+    :param compact: return a CompactRecipeGraph instead (without building the NetworkX graph)
+    :return: a graph in NetworkX format (RecipeGraph) or a CompactRecipeGraph
     """
-    import collections
-    node_list = []
-
     # conllu_graph_file_name = conllu_graph_file.split('/')[-1]  # remove path and keep only file name
     # conllu_graph_file_name = '.'.join(conllu_graph_file_name.split('.')[:-1])  # remove file ending .conllu
     conllu_graph_file_name = os.path.basename(conllu_graph_file)  # remove path and keep only file name
@@ -425,19 +1184,12 @@ def read_graph_from_conllu(conllu_graph_file, token_ids=True):
         conllu_graph_file_name)  # TODO: should be a node attribute bc later, in the consolidated graph, we want to know where this node came from
     # TODO: should also be graph attribute
 
-    nodes, edges, text_tokens, upos_tokens, misc_tokens = _read_graph_conllu(conllu_graph_file, token_ids, G_name)
-
-    G = RecipeGraph()
-    G.add_nodes_from(nodes)
-    G.add_edges_from(edges)
-    # TODO: it would be better to create a small class with all the information of the original CoNLL-U file
-    ## i.e. the column informations like tokens, upos, misc for the whole text (not just tokens that are in graph nodes),
-    ## also "origin"
-    ## Then, each node and G would have one attribute 'origin' which is an instance of the mentioned class. In particular,
-    ## all nodes from the same file (and the graph, if applicable) have the exact same object as origin.
-    G.recipe_text = text_tokens
-    G.upos = upos_tokens
-    G.misc = misc_tokens
+    with open(conllu_graph_file, "r", encoding="utf-8") as grf:
+        recipes = _iter_recipe_lines(grf)
+        _, lines = next(recipes, ([], []))
+        if next(recipes, None) is not None:
+            raise IOError(f"{conllu_graph_file} contains several recipes. Read it with iter_graphs_from_conllu().")
+    G = _graph_from_rows(_split_lines(lines), token_ids, compact, G_name)
 
     """
     # the following extracts not only the node indices, but also their labels
@@ -461,61 +1213,121 @@ def read_graph_from_conllu(conllu_graph_file, token_ids=True):
 
     return G
 
+def graph_to_simple_conllu(G):
+    """
+    Compiles the lines of a graph in the simplified CoNLL-U format: one line per node (except "end"),
+    in node order, with the columns ID FORM LEMMA UPOS XPOS FEATS followed by the IDs of all successors.
+    Successors are read from the graph's adjacency, so this takes time linear in the size of the graph.
+    :param G: graph in NetworkX format (RecipeGraph) or a CompactRecipeGraph
+    :return: the lines as one String
+    """
+    lines = []
+    successors = G.successors
+    for node, attributes in G.nodes.data():
+        if node == "end":
+            continue
+        # no "node-type" means that the token is not a node in the recipe graph; therefore, the node type (and consequently the tag) is 'O'
+        line = [str(node), attributes["label"], "_", "_", attributes.get("node-type", "O"), "_"]
+        line.extend(str(successor) for successor in successors(node))
+        lines.append("\t".join(line))
+    lines.append("")
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
 def write_graph_to_simple_conllu(networkx_graph, outfile):
     """
     #:param outdirectory: it is possible to either specify outdir or it gets automatically created
-    :param networkx_graph: path to graph file in NetworkX format
+    :param networkx_graph: path to graph file in NetworkX format (or a CompactRecipeGraph)
     :return: an action/recipe graph file (so only the lines that contain the tagged tokens are included) in conllu format
     """
+    # Write action graph into CoNLL-U file
+    with open(outfile, "w", encoding="utf-8") as o:
+        o.write(graph_to_simple_conllu(networkx_graph))
+    print("NetworkX graph has been transformed in conllu format")
 
-    G = networkx_graph
 
-    # Write action graph into CoNLL-U file
-    with open((outfile), "w", encoding="utf-8") as o:
-        #with open(networkx_graph, "r", encoding="utf-8") as g:
-        for node in G.nodes:
-            #print(node)
-            #outfile = G.nodes[node]["origin"] # sometimes it doesn't work, look at it further
-            if node != "end":
-                id = node
-                #print(node)
-                #print(G.nodes[node])
-                token = G.nodes[node]["label"]
-                try:
-                    tag = G.nodes[node]["node-type"]
-                except KeyError:
-                    # KeyError for "node-type" means that the token is not a node in the recipe graph; therefore, the node type (and consequently the tag) is 'O'
-                    tag = "O"
-                line = [str(id), token, "_", "_", tag, "_"]
-
-                for edge in G.edges:
-                    if edge[0] == node:
-                        line.append(str(edge[1])) # TODO: double-check
-
-                o.write("\t".join(line))
+def write_graphs_to_simple_conllu(graphs, outfile):
+    """
+    Writes several graphs into one file in the simplified CoNLL-U format (see graph_to_simple_conllu),
+    separated by empty lines.
+    :param graphs: iterable of graphs in NetworkX format (RecipeGraph) or CompactRecipeGraphs
+    :return: the number of graphs written
+    """
+    n_graphs = 0
+    with open(outfile, "w", encoding="utf-8", buffering=1 << 20) as o:
+        for G in graphs:
+            if n_graphs:
                 o.write("\n")
-    # TODO: bug: Why does the last line appear twice in the output file?
-    print("NetworkX graph has been transformed in conllu format")
+            o.write(graph_to_simple_conllu(G))
+            n_graphs += 1
+    return n_graphs
 
 
 ## Test ##
 
-recipe="recipe.conllu" # perfect example: branched, disconnected, cyclic;
-#                        path: "English Yamakata & Mori Corpus\r-200\test\recipe-00043-11216.conllu"
-
-
-# 1. read graph from file
-G=read_graph_from_conllu(recipe)
-# 2. write to file
-write_graph_to_simple_conllu(G,outfile="duplicate_simple.conllu")
-G.write_to_conll("duplicate.conllu")
-# 3. reduce graph to FAT graph
-G=generate_reduced_graph(G,fat_labels)
-# 4. write fat graph
-write_graph_to_simple_conllu(G,"fatgraph.conllu")
-# 5. further reduce graph to action graph
-G=generate_reduced_graph(G,action_labels)
-# 6. write action graph to file
-write_graph_to_simple_conllu(G,"actiongraph.conllu")
-G.write_to_conll("real_actiongraph.conllu")
+# the example recipe next to this script, so the test scenario runs from any working directory
+TEST_RECIPE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipe.conllu")
 
+
+def run_test(recipe=TEST_RECIPE, out_dir="."):
+    """
+    Test scenario: reads a recipe graph, writes it back, reduces it to a FAT graph and an action graph
+    and writes these, into five files in out_dir.
+    """
+    # recipe.conllu is a perfect example: branched, disconnected, cyclic;
+    #   path: "English Yamakata & Mori Corpus\r-200\test\recipe-00043-11216.conllu"
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 1. read graph from file
+    G=read_graph_from_conllu(recipe)
+    # 2. write to file
+    write_graph_to_simple_conllu(G,outfile=os.path.join(out_dir, "duplicate_simple.conllu"))
+    G.write_to_conll(os.path.join(out_dir, "duplicate.conllu"))
+    # 3. reduce graph to FAT graph
+    G=generate_reduced_graph(G,fat_labels)
+    # 4. write fat graph
+    write_graph_to_simple_conllu(G,os.path.join(out_dir, "fatgraph.conllu"))
+    # 5. further reduce graph to action graph
+    G=generate_reduced_graph(G,action_labels)
+    # 6. write action graph to file
+    write_graph_to_simple_conllu(G,os.path.join(out_dir, "actiongraph.conllu"))
+    G.write_to_conll(os.path.join(out_dir, "real_actiongraph.conllu"))
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Reduces CoNLL-U recipe graphs to FAT graphs or action graphs.""")
+    subcommands = arg_parser.add_subparsers(dest="command", required=True)
+
+    reduce_parser = subcommands.add_parser(
+        "reduce", help="""Reduce one recipe graph to a FAT graph or an action graph.""")
+    reduce_parser.add_argument("recipe", metavar="RECIPE_FILE",
+                               help="""Recipe graph in CoNLL-U format.""")
+    reduce_parser.add_argument("-o", "--output", dest="out", metavar="OUTPUT_FILE", required=True,
+                               help="""Output file.""")
+    reduce_parser.add_argument("-t", "--type", dest="graph_type", choices=["fat", "action"], default="action",
+                               help="""Graph type. Default: action""")
+    reduce_parser.add_argument("-f", "--format", dest="format", choices=["conllu", "simple"], default="conllu",
+                               help="""Output format: CoNLL-U with the full recipe text or the simplified format
+                               with graph nodes only. Default: conllu""")
+
+    test_parser = subcommands.add_parser(
+        "test", help="""Test scenario: read, write and reduce one recipe graph (writes five files).""")
+    test_parser.add_argument("recipe", metavar="RECIPE_FILE", nargs="?", default=TEST_RECIPE,
+                             help="""Recipe graph in CoNLL-U format. Default: recipe.conllu next to this script""")
+    test_parser.add_argument("-o", "--output", dest="out_dir", metavar="OUTPUT_DIR", default=".",
+                             help="""Output directory. Default: current directory""")
+
+    args = arg_parser.parse_args()
+
+    if args.command == "reduce":
+        G = read_graph_from_conllu(args.recipe)
+        G = generate_reduced_graph(G, fat_labels if args.graph_type == "fat" else action_labels)
+        if args.format == "simple":
+            write_graph_to_simple_conllu(G, args.out)
+        else:
+            G.write_to_conll(args.out)
+    else:
+        run_test(args.recipe, args.out_dir)
@@ -0,0 +1,178 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Traverses a directory tree (e.g. data/English/Parser/individual-recipes with the splits train, dev
+and test) and reduces every CoNLL-U recipe graph in it to a FAT graph and/or an action graph
+(see generate_reduced_graph() in recipe_graph.py).
+
+Recipes are processed in a pool of worker processes. The results are collected in the order of the
+input files (sorted paths), so the output does not depend on the number of workers. A recipe that
+cannot be read or reduced does not stop the run; all failures are reported at the end.
+
+Output, for every graph type (fat, action) in its own subdirectory of the output directory:
+    - by default, one file per recipe, at the same relative path as the input file
+    - with --concat, one file per directory of the input tree (i.e. per split), named after the
+      directory (e.g. action/train.conllu), with the recipes in input order, separated by empty lines
+
+Tested with Python 3.11
+"""
+
+import argparse
+import io
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from recipe_graph import action_labels, fat_labels, generate_reduced_graph, graph_to_simple_conllu, \
+    read_graph_from_conllu
+
+GRAPH_TYPES = {"fat": fat_labels, "action": action_labels}
+
+
+def find_recipes(input_dir, extension=".conllu"):
+    """
+    Returns: a sorted list with the paths (relative to input_dir) of all files with the given extension in the tree
+    """
+    recipes = []
+    for directory, subdirectories, files in os.walk(input_dir):
+        subdirectories.sort()
+        for file in files:
+            if file.endswith(extension):
+                recipes.append(os.path.relpath(os.path.join(directory, file), input_dir))
+    return sorted(recipes)
+
+
+def _render(graph, out_format):
+    """
+    Returns: the graph in CoNLL-U format (full recipe text) or in the simplified format (graph nodes only) as String
+    """
+    if out_format == "simple":
+        return graph_to_simple_conllu(graph)
+    buffer = io.StringIO()
+    graph.write_to_conll(buffer)
+    return buffer.getvalue()
+
+
+def reduce_recipe(job):
+    """
+    Reduces one recipe graph file into the requested graph types (runs in a worker process).
+    Each reduction starts from the previous, smaller one (full graph -> FAT graph -> action graph).
+
+    Arguments:
+        - job: (path, graph_types, out_format) tuple
+    Returns: (path, outputs, error), where outputs is a dictionary from graph type to the rendered graph
+        and error is None or the traceback if the recipe could not be processed
+    """
+    path, graph_types, out_format = job
+    try:
+        # the array-backed graph is cheaper to build and reduce and gives the same output
+        G = read_graph_from_conllu(path, compact=True)
+        outputs = dict()
+        for graph_type in sorted(graph_types, key=list(GRAPH_TYPES).index):
+            G = generate_reduced_graph(G, GRAPH_TYPES[graph_type])
+            outputs[graph_type] = _render(G, out_format)
+        return path, outputs, None
+    except Exception:
+        return path, None, traceback.format_exc()
+
+
+def split_name(recipe, input_dir):
+    """
+    Returns: the name of the concatenated output file of a recipe, i.e. its directory relative to input_dir
+        (the name of input_dir itself for files at the top level)
+    """
+    directory = os.path.dirname(recipe)
+    if directory == "":
+        return os.path.basename(os.path.normpath(os.path.abspath(input_dir)))
+    return directory.replace(os.sep, "_")
+
+
+def reduce_directory(input_dir, out_dir, graph_types=("fat", "action"), out_format="conllu", concat=False,
+                     workers=None, chunksize=4):
+    """
+    Reduces all recipe graphs in the tree input_dir and writes them into out_dir (see module docstring).
+
+    Returns: the number of processed recipes and a list of (path, traceback) pairs for the failed ones
+    """
+    recipes = find_recipes(input_dir)
+    jobs = [(os.path.join(input_dir, recipe), tuple(graph_types), out_format) for recipe in recipes]
+    errors = []
+    concatenated = dict()  # (graph type, split) -> open file
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() yields the results in input order
+            for recipe, (path, outputs, error) in zip(recipes, executor.map(reduce_recipe, jobs, chunksize=chunksize)):
+                if error is not None:
+                    errors.append((path, error))
+                    continue
+                for graph_type, text in outputs.items():
+                    if concat:
+                        key = (graph_type, split_name(recipe, input_dir))
+                        if key not in concatenated:
+                            os.makedirs(os.path.join(out_dir, graph_type), exist_ok=True)
+                            concatenated[key] = open(
+                                os.path.join(out_dir, graph_type, key[1] + ".conllu"), "w", encoding="utf-8")
+                        else:
+                            concatenated[key].write("\n")
+                        concatenated[key].write(text)
+                    else:
+                        out_file = os.path.join(out_dir, graph_type, recipe)
+                        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+                        with open(out_file, "w", encoding="utf-8") as o:
+                            o.write(text)
+    finally:
+        for o in concatenated.values():
+            o.close()
+    return len(recipes), errors
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Traverses a directory tree and reduces all CoNLL-U recipe graphs in it to FAT graphs
+        and/or action graphs, in parallel.""")
+    arg_parser.add_argument("input_dir", metavar="INPUT_DIR",
+                            help="""Directory tree with recipe graphs (.conllu), e.g. data/English/Parser/individual-recipes.""")
+    arg_parser.add_argument("-o", "--output", dest="out_dir", metavar="OUTPUT_DIR", required=True,
+                            help="""Output directory; gets one subdirectory per graph type.""")
+    arg_parser.add_argument("-t", "--type", dest="graph_types", nargs="+", choices=list(GRAPH_TYPES),
+                            default=list(GRAPH_TYPES),
+                            help="""Graph type(s) to generate. Default: fat action""")
+    arg_parser.add_argument("-f", "--format", dest="format", choices=["conllu", "simple"], default="conllu",
+                            help="""Output format: CoNLL-U with the full recipe text (RecipeGraph.write_to_conll) or
+                            the simplified format with graph nodes only (graph_to_simple_conllu). Default: conllu""")
+    arg_parser.add_argument("--concat", dest="concat", action="store_true",
+                            help="""Write one concatenated file per directory (split) instead of one file per recipe.""")
+    arg_parser.add_argument("-j", "--workers", dest="workers", type=int, default=None,
+                            help="""Number of worker processes. Default: number of CPUs""")
+    arg_parser.add_argument("--errors", dest="errors_file", metavar="ERRORS_FILE",
+                            help="""Optional: write the failed recipes and their errors into this file.""")
+    args = arg_parser.parse_args()
+
+    n_recipes, errors = reduce_directory(
+        args.input_dir, args.out_dir, args.graph_types, args.format, args.concat, args.workers)
+    print(f"{args.input_dir}: {n_recipes - len(errors)} of {n_recipes} recipes reduced into {args.out_dir}")
+
+    if errors:
+        print(f"{len(errors)} recipe(s) failed:", file=sys.stderr)
+        for path, error in errors:
+            print(f"  {path}: {error.strip().splitlines()[-1]}", file=sys.stderr)
+        if args.errors_file:
+            with open(args.errors_file, "w", encoding="utf-8") as o:
+                for path, error in errors:
+                    o.write(f"{path}\n{error}\n")
+        sys.exit(1)
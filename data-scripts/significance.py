@@ -0,0 +1,148 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Recipe-level bootstrap confidence intervals and paired approximate randomization tests.
+
+Both work on per-recipe count tensors of shape (num_recipes x num_labels x 3) holding
+TP, FP and FN of every recipe and label. Resampling never loops over recipes in Python:
+a batch of resamples is encoded as a (num_resamples x num_recipes) weight matrix (how often
+each recipe is drawn, or whether its predictions are swapped between the two systems),
+and the counts of all resamples are obtained with one matrix product. 10k resamples of
+our test set take well below a second.
+
+Scores are computed per label and micro-averaged over all labels ("overall"); the overall
+scores are always the last row of the returned arrays.
+Used by parser_evaluation.py and tagger_evaluation.py.
+
+Tested with Python 3.11
+"""
+
+import numpy as np
+
+
+def _with_overall(recipe_counts):
+    """
+    Appends the counts summed over all labels as an extra (last) label.
+    """
+    recipe_counts = np.asarray(recipe_counts, dtype=np.float64)
+    return np.concatenate([recipe_counts, recipe_counts.sum(axis=1, keepdims=True)], axis=1)
+
+
+def scores_from_counts(counts):
+    """
+    Computes recall, precision and F1 from counts (..., 3) with TP, FP, FN in the last axis;
+    undefined scores are 0.
+
+    Returns: array (..., 3) with recall, precision, F1
+    """
+    tp, fp, fn = counts[..., 0], counts[..., 1], counts[..., 2]
+
+    def div(a, b):
+        return np.divide(a, b, out=np.zeros_like(a, dtype=np.float64), where=b != 0)
+
+    return np.stack([div(tp, tp + fn), div(tp, tp + fp), div(tp, tp + 0.5 * (fp + fn))], axis=-1)
+
+
+def _batches(n_resamples, batch_size):
+    for start in range(0, n_resamples, batch_size):
+        yield min(batch_size, n_resamples - start)
+
+
+def bootstrap_ci(recipe_counts, n_resamples=10000, confidence=0.95, seed=None, batch_size=1000):
+    """
+    Recipe-level bootstrap: draws num_recipes recipes with replacement n_resamples times and
+    computes percentile confidence intervals of recall, precision and F1.
+
+    Arguments:
+        - recipe_counts: array (num_recipes x num_labels x 3) with TP, FP, FN
+    Returns: (point, low, high), each an array ((num_labels + 1) x 3) with recall, precision, F1
+        per label and overall (last row)
+    """
+    counts = _with_overall(recipe_counts)
+    n_recipes, n_labels, _ = counts.shape
+    flat = counts.reshape(n_recipes, -1)
+    rng = np.random.default_rng(seed)
+
+    scores = []
+    for batch in _batches(n_resamples, batch_size):
+        draws = rng.integers(0, n_recipes, size=(batch, n_recipes))
+        # weights[b, r]: how often recipe r is drawn in resample b
+        weights = np.bincount(
+            (draws + n_recipes * np.arange(batch)[:, None]).ravel(), minlength=batch * n_recipes
+        ).reshape(batch, n_recipes)
+        resampled = (weights @ flat).reshape(batch, n_labels, 3)
+        scores.append(scores_from_counts(resampled))
+    scores = np.concatenate(scores)
+
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(scores, [alpha, 1 - alpha], axis=0)
+    point = scores_from_counts(counts.sum(axis=0))
+    return point, low, high
+
+
+def paired_randomization_test(recipe_counts_a, recipe_counts_b, n_trials=10000, seed=None, batch_size=1000):
+    """
+    Paired approximate randomization test on the F1 difference of two systems evaluated on the
+    same recipes: in every trial, the counts of each recipe are swapped between the systems with
+    probability 0.5.
+
+    Arguments:
+        - recipe_counts_a, recipe_counts_b: arrays (num_recipes x num_labels x 3) with TP, FP, FN
+    Returns: (f1_a, f1_b, p_values), each an array (num_labels + 1) per label and overall (last entry)
+    """
+    counts_a = _with_overall(recipe_counts_a)
+    counts_b = _with_overall(recipe_counts_b)
+    if counts_a.shape != counts_b.shape:
+        raise ValueError("Both systems must be evaluated on the same recipes and labels.")
+    n_recipes, n_labels, _ = counts_a.shape
+    total_a = counts_a.sum(axis=0)
+    total_b = counts_b.sum(axis=0)
+    f1_a = scores_from_counts(total_a)[:, 2]
+    f1_b = scores_from_counts(total_b)[:, 2]
+    observed = np.abs(f1_a - f1_b)
+    diff = (counts_b - counts_a).reshape(n_recipes, -1)
+    rng = np.random.default_rng(seed)
+
+    at_least_as_extreme = np.zeros(n_labels, dtype=np.int64)
+    for batch in _batches(n_trials, batch_size):
+        swaps = rng.integers(0, 2, size=(batch, n_recipes)).astype(np.float64)
+        shift = (swaps @ diff).reshape(batch, n_labels, 3)
+        trial_a = scores_from_counts(total_a + shift)[..., 2]
+        trial_b = scores_from_counts(total_b - shift)[..., 2]
+        # small tolerance s.t. the identity permutation counts as at least as extreme
+        at_least_as_extreme += (np.abs(trial_a - trial_b) >= observed - 1e-12).sum(axis=0)
+    p_values = (at_least_as_extreme + 1) / (n_trials + 1)
+    return f1_a, f1_b, p_values
+
+
+def print_bootstrap(labels, point, low, high, n_resamples, n_recipes, confidence):
+    """
+    Prints bootstrap confidence intervals for the given labels (plus overall, the last row of the arrays).
+    """
+    print(f"Bootstrap: {n_resamples} resamples of {n_recipes} recipes, {confidence:.0%} confidence intervals")
+    print('{0:<10} {1:<24} {2:<24} {3:<24}'.format("Label", "Recall", "Precision", "F1"))
+    for label, p, lo, hi in zip(list(labels) + ["(overall)"], point, low, high):
+        print('{0:<10} {1:<24} {2:<24} {3:<24}'.format(
+            label, *[f"{p[k]:.4f} [{lo[k]:.4f}, {hi[k]:.4f}]" for k in range(3)]))
+
+
+def print_randomization_test(labels, f1_a, f1_b, p_values, n_trials, n_recipes, name_a="A", name_b="B"):
+    """
+    Prints the result of a paired approximate randomization test (plus overall, the last row).
+    """
+    print(f"Paired approximate randomization test: {n_trials} trials over {n_recipes} recipes")
+    print(f"A: {name_a}\nB: {name_b}")
+    print('{0:<10} {1:<9} {2:<9} {3:<9} {4:<9}'.format("Label", "F1 (A)", "F1 (B)", "Diff", "p-value"))
+    for label, a, b, p in zip(list(labels) + ["(overall)"], f1_a, f1_b, p_values):
+        print('{0:<10} {1:<9.4f} {2:<9.4f} {3:<+9.4f} {4:<9.4f}'.format(label, a, b, b - a, p))
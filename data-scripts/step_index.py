@@ -0,0 +1,349 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Precomputed execution order of the steps of a recipe, for the next_step() function of the Jovo prototype.
+
+A StepIndex is built once per recipe from its action graph (see generate_reduced_graph() in recipe_graph.py):
+    - the steps (action nodes, without "end") are put into an execution order that respects all edges
+      outside of cycles: strongly connected components are ordered topologically, ties (and the steps
+      within a cycle) are broken by token ID, i.e. by their order in the recipe text
+    - every step gets the bitmask of its prerequisites, i.e. of its predecessors earlier in the execution
+      order (the edges that close a cycle are ignored), with bit i standing for the i-th step of the order
+    - the steps without prerequisites form the initial frontier; every step has the list of the steps
+      that depend on it, so the frontier after a set of completed steps is found from these steps only
+Sets of completed steps are bitmasks as well (see mask()). next_step() is the first step of the execution
+order that is not completed yet: its prerequisites come before it in the order, so it can always be done.
+It only takes a few integer operations, frontier() takes time linear in the number of completed steps
+and their dependents.
+
+Indices are serialized into a few hundred bytes (see to_bytes()), s.t. a voice session loads the index of its
+recipe instead of the graph. Run this script to build the indices of recipe graphs in CoNLL-U files.
+
+Tested with Python 3.11
+"""
+
+import argparse
+import os
+import struct
+from array import array
+from heapq import heapify, heappop, heappush
+
+from recipe_graph import action_labels, generate_reduced_graph, iter_graphs_from_conllu
+
+MAGIC = b"RSTP"
+FORMAT_VERSION = 1
+# magic, version, number of steps, number of prerequisite edges, length of the UTF-8 encoded strings
+_HEADER = struct.Struct("<4sHHII")
+
+
+def _strongly_connected_components(successors):
+    """
+    Tarjan's algorithm, without recursion.
+
+    Arguments:
+        - successors: list with the successor positions of every node
+    Returns: a list with the component number of every node; components are numbered in reverse
+        topological order (every edge goes from a higher or the same number to a lower or the same number)
+    """
+    n = len(successors)
+    component = [-1] * n
+    index = [-1] * n
+    lowlink = [0] * n
+    stack = []
+    on_stack = [False] * n
+    counter = 0
+    n_components = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, iter(successors[root]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if index[child] < 0:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = True
+                    work.append((child, iter(successors[child])))
+                    break
+                if on_stack[child]:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = n_components
+                        if member == node:
+                            break
+                    n_components += 1
+    return component
+
+
+def execution_order(node_ids, successors):
+    """
+    Orders the nodes of a possibly cyclic graph topologically (see module docstring).
+
+    Arguments:
+        - node_ids: list with the (token) ID of every node, used to break ties
+        - successors: list with the successor positions of every node
+    Returns: a list of node positions
+    """
+    component = _strongly_connected_components(successors)
+    n_components = max(component, default=-1) + 1
+    members = [[] for _ in range(n_components)]
+    for i, c in enumerate(component):
+        members[c].append(i)
+    in_degree = [0] * n_components
+    component_successors = [set() for _ in range(n_components)]
+    for i, node_successors in enumerate(successors):
+        for j in node_successors:
+            if component[i] != component[j] and component[j] not in component_successors[component[i]]:
+                component_successors[component[i]].add(component[j])
+                in_degree[component[j]] += 1
+
+    # Kahn's algorithm on the components; the component with the smallest token ID comes first
+    first_id = [min(node_ids[i] for i in nodes) for nodes in members]
+    ready = [(first_id[c], c) for c in range(n_components) if in_degree[c] == 0]
+    heapify(ready)
+    order = []
+    while ready:
+        _, c = heappop(ready)
+        order.extend(sorted(members[c], key=node_ids.__getitem__))
+        for d in component_successors[c]:
+            in_degree[d] -= 1
+            if in_degree[d] == 0:
+                heappush(ready, (first_id[d], d))
+    return order
+
+
+class StepIndex:
+    """
+    Execution order, prerequisites and dependents of the steps of one recipe (see module docstring).
+
+    Steps are identified by the token IDs of their action nodes; rank(step) is their position in the
+    execution order and the bit of the step in masks.
+    """
+
+    def __init__(self, name, steps, labels, prerequisites):
+        """
+        Arguments:
+            - name: recipe name
+            - steps: list with the token IDs of the steps in execution order
+            - labels: list with the text of every step
+            - prerequisites: list with the (ascending) ranks of the prerequisites of every step
+        """
+        self.name = name
+        self.steps = steps
+        self.labels = labels
+        self.prerequisites = prerequisites
+        self.ranks = {step: i for i, step in enumerate(steps)}
+        self.prerequisite_masks = [sum(1 << p for p in step_prerequisites) for step_prerequisites in prerequisites]
+        self.dependents = [[] for _ in steps]
+        for i, step_prerequisites in enumerate(prerequisites):
+            for p in step_prerequisites:
+                self.dependents[p].append(i)
+        self.initial_frontier = [i for i, mask in enumerate(self.prerequisite_masks) if mask == 0]
+        self.all_steps = (1 << len(steps)) - 1
+
+    @classmethod
+    def from_graph(cls, G, name=None, reduce=True):
+        """
+        Builds the index of a recipe graph.
+
+        Arguments:
+            - G: a RecipeGraph or CompactRecipeGraph
+            - name: recipe name; default: the origin of the nodes without "G_"
+            - reduce: reduce G to its action graph first; set to False if G already is an action graph
+        """
+        if reduce:
+            G = generate_reduced_graph(G, action_labels)
+        nodes = [node for node in G.nodes if node != "end"]
+        positions = {node: i for i, node in enumerate(nodes)}
+        successors = [[positions[s] for s in G.successors(node) if s != "end"] for node in nodes]
+        order = execution_order(nodes, successors)
+        rank = [0] * len(nodes)
+        for r, i in enumerate(order):
+            rank[i] = r
+        prerequisites = [[] for _ in nodes]
+        for i, node_successors in enumerate(successors):
+            for j in node_successors:
+                # edges to earlier steps close a cycle
+                if rank[i] < rank[j]:
+                    prerequisites[rank[j]].append(rank[i])
+        labels = [G.nodes[nodes[i]]["label"].partition("_")[2] for i in order]
+        if name is None:
+            origin = G.nodes[nodes[0]].get("origin", "") if nodes else ""
+            name = origin[2:] if origin.startswith("G_") else origin
+        return cls(name, [nodes[i] for i in order], labels, [sorted(set(p)) for p in prerequisites])
+
+    def __len__(self):
+        return len(self.steps)
+
+    def rank(self, step):
+        """
+        Returns: the position of step in the execution order; raises KeyError for unknown steps
+        """
+        return self.ranks[step]
+
+    def label(self, step):
+        return self.labels[self.ranks[step]]
+
+    def mask(self, steps):
+        """
+        Returns: the bitmask of an iterable of steps
+        """
+        ranks = self.ranks
+        mask = 0
+        for step in steps:
+            mask |= 1 << ranks[step]
+        return mask
+
+    def _as_mask(self, completed_steps):
+        return completed_steps if isinstance(completed_steps, int) else self.mask(completed_steps)
+
+    def next_step(self, completed_steps=()):
+        """
+        Arguments:
+            - completed_steps: iterable of the completed steps, or their bitmask (see mask())
+        Returns: the first step of the execution order that is not completed, or None if all steps are done
+        """
+        mask = self._as_mask(completed_steps)
+        # lowest unset bit
+        rank = (~mask & (mask + 1)).bit_length() - 1
+        return self.steps[rank] if rank < len(self.steps) else None
+
+    def is_ready(self, step, completed_steps=()):
+        """
+        Returns: True if step is not completed and all its prerequisites are
+        """
+        mask = self._as_mask(completed_steps)
+        rank = self.ranks[step]
+        return not mask >> rank & 1 and self.prerequisite_masks[rank] & ~mask == 0
+
+    def frontier(self, completed_steps=()):
+        """
+        Arguments:
+            - completed_steps: iterable of the completed steps, or their bitmask (see mask())
+        Returns: a list with all steps that are not completed but whose prerequisites are, in execution order
+        """
+        mask = self._as_mask(completed_steps)
+        candidates = set(self.initial_frontier)
+        remaining = mask
+        while remaining:
+            low = remaining & -remaining
+            candidates.update(self.dependents[low.bit_length() - 1])
+            remaining ^= low
+        prerequisite_masks = self.prerequisite_masks
+        return [
+            self.steps[r] for r in sorted(candidates)
+            if not mask >> r & 1 and prerequisite_masks[r] & ~mask == 0
+        ]
+
+    def to_bytes(self):
+        """
+        Returns: the index in its binary format: header, token IDs (uint32), prerequisites in CSR style
+            (uint16 offsets and ranks) and the UTF-8 encoded name and labels (separated by newlines)
+        """
+        if len(self.steps) > 0xFFFF:
+            raise ValueError(f"Recipe {self.name} has too many steps for the step index format.")
+        indptr = array("H", [0])
+        indices = array("H")
+        for step_prerequisites in self.prerequisites:
+            indices.extend(step_prerequisites)
+            if len(indices) > 0xFFFF:
+                raise ValueError(f"Recipe {self.name} has too many prerequisites for the step index format.")
+            indptr.append(len(indices))
+        strings = "\n".join([self.name] + self.labels).encode("utf-8")
+        data = [array("I", self.steps), indptr, indices]
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(self.steps), len(indices), len(strings))
+        return header + b"".join(_little_endian(a).tobytes() for a in data) + strings
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Reads an index from its binary format (see to_bytes()).
+        """
+        magic, version, n_steps, n_prerequisites, n_bytes = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise IOError("Not a step index.")
+        if version != FORMAT_VERSION:
+            raise IOError(f"Unsupported step index version {version}.")
+        offset = _HEADER.size
+        arrays = []
+        for typecode, length in (("I", n_steps), ("H", n_steps + 1), ("H", n_prerequisites)):
+            a = array(typecode)
+            a.frombytes(data[offset : offset + length * a.itemsize])
+            arrays.append(_little_endian(a))
+            offset += length * a.itemsize
+        steps, indptr, indices = arrays
+        name, *labels = bytes(data[offset : offset + n_bytes]).decode("utf-8").split("\n")
+        prerequisites = [indices[a:b].tolist() for a, b in zip(indptr[:-1], indptr[1:])]
+        return cls(name, steps.tolist(), labels, prerequisites)
+
+    def save(self, path):
+        with open(path, "wb") as o:
+            o.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _little_endian(a):
+    # arrays are stored little-endian; byteswap() works in place and is its own inverse
+    if struct.pack("=H", 1) != struct.pack("<H", 1):
+        a.byteswap()
+    return a
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Builds the step indices (execution order for next_step()) of CoNLL-U recipe graphs.""")
+    arg_parser.add_argument("inputs", metavar="INPUT", nargs="+",
+                            help="""CoNLL-U files with one or more recipe graphs (full graphs or action graphs).""")
+    arg_parser.add_argument("-o", "--output", dest="out_dir", metavar="OUTPUT_DIR",
+                            help="""Output directory; gets one file <recipe name>.steps per recipe.""")
+    arg_parser.add_argument("--show", dest="show", action="store_true",
+                            help="""Print the execution order and the prerequisites of every recipe.""")
+    args = arg_parser.parse_args()
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    n_recipes = 0
+    for conllu_file in args.inputs:
+        for G in iter_graphs_from_conllu(conllu_file, compact=True):
+            index = StepIndex.from_graph(G)
+            n_recipes += 1
+            if args.out_dir:
+                index.save(os.path.join(args.out_dir, index.name + ".steps"))
+            if args.show:
+                print(f"# {index.name}")
+                for step, label, step_prerequisites in zip(index.steps, index.labels, index.prerequisites):
+                    print(f"{step}\t{label}\t{', '.join(str(index.steps[p]) for p in step_prerequisites)}")
+                print()
+    if args.out_dir:
+        print(f"{n_recipes} step indices written to {args.out_dir}")
@@ -0,0 +1,301 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Performs span-based evaluation on tagger output
+
+Takes AllenNLP predictions for sequence tags (.json, original or lean format) and the corresponding
+gold files (.conll03 or .conllu). Extracts the tagged spans of gold and prediction and evaluates
+them by label, like AllenNLP's span-based F1 measure, without loading the model (and without
+importing torch or AllenNLP).
+
+Tags are decoded with one set of rules for both the BIO scheme (BERT configs) and the
+BIOUL scheme (ELMo config):
+    - a span starts at a B- or U- tag, or at an I-/L- tag that does not continue a span
+      of the same label (i.e. after O, L-, U-, a different label or a recipe boundary)
+    - a span ends at an L- or U- tag, or before the next token that does not continue it
+For well-formed tag sequences this gives the same spans as AllenNLP's bio_tags_to_spans and
+bioul_tags_to_spans; ill-formed sequences are repaired leniently instead of raising an error.
+All spans of a file are extracted at once with array operations.
+
+Tested with Python 3.11
+"""
+
+import argparse
+import csv
+import logging
+
+import numpy as np
+
+from eval_counts import HEADER, EvalCounts, merge_counts
+from gold_cache import infer_format, load_gold_table
+from json_to_conll import iter_prediction_records
+from significance import bootstrap_ci, paired_randomization_test, print_bootstrap, print_randomization_test
+
+# column of the tagger's tag in the gold file
+TAG_COLUMN = {"conll03": 3, "conllu": 4}
+
+
+def read_gold_tags(gold_file, fmt=None, use_cache=True):
+    """
+    Reads in the gold tags of a CoNLL-2003 or CoNLL-U file (format inferred from the file extension
+    if not given) through the gold cache (see gold_cache.py).
+
+    Returns: a String list with the gold tags and an int64 array with the token offsets of the recipes
+    """
+    fmt = fmt or infer_format(gold_file)
+    table = load_gold_table(gold_file, fmt, use_cache=use_cache)
+    return table.column(TAG_COLUMN[fmt]), table.recipe_offsets
+
+
+def read_prediction_tags(pred_file):
+    """
+    Reads in the predicted tags from the tagger's output file (original or lean format).
+
+    Returns: a String list with the predicted tags and an int64 array with the token offsets of the recipes
+    """
+    tags = []
+    recipe_offsets = [0]
+    for record in iter_prediction_records(pred_file):
+        tags.extend(record["tags"])
+        recipe_offsets.append(len(tags))
+    return tags, np.asarray(recipe_offsets, dtype=np.int64)
+
+
+def extract_spans(tags, recipe_offsets, label_index):
+    """
+    Extracts the tagged spans of a BIO or BIOUL tag sequence (see module docstring);
+    spans never cross recipe boundaries. label_index (dict from label to code) is extended by unseen labels.
+
+    Returns: three int64 arrays with the first token, last token and label code of every span
+    """
+    n_tokens = len(tags)
+    if n_tokens == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    uniq, inverse = np.unique(np.asarray(tags, dtype=str), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # per distinct tag: prefix and label code (-1 for O)
+    prefixes = np.array([tag[:1] if tag != "O" else "O" for tag in uniq.tolist()])
+    codes = np.array(
+        [label_index.setdefault(tag[2:], len(label_index)) if tag != "O" else -1 for tag in uniq.tolist()],
+        dtype=np.int64,
+    )
+    prefix = prefixes[inverse]
+    label = codes[inverse]
+
+    inside = label >= 0
+    recipe_start = np.zeros(n_tokens, dtype=bool)
+    recipe_start[recipe_offsets[:-1][recipe_offsets[:-1] < n_tokens]] = True
+    # does token i continue the span of token i-1?
+    continues = np.zeros(n_tokens, dtype=bool)
+    continues[1:] = (
+        inside[1:]
+        & ((prefix[1:] == "I") | (prefix[1:] == "L"))
+        & (label[1:] == label[:-1])
+        & (prefix[:-1] != "L")
+        & (prefix[:-1] != "U")
+    )
+    continues &= ~recipe_start
+    starts = inside & ~continues
+    ends = inside.copy()
+    ends[:-1] &= ~continues[1:]
+    first = np.flatnonzero(starts)
+    return first, np.flatnonzero(ends), label[first]
+
+
+def count_spans(gold_spans, pred_spans, n_labels, recipe_offsets=None):
+    """
+    Compares predicted with gold spans (see extract_spans); a predicted span is a true positive if a
+    gold span has exactly the same boundaries and label.
+
+    Returns: tp, fp, fn (int64 arrays indexed by label code), or, if recipe_offsets is given,
+        an int64 array (num_recipes x n_labels x 3) with TP, FP, FN per recipe and label code
+    """
+    n_tokens = max(
+        [int(spans[1].max()) + 1 for spans in (gold_spans, pred_spans) if len(spans[1])], default=1
+    )
+
+    def keys(spans):
+        first, last, label = spans
+        return (first * n_tokens + last) * n_labels + label
+
+    gold_keys = keys(gold_spans)
+    pred_keys = keys(pred_spans)
+    matched = np.intersect1d(gold_keys, pred_keys)
+
+    def label_of(k):
+        return k % n_labels
+
+    def first_of(k):
+        return k // n_labels // n_tokens
+
+    outcomes = (matched, np.setdiff1d(pred_keys, matched), np.setdiff1d(gold_keys, matched))
+    if recipe_offsets is None:
+        return tuple(np.bincount(label_of(k), minlength=n_labels) for k in outcomes)
+    n_recipes = len(recipe_offsets) - 1
+    counts = np.zeros((n_recipes, n_labels, 3), dtype=np.int64)
+    for j, k in enumerate(outcomes):
+        recipe = np.searchsorted(recipe_offsets, first_of(k), side="right") - 1
+        counts[..., j] = np.bincount(recipe * n_labels + label_of(k), minlength=n_recipes * n_labels).reshape(
+            n_recipes, n_labels
+        )
+    return counts
+
+
+def evaluate_file(pred_file, gold_file, fmt=None, use_cache=True, per_recipe=False):
+    """
+    Span-based evaluation of one prediction file against its gold file.
+
+    Returns: EvalCounts (and, if per_recipe, the per-recipe counts and the label index, see count_spans)
+    """
+    gold_tags, recipe_offsets = read_gold_tags(gold_file, fmt, use_cache)
+    pred_tags, _ = read_prediction_tags(pred_file)
+    if len(gold_tags) != len(pred_tags):
+        raise IOError(f"Your gold data ({gold_file}) and predicted data ({pred_file}) don't match in length.")
+    label_index = dict()
+    gold_spans = extract_spans(gold_tags, recipe_offsets, label_index)
+    pred_spans = extract_spans(pred_tags, recipe_offsets, label_index)
+    n_labels = len(label_index)
+    tp, fp, fn = count_spans(gold_spans, pred_spans, n_labels)
+    counts = EvalCounts.from_arrays(tp, fp, fn, label_index, n_tokens=len(gold_tags))
+    if not per_recipe:
+        return counts
+    return counts, count_spans(gold_spans, pred_spans, n_labels, recipe_offsets), label_index
+
+
+def _print_rows(rows):
+    print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9} {5:<9} {6:<9}'.format(*HEADER))
+    for output in rows:
+        print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9.4} {5:<9.4} {6:<9.4}'.format(*output))
+
+
+def execute_eval(args):
+    if len(args.pred_files) != len(args.gold_files):
+        raise RuntimeError("Please specify exactly one gold file per prediction file.")
+    if args.compare_files and len(args.compare_files) != len(args.pred_files):
+        raise RuntimeError("Please specify exactly one prediction file to compare with per prediction file.")
+    logging.info(
+        "Evaluating " + ", ".join(args.pred_files) + "\nwith respect to " + ", ".join(args.gold_files))
+
+    per_recipe = []
+    file_counts = []
+    for pred_file, gold_file in zip(args.pred_files, args.gold_files):
+        if args.bootstrap or args.compare_files:
+            counts, recipe_counts, label_index = evaluate_file(pred_file, gold_file, args.format, args.use_cache, True)
+            per_recipe.append((recipe_counts, label_index))
+        else:
+            counts = evaluate_file(pred_file, gold_file, args.format, args.use_cache)
+        file_counts.append(counts)
+    counts = merge_counts(file_counts)
+
+    rows = counts.rows()
+    _print_rows(rows)
+    recall, precision, f1 = counts.overall()
+    tp, fp, fn = counts.totals()
+    print('{0:<10} {1:>5} {2:>5} {3:>5} {4:<9.4} {5:<9.4} {6:<9.4}'.format("(overall)", tp, fp, fn, recall, precision, f1))
+
+    if args.bootstrap:
+        # align the label codes of all files with the sorted reported labels
+        labels = [row[0] for row in rows]
+        all_labels = sorted({label for _, label_index in per_recipe for label in label_index})
+        recipe_counts = np.concatenate([_align(c, label_index, all_labels) for c, label_index in per_recipe])
+        select = [all_labels.index(label) for label in labels] + [-1]
+        point, low, high = bootstrap_ci(recipe_counts, args.resamples, args.confidence, args.seed)
+        print()
+        print_bootstrap(
+            labels, point[select], low[select], high[select], args.resamples, len(recipe_counts), args.confidence
+        )
+
+    if args.compare_files:
+        per_recipe_b = []
+        file_counts_b = []
+        for pred_file, gold_file in zip(args.compare_files, args.gold_files):
+            counts_b, recipe_counts, label_index = evaluate_file(pred_file, gold_file, args.format, args.use_cache, True)
+            per_recipe_b.append((recipe_counts, label_index))
+            file_counts_b.append(counts_b)
+        # report the labels of both systems, with the same label codes for both
+        labels = sorted({row[0] for row in rows} | {row[0] for row in merge_counts(file_counts_b).rows()})
+        all_labels = sorted({label for _, label_index in per_recipe + per_recipe_b for label in label_index})
+        recipe_counts_a, recipe_counts_b = (
+            np.concatenate([_align(c, label_index, all_labels) for c, label_index in recipes])
+            for recipes in (per_recipe, per_recipe_b)
+        )
+        select = [all_labels.index(label) for label in labels] + [-1]
+        f1_a, f1_b, p_values = paired_randomization_test(recipe_counts_a, recipe_counts_b, args.resamples, args.seed)
+        print()
+        print_randomization_test(
+            labels, f1_a[select], f1_b[select], p_values[select], args.resamples, len(recipe_counts_a),
+            ", ".join(args.pred_files), ", ".join(args.compare_files)
+        )
+
+    if args.output_file:
+        with open(args.output_file, "w", encoding="utf-8") as o:
+            tsv_writer = csv.writer(o, delimiter='\t')
+            tsv_writer.writerow(HEADER)
+            for output in rows:
+                tsv_writer.writerow(output)
+            tsv_writer.writerow(("(overall)", tp, fp, fn, recall, precision, f1))
+    if args.counts_file:
+        counts.dump(args.counts_file)
+
+
+def _align(recipe_counts, label_index, labels):
+    """
+    Returns: per-recipe counts with one column per label in labels (zeros for labels unseen in label_index)
+    """
+    aligned = np.zeros((recipe_counts.shape[0], len(labels), 3), dtype=recipe_counts.dtype)
+    for j, label in enumerate(labels):
+        if label in label_index:
+            aligned[:, j] = recipe_counts[:, label_index[label]]
+    return aligned
+
+
+if __name__ == "__main__":
+
+    # parser for command line arguments
+    arg_parser = argparse.ArgumentParser(
+        description="""Takes AllenNLP tagger predictions and complementary annotated (gold) files. \n
+        Prints out span-based evaluation results per label (BIO or BIOUL tags).""")
+    arg_parser.add_argument("-p", "--prediction", dest="pred_files", metavar="PRED_FILE", nargs="+", required=True,
+                            help="""Prediction file(s) in json format. Output of AllenNLP tagger (original or lean format).""")
+    arg_parser.add_argument("-g", "--gold", dest="gold_files", metavar="GOLD_FILE", nargs="+", required=True,
+                            help="""Annotated (gold) file(s) in CoNLL2003 or CoNLL-U format, one per prediction file.
+                            The counts of all pairs are merged into one evaluation.""")
+    arg_parser.add_argument("-f", "--format", dest="format", choices=["conll03", "conllu"], required=False,
+                            help="""Optional: gold file format. Inferred from the file extension if not specified.""")
+    arg_parser.add_argument("-o", "--output", dest="output_file", metavar="OUTPUT_FILE", required=False,
+                            help="""Optional: specify output path to write eval results as TSV. Print on console only when not specified.""")
+    arg_parser.add_argument("--counts", dest="counts_file", metavar="COUNTS_FILE", required=False,
+                            help="""Optional: write the per-label TP/FP/FN counts as JSON (see eval_counts.py).""")
+    arg_parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                            help="""Parse the gold files from scratch instead of using the gold cache (see gold_cache.py).""")
+    arg_parser.add_argument("--bootstrap", dest="bootstrap", action="store_true",
+                            help="""Optional: report recipe-level bootstrap confidence intervals of recall, precision and F1.""")
+    arg_parser.add_argument("--compare", dest="compare_files", metavar="PRED_FILE_B", nargs="+", required=False,
+                            help="""Optional: prediction file(s) of a second tagger, one per prediction file; runs a paired
+                            approximate randomization test (over recipes) on the F1 difference.""")
+    arg_parser.add_argument("--resamples", dest="resamples", type=int, default=10000,
+                            help="""Number of bootstrap resamples / randomization trials. Default: 10000""")
+    arg_parser.add_argument("--confidence", dest="confidence", type=float, default=0.95,
+                            help="""Confidence level of the bootstrap intervals. Default: 0.95""")
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=None,
+                            help="""Optional: random seed for resampling.""")
+
+    args = arg_parser.parse_args()
+
+    #########################
+    #### Start execution ####
+    #########################
+
+    execute_eval(args)